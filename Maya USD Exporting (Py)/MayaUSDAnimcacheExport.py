@@ -1,4 +1,4 @@
-def export_usd_animcache(export_node, filepath, start_frame, end_frame, frame_stride, rig='', lookfile_uri='', publish_path='', skelRoot = '', skelOnly=False, frameHold=0):
+def export_usd_animcache(export_node, filepath, start_frame, end_frame, frame_stride, rig='', lookfile_uri='', publish_path='', skelRoot = '', skelOnly=False, frameHold=0, frameHoldBatchSize=0, frameHoldClips=False, exportChunks=0, exportWorkers=2, exportPreRoll=0, compactSamples=False, adaptiveSubframes=False, subframeTolerance=0.01, skelReduce=False, skelTolerance=0.001, skelRotationTolerance=0.01, pointReduce=False, pointTolerance=0.01, normalTolerance=1.0, rigidMeshes=False, rigidTolerance=0.001, payloadSplit=False, restFrame=None, exportCache='', exportCacheSize=50, memoryProfile=''):
     """
     Exports animation to USD, either as a deformed geo cache with surfacing URIs, or as a skeleton with rig URI.
 
@@ -13,10 +13,34 @@ def export_usd_animcache(export_node, filepath, start_frame, end_frame, frame_st
     :param skelRoot:        The root of the skeleton to export. If this is set, the skeleton will be included in the export.
     :param skelOnly:        If True, only the skeleton will be exported. If False, the deformed mesh will be exported.
     :param frameHold:       Number of frames to hold each frame for. 0 means no frame hold. A variant will be created for each frame hold combination.
+    :param frameHoldBatchSize:  Number of animated attributes to build frame holds for at a time. 0 does every attribute at once. Set this on large caches to bound memory use.
+    :param frameHoldClips:  If True, frame hold variants share one set of samples through value clips, instead of each variant holding a copy of every sample.
+    :param exportChunks:    If greater than 1, the frame range is split into this many chunks which are exported in parallel mayapy processes and stitched back into one layer.
+    :param exportWorkers:   The number of exportChunks mayapy processes to run at once. Each one holds the whole scene, so raise it only as far as the machine's memory allows.
+    :param exportPreRoll:   The number of frames each exportChunks process evaluates before its chunk, so simulations and dynamics match a serial export. Set it to cover the frame range for assets driven by them.
+    :param compactSamples:  If True, attributes that don't change are collapsed to a default value, and repeated samples are dropped before publishing.
+    :param adaptiveSubframes:   If True, sub-frame samples are only kept on prims that move more than subframeTolerance between whole frames. Use with a frame_stride below 1 for motion blur.
+    :param subframeTolerance:   How far a prim's points or transform can move in a frame, in scene units, and still have its sub-frame samples dropped.
+    :param skelReduce:      If True, joints that hold their rest pose are removed from the exported skel animation, and its curves are reduced to the fewest samples within tolerance.
+    :param skelTolerance:   The largest error skelReduce can introduce in joint translations and scales, in scene units.
+    :param skelRotationTolerance:   The largest error skelReduce can introduce in joint rotations, in degrees.
+    :param pointReduce:     If True, points and normals samples that linearly interpolate back within pointTolerance and normalTolerance are dropped. Use for background assets, and leave off for hero assets.
+    :param pointTolerance:  The largest error pointReduce can introduce in any point, in scene units.
+    :param normalTolerance: The largest error pointReduce and rigidMeshes can introduce in any normal, in degrees.
+    :param rigidMeshes:     If True, meshes whose points only move rigidly, within rigidTolerance, are published as static meshes with an animated xform op.
+    :param rigidTolerance:  The furthest rigidMeshes can move any point from its exported position, in scene units.
+    :param payloadSplit:    If True, time sampled and array data is moved to a payload layer, payloaded by the published layer's default prim, so the cache can be opened unloaded. The payload layer is written next to the exported layer, named by usd_payload_split.get_payload_filepath, and has to be published next to publish_path.
+    :param restFrame:       The frame Pref/Nref are taken from. Defaults to start_frame.
+    :param exportCache:     Directory of an export cache. If this is set and the asset was already exported with the same rig, animation and arguments, the cached layer is copied to filepath instead of exporting again.
+    :param exportCacheSize: The size in GB the export cache is kept under, by evicting the least recently used layers.
+    :param memoryProfile:   Path to write a json memory profile to. If this is set, the peak memory of each export and publish phase, and the attributes holding the most sample data, are recorded. It's written even if the export fails, and a layer fetched from exportCache only has an export_cache phase. It slows the export down.
     :return:
     """
     
     print("Node to export: " + export_node)
+
+    # Written in finally, so a failed publish or a cache hit still has a profile, and tracing is always stopped
+    profile = usd_memory_profile.MemoryProfile(enabled=bool(memoryProfile))
     try:
         properties = [("rig", rig), ("lookfileUri", lookfile_uri)]
         create_usd_user_properties(export_node, properties)
@@ -39,6 +63,32 @@ def export_usd_animcache(export_node, filepath, start_frame, end_frame, frame_st
         else:
             reparent_node = export_node
 
+        options, usd_export_type = _get_usd_animcache_export_options(start_frame, end_frame, frame_stride, skelRoot, skelOnly)
+
+        if exportCache:
+            profile.mark("export_cache")
+            # Keyed on everything that changes the published layer. frameHoldBatchSize, exportChunks and exportWorkers only change how it's built
+            cache_params = {"export_node": export_node_short, "rig": rig, "lookfile_uri": lookfile_uri, "publish_path": publish_path, "skelRoot": skelRoot, "skelOnly": skelOnly,
+                            "start_frame": start_frame, "end_frame": end_frame, "frame_stride": frame_stride, "frameHold": frameHold, "frameHoldClips": frameHoldClips,
+                            "compactSamples": compactSamples, "adaptiveSubframes": adaptiveSubframes, "subframeTolerance": subframeTolerance, "skelReduce": skelReduce,
+                            "skelTolerance": skelTolerance, "skelRotationTolerance": skelRotationTolerance, "pointReduce": pointReduce,
+                            "pointTolerance": pointTolerance, "normalTolerance": normalTolerance, "rigidMeshes": rigidMeshes, "rigidTolerance": rigidTolerance, "payloadSplit": payloadSplit,
+                            "restFrame": restFrame}
+            cache_key = usd_export_cache.get_cache_key(reparent_node, options, cache_params)
+            # The payload layer is cached alongside the exported layer, under its own key. It's only split off when
+            # the layer is published, so it's fetched and stored under the same condition.
+            cachePayload = payloadSplit and publish_path != ''
+            if cachePayload:
+                payload_filepath = usd_payload_split.get_payload_filepath(filepath, publish_path)
+                cached = usd_export_cache.fetch_cached_layer(exportCache, cache_key + usd_payload_split.PAYLOAD_SUFFIX, payload_filepath) and \
+                         usd_export_cache.fetch_cached_layer(exportCache, cache_key, filepath)
+            else:
+                cached = usd_export_cache.fetch_cached_layer(exportCache, cache_key, filepath)
+            if cached:
+                return
+
+        profile.mark("maya_export")
+
         with utils.maya_keep_parent(reparent_node) as rp_node:
             cmds.parent(rp_node, world=True)
             reparented_export_node = [n for n in cmds.ls(export_node_id, long=True) if export_node_short in n][0]
@@ -54,235 +104,322 @@ def export_usd_animcache(export_node, filepath, start_frame, end_frame, frame_st
                 else:
                     cmds.select(reparented_skelRoot, add=True)
 
-            options = ['shadingMode=none',
-                    'exportRefsAsInstanceable=0',
-                    'exportUVs=1',
-                    'exportMaterialCollections=0',
-                    'materialCollectionsPath=/Collections',
-                    'exportColorSets=1',
-                    'renderableOnly=0',
-                    'mergeTransformAndShape=1',
-                    'exportInstances=1',
-                    'defaultMeshScheme=catmullClark',
-                    'exportVisibility=1',
-                    'animation=1',
-                    'stripNamespaces=1',
-                    'startTime=%d' % start_frame,
-                    'endTime=%d' % end_frame,
-                    'frameStride=%s' % frame_stride]
-            
-            if skelRoot and not skelOnly:
-                options += ['exportSkels=explicit','exportSkin=explicit']
-            elif skelRoot and skelOnly:
-                options += ['exportSkels=auto','exportSkin=auto']
-            if (int(cmds.about(version=True)) < 2022):
-                f = cmds.file(filepath, force=True, options=';'.join(options), type="pxrUsdExport", pr=True, es=True)
+            if exportChunks > 1:
+                f = usd_chunked_export.export_usd_chunked(filepath, options, usd_export_type, start_frame, end_frame, frame_stride, exportChunks, workers=exportWorkers, pre_roll=exportPreRoll)
             else:
-                f = cmds.file(filepath, force=True, options=';'.join(options), type="USD Export", pr=True, es=True)
+                f = cmds.file(filepath, force=True, options=';'.join(options), type=usd_export_type, pr=True, es=True)
 
             if(f and publish_path != ''):
-                if(cmds.referenceQuery(reparented_export_node, inr=True)):
-                    export_node_pm = pm.PyNode(reparented_export_node)
-                    rigref = pm.referenceQuery(export_node_pm, filename=True)
-                    
-                    modelrefs = pm.listReferences(parentReference=rigref, recursive=True)
-
-                    stage = Usd.Stage.Open(f)
-
-                    if ":" in stage.GetRootLayer().defaultPrim:
-                        stage.GetRootLayer().defaultPrim = stage.GetRootLayer().defaultPrim.split(":")[-1]
-
-                    #If there's a skeleton root, the CONTROLS were probably exported too. Delete them
-                    if skelRoot:
-                        controls_prim = None
-                        for x in stage.GetDefaultPrim().GetChildren():
-                            if "CONTROLS" in x.GetName() and x.GetParent() == stage.GetDefaultPrim():
-                                controls_prim = x
-                                break
-
-                        if controls_prim:
-                            stage.RemovePrim(controls_prim.GetPath())
-                    
-
-                    if not skelOnly:
-                        mesh_xforms = list(set([pm.listRelatives(x, parent=True)[0] for x in pm.listRelatives(reparented_export_node, ad=True, type="mesh")]))
-
-                        # Set Pref on meshes
-                        for mesh in mesh_xforms:
-                            try:
-                                dag_path = mesh.longName()
-                                add_renderman_ref_primvars(dag_path, mesh, stage)
-                                
-                            except:
-                                child_mesh_success = False
-                                for child_mesh in pm.listRelatives(mesh, children=True):
-                                    try:
-                                        if "Orig" not in child_mesh.name() and "Deformed" not in child_mesh.name():
-                                            dag_path = mesh.longName()
-
-                                            add_renderman_ref_primvars(dag_path, child_mesh, stage)
-                                            break
-                                    except:
-                                        pass
-                                
-                                if not child_mesh_success:
-                                    print("ERROR Setting Pref/Nref on",mesh.longName())
-                            
-
-                        modelref_updates = {}
-                        for modelref in modelrefs:
-                            #Add surfacing USD references to internal model references
-                            fields = resolver.filepath_to_fields(modelref.path)
-                            asset_type = fields['asset_type']
-                            asset_name = fields['Asset']
-
-                            if asset_type == 'camera':
-                                continue
-
-                            try:
-                                template_steps = [(x, usd_utils.SG_TEMPLATE_MAP["Asset"][asset_type][x]) for x in usd_utils.SG_TEMPLATE_MAP["Asset"][asset_type] if x != "model" and x !="default"]
-                                templates = []
-                                for template in template_steps:
-                                    for task in template[1]:
-                                        templates += ['tank:/{0}/{1}?Step={2}&Task={3}&asset_type={4}&version=latest&Asset={5}'.format(shotgun_utils.get_project_code(), template[1][task]["template"], template[0], task, asset_type, asset_name)]
-                            except Exception as e:
-                                print("Could not find reference templates in usdUtils for " + asset_name)
-                                continue
-
-                            if len(templates) > 0:
-                                #Get dag path of this modelref's root transform
-                                modelref_dag_path = ""
-                                if pm.referenceQuery(modelref, n=True, dp=True) == None:
-                                    continue
-                                for n in pm.referenceQuery(modelref, n=True, dp=True):
-                                    node_parents = cmds.listRelatives(n, parent=True, f=True)
-
-                                    #If node has exactly one parent
-                                    if node_parents != None and len(node_parents) == 1:
-                                        node_parent = node_parents[0]
-
-                                        #If this node's parent is not a reference OR the parent is a reference but the filepath is not the same as this nodes filepath, then this node is the top transform of the reference
-                                        if (not cmds.referenceQuery(node_parent, inr=True)) or (cmds.referenceQuery(node_parent, inr=True) and cmds.referenceQuery(node_parent, filename=True, wcn=True) != modelref.path):
-                                            modelref_dag_path = cmds.ls(n,l=True)[0]
-                                            break
-                                if(reparented_export_node+"|" not in modelref_dag_path):
-                                    continue
-                                #Convert dag path with namespaces to SDF path
-                                modelref_sdf_path = ""
-                                for n in modelref_dag_path.split("|"):
-                                    if ":" in n:
-                                        modelref_sdf_path += n.split(":")[-1]
-                                    else:
-                                        modelref_sdf_path += n
-                                    modelref_sdf_path += "/"
-                                modelref_sdf_path = modelref_sdf_path[:-1]
-                                print(modelref_dag_path)
-                                print(modelref_sdf_path)
-
-                                original_modelref_sdf_path = modelref_sdf_path
-                                for oldPath in modelref_updates.keys():
-                                    modelref_sdf_path = modelref_sdf_path.replace(oldPath, modelref_updates[oldPath])
-                                modelref_updates[original_modelref_sdf_path] = modelref_sdf_path+"/geo"
-
-                                prim = stage.GetPrimAtPath(modelref_sdf_path)
-                                geoPath = modelref_sdf_path+"/geo"
-
-                                #If a child named geo already exists, temporarily rename it so we don't overwrite it
-                                if stage.GetPrimAtPath(geoPath):
-                                    layer = stage.GetRootLayer()
-                                    with Sdf.ChangeBlock():
-                                        edits = Sdf.BatchNamespaceEdit()
-                                        
-                                        tempGeoPath = stage.GetPrimAtPath(geoPath).GetPath().ReplaceName("geoPUBLISHTEMP")
-                                        edits.Add(Sdf.Path(geoPath), tempGeoPath)
-
-                                        if not layer.Apply(edits):
-                                            raise Exception("Could not apply layer edit")
-
-                                #Move each child of the model under a geo prim. (So it matches our asset descriptions)
-                                geoPrim = stage.DefinePrim(geoPath, "Xform")
-                                layer = stage.GetRootLayer()
-
-                                #Batch edits together
-                                with Sdf.ChangeBlock():
-                                    edits = Sdf.BatchNamespaceEdit()
-                                    for child in prim.GetChildren():
-                                        #Skip the child we just made named geo
-                                        if child.GetName() != "geo":
-                                            #If the prim is named geoPUBLISHTEMP, it used to be named geo. Rename it back to geo.
-                                            if child.GetName() == "geoPUBLISHTEMP":
-                                                newChildPath = geoPath+"/geo"
-                                            else:
-                                                newChildPath = geoPath+"/"+child.GetName()
-                                            edits.Add(child.GetPath(),Sdf.Path(newChildPath))
-                                    if not layer.Apply(edits):
-                                        raise Exception("Could not apply layer edit")
-                                
-                                #Add templates from asset description to this prim. Add surfacing to geo child. (Matches asset description)
-                                for template in templates:
-                                    # if "Task=surfacing" in template:
-                                    #     geoPrim.GetReferences().AddReference(template)
-                                    # else:
-                                    prim.GetReferences().AddReference(template)
-                    
-                    if frameHold > 1:
-                        variantSets = stage.GetDefaultPrim().GetVariantSets()
-
-                        frameHoldVS = variantSets.AddVariantSet("frameHold")
-
-                        sourceFrameAttr = stage.GetDefaultPrim().CreateAttribute("sourceFrame", Sdf.ValueTypeNames.Int)
-
-                        attrTimeSampleDict = {}
-                        for prim in stage.Traverse():
-                            for attr in prim.GetAttributes():
-                                if attr.GetNumTimeSamples() > 0:
-                                    timeSamples = attr.GetTimeSamples()
-                                    attrTimeSampleDict[attr] = (timeSamples, [attr.Get(x) for x in timeSamples])
-                                    attr.Clear()
-
-                        for frameHoldVariant in range(0, frameHold):
-                            frameHoldVS.AddVariant("heldFrom" + str(start_frame + frameHoldVariant))
-                            frameHoldVS.SetVariantSelection("heldFrom" + str(start_frame + frameHoldVariant))
-
-                            with frameHoldVS.GetVariantEditContext():
-                                for attr, attrInfo in attrTimeSampleDict.items():
-                                    timeSamples = attrInfo[0]
-                                    timeSampleValues = attrInfo[1]
-
-                                    value = timeSampleValues[0]
-                                    lastSourceFrame = timeSamples[0]
-                                    try:
-                                        for i, timeSample in enumerate(timeSamples):
-                                            if i % frameHold == frameHoldVariant:
-                                                value = timeSampleValues[i]
-                                                lastSourceFrame = timeSample
-                                            sourceFrameAttr.Set(lastSourceFrame, timeSample)
-                                            attr.Set(value, timeSample)
-                                    except Exception as e:
-                                        print(timeSample,timeSampleValues)
-                                        raise Exception(e)
-                        frameHoldVS.AddVariant("normal")
-                        frameHoldVS.SetVariantSelection("normal")
-                        with frameHoldVS.GetVariantEditContext():
-                            for attr, attrInfo in attrTimeSampleDict.items():
-                                timeSamples = attrInfo[0]
-                                timeSampleValues = attrInfo[1]
-
-                                for i, timeSample in enumerate(timeSamples):
-                                    attr.Set(timeSampleValues[i], timeSample)
-                                    sourceFrameAttr.Set(timeSample, timeSample)
+                _publish_usd_animcache_layer(f, reparented_export_node, start_frame, rig=rig, publish_path=publish_path, skelRoot=skelRoot, skelOnly=skelOnly, frameHold=frameHold, frameHoldBatchSize=frameHoldBatchSize, frameHoldClips=frameHoldClips, compactSamples=compactSamples, adaptiveSubframes=adaptiveSubframes, subframeTolerance=subframeTolerance, skelReduce=skelReduce, skelTolerance=skelTolerance, skelRotationTolerance=skelRotationTolerance, pointReduce=pointReduce, pointTolerance=pointTolerance, normalTolerance=normalTolerance, rigidMeshes=rigidMeshes, rigidTolerance=rigidTolerance, payloadSplit=payloadSplit, restFrame=restFrame, profile=profile)
 
-                    if skelOnly:
-                        rig_fields = resolver.filepath_to_fields(rig)
-
-                        usd_rig_uri = 'tank:/{0}/{1}?Step=rig&Task=rig&asset_type={2}&version=latest&Asset={3}'.format(shotgun_utils.get_project_code(), RIG_USD_TEMPLATE_NAME, rig_fields['asset_type'], rig_fields['Asset'])
-                        stage.GetDefaultPrim().GetReferences().AddReference(usd_rig_uri)
-                    stage.GetRootLayer().Save()
+            if f and exportCache:
+                usd_export_cache.store_cached_layer(exportCache, cache_key, f, exportCacheSize * 1e9)
+                if cachePayload:
+                    usd_export_cache.store_cached_layer(exportCache, cache_key + usd_payload_split.PAYLOAD_SUFFIX, usd_payload_split.get_payload_filepath(f, publish_path), exportCacheSize * 1e9)
     except Exception as e:
         print(traceback.format_exc())
         raise Exception(e)
     finally:
+        if memoryProfile:
+            profile.write(memoryProfile)
+
         delete_usd_user_properties(export_node, properties)
 
         if skelRoot and not skelOnly:
-            cmds.deleteAttr('%s.USD_typeName' % skelRoot)
\ No newline at end of file
+            cmds.deleteAttr('%s.USD_typeName' % skelRoot)
+
+
+def export_usd_animcaches(assets, start_frame, end_frame, frame_stride, skelOnly=False, frameHold=0, frameHoldBatchSize=0, frameHoldClips=False, exportChunks=0, exportWorkers=2, exportPreRoll=0, compactSamples=False, adaptiveSubframes=False, subframeTolerance=0.01, skelReduce=False, skelTolerance=0.001, skelRotationTolerance=0.01, pointReduce=False, pointTolerance=0.01, normalTolerance=1.0, rigidMeshes=False, rigidTolerance=0.001, payloadSplit=False, restFrame=None):
+    """
+    Exports the animation of many assets to USD in one Maya USD export, then splits it into a layer per asset.
+    Each asset layer gets the same publish-time USD manipulation as export_usd_animcache.
+
+    Use this for shots with many characters or set dressing assets, so the export, reparenting and layer saving
+    overhead is paid once per shot instead of once per asset.
+
+    :param assets:          List of dicts, one per asset, with the export_node, filepath, rig, lookfile_uri, publish_path
+                            and skelRoot arguments of export_usd_animcache. export_node and filepath are required.
+    :param start_frame:     The start frame to export the animation at.
+    :param end_frame:       The end frame to export the animation at.
+    :param frame_stride:    The frame stride to export the animation at.
+    :param skelOnly:        If True, only the skeletons will be exported. If False, the deformed meshes will be exported.
+    :param frameHold:       Number of frames to hold each frame for. 0 means no frame hold. A variant will be created for each frame hold combination.
+    :param frameHoldBatchSize:  Number of animated attributes to build frame holds for at a time. 0 does every attribute at once. Set this on large caches to bound memory use.
+    :param frameHoldClips:  If True, frame hold variants share one set of samples through value clips, instead of each variant holding a copy of every sample.
+    :param exportChunks:    If greater than 1, the frame range is split into this many chunks which are exported in parallel mayapy processes and stitched back into one layer.
+    :param exportWorkers:   The number of exportChunks mayapy processes to run at once. Each one holds the whole scene, so raise it only as far as the machine's memory allows.
+    :param exportPreRoll:   The number of frames each exportChunks process evaluates before its chunk, so simulations and dynamics match a serial export. Set it to cover the frame range for assets driven by them.
+    :param compactSamples:  If True, attributes that don't change are collapsed to a default value, and repeated samples are dropped before publishing.
+    :param adaptiveSubframes:   If True, sub-frame samples are only kept on prims that move more than subframeTolerance between whole frames. Use with a frame_stride below 1 for motion blur.
+    :param subframeTolerance:   How far a prim's points or transform can move in a frame, in scene units, and still have its sub-frame samples dropped.
+    :param skelReduce:      If True, joints that hold their rest pose are removed from the exported skel animation, and its curves are reduced to the fewest samples within tolerance.
+    :param skelTolerance:   The largest error skelReduce can introduce in joint translations and scales, in scene units.
+    :param skelRotationTolerance:   The largest error skelReduce can introduce in joint rotations, in degrees.
+    :param pointReduce:     If True, points and normals samples that linearly interpolate back within pointTolerance and normalTolerance are dropped. Use for background assets, and leave off for hero assets.
+    :param pointTolerance:  The largest error pointReduce can introduce in any point, in scene units.
+    :param normalTolerance: The largest error pointReduce and rigidMeshes can introduce in any normal, in degrees.
+    :param rigidMeshes:     If True, meshes whose points only move rigidly, within rigidTolerance, are published as static meshes with an animated xform op.
+    :param rigidTolerance:  The furthest rigidMeshes can move any point from its exported position, in scene units.
+    :param payloadSplit:    If True, time sampled and array data is moved to a payload layer, payloaded by the published layer's default prim, so the cache can be opened unloaded. The payload layer is written next to the exported layer, named by usd_payload_split.get_payload_filepath, and has to be published next to publish_path.
+    :param restFrame:       The frame Pref/Nref are taken from. Defaults to start_frame.
+    :return:                List of the exported asset file paths, in the same order as assets.
+    """
+    assets = [dict({"rig": '', "lookfile_uri": '', "publish_path": '', "skelRoot": ''}, **x) for x in assets]
+    print("Nodes to export: " + ", ".join([x["export_node"] for x in assets]))
+
+    groups = []
+    # The assets whose user properties, and skelRoots whose USD_typeName, have been added, so only those are cleaned up
+    setup_assets = []
+    typed_skelRoots = []
+    batch_filepath = usd_batch_export.get_batch_filepath(assets[0]["filepath"])
+    try:
+        reparent_nodes = []
+        for asset in assets:
+            create_usd_user_properties(asset["export_node"], [("rig", asset["rig"]), ("lookfileUri", asset["lookfile_uri"])])
+            setup_assets.append(asset)
+
+            if asset["skelRoot"]:
+                if not skelOnly:
+                    cmds.addAttr(asset["skelRoot"], dt="string", ln='USD_typeName')
+                    typed_skelRoots.append(asset["skelRoot"])
+                    cmds.setAttr(asset["skelRoot"] + '.USD_typeName', 'SkelRoot', type="string")
+                asset["skelRoot_node_id"] = cmds.ls(asset["skelRoot"], uuid=True)[0]
+                asset["skelRoot_node_short"] = asset["skelRoot"].split("|")[-1]
+
+            asset["export_node_id"] = cmds.ls(asset["export_node"], uuid=True)[0]
+            asset["export_node_short"] = asset["export_node"].split("|")[-1]
+
+            # Each reference root is moved for the export, so two assets can't share one
+            if cmds.referenceQuery(asset["export_node"], isNodeReferenced=True):
+                reparent_node = utils.get_root_reference_node(asset["export_node"])
+            else:
+                reparent_node = asset["export_node"]
+            if reparent_node in reparent_nodes:
+                raise Exception("Node " + asset["export_node"] + " has the same reference root as another asset in the batch: " + str(reparent_node))
+            reparent_nodes.append(reparent_node)
+
+        with contextlib.ExitStack() as stack:
+            selection = []
+            for asset, reparent_node in zip(assets, reparent_nodes):
+                # Parent each root under its own group rather than world, so roots with the same name once namespaces are stripped don't collide
+                rp_node = stack.enter_context(utils.maya_keep_parent(reparent_node))
+                group = cmds.group(empty=True, world=True, name=usd_batch_export.BATCH_GROUP_NAME + str(len(groups)))
+                groups.append(group)
+                cmds.parent(rp_node, group)
+
+                asset["reparented_export_node"] = [n for n in cmds.ls(asset["export_node_id"], long=True) if asset["export_node_short"] in n][0]
+                print("Trying to export: " + asset["reparented_export_node"])
+
+                if asset["skelRoot"]:
+                    reparented_skelRoot = [n for n in cmds.ls(asset["skelRoot_node_id"], long=True) if asset["skelRoot_node_short"] in n][0]
+
+                    if skelOnly:
+                        selection.append(reparented_skelRoot)
+                    else:
+                        selection += [asset["reparented_export_node"], reparented_skelRoot]
+                else:
+                    selection.append(asset["reparented_export_node"])
+            cmds.select(selection, r=True)
+
+            options, usd_export_type = _get_usd_animcache_export_options(start_frame, end_frame, frame_stride, any([x["skelRoot"] for x in assets]), skelOnly)
+
+            if exportChunks > 1:
+                f = usd_chunked_export.export_usd_chunked(batch_filepath, options, usd_export_type, start_frame, end_frame, frame_stride, exportChunks, workers=exportWorkers, pre_roll=exportPreRoll)
+            else:
+                f = cmds.file(batch_filepath, force=True, options=';'.join(options), type=usd_export_type, pr=True, es=True)
+            if not f:
+                raise Exception("Failed to export batch layer " + batch_filepath)
+
+            # Keep the split layers open until every asset is published
+            layers = usd_batch_export.split_batch_layer(f, ["/" + x for x in groups], [x["filepath"] for x in assets])
+
+            for asset, group in zip(assets, groups):
+                if asset["publish_path"] != '':
+                    _publish_usd_animcache_layer(asset["filepath"], asset["reparented_export_node"], start_frame, rig=asset["rig"], publish_path=asset["publish_path"], skelRoot=asset["skelRoot"], skelOnly=skelOnly, frameHold=frameHold, frameHoldBatchSize=frameHoldBatchSize, frameHoldClips=frameHoldClips, compactSamples=compactSamples, adaptiveSubframes=adaptiveSubframes, subframeTolerance=subframeTolerance, skelReduce=skelReduce, skelTolerance=skelTolerance, skelRotationTolerance=skelRotationTolerance, pointReduce=pointReduce, pointTolerance=pointTolerance, normalTolerance=normalTolerance, rigidMeshes=rigidMeshes, rigidTolerance=rigidTolerance, payloadSplit=payloadSplit, restFrame=restFrame, dag_root="|" + group)
+
+        return [x["filepath"] for x in assets]
+    except Exception as e:
+        print(traceback.format_exc())
+        raise Exception(e)
+    finally:
+        # The roots have been moved back to their parents by now, so the groups are empty
+        if groups:
+            cmds.delete(groups)
+        usd_batch_export.remove_batch_filepath(batch_filepath)
+
+        for asset in setup_assets:
+            delete_usd_user_properties(asset["export_node"], [("rig", asset["rig"]), ("lookfileUri", asset["lookfile_uri"])])
+
+        for skelRoot in typed_skelRoots:
+            cmds.deleteAttr('%s.USD_typeName' % skelRoot)
+
+
+def _get_usd_animcache_export_options(start_frame, end_frame, frame_stride, skelRoot, skelOnly):
+    """
+    Builds the Maya USD export options for an animcache.
+
+    :return:    Tuple of (list of export options, Maya file type to export with).
+    """
+    options = ['shadingMode=none',
+            'exportRefsAsInstanceable=0',
+            'exportUVs=1',
+            'exportMaterialCollections=0',
+            'materialCollectionsPath=/Collections',
+            'exportColorSets=1',
+            'renderableOnly=0',
+            'mergeTransformAndShape=1',
+            'exportInstances=1',
+            'defaultMeshScheme=catmullClark',
+            'exportVisibility=1',
+            'animation=1',
+            'stripNamespaces=1',
+            'startTime=%d' % start_frame,
+            'endTime=%d' % end_frame,
+            'frameStride=%s' % frame_stride]
+    
+    if skelRoot and not skelOnly:
+        options += ['exportSkels=explicit','exportSkin=explicit']
+    elif skelRoot and skelOnly:
+        options += ['exportSkels=auto','exportSkin=auto']
+    if (int(cmds.about(version=True)) < 2022):
+        usd_export_type = "pxrUsdExport"
+    else:
+        usd_export_type = "USD Export"
+
+    return options, usd_export_type
+
+
+def _publish_usd_animcache_layer(f, reparented_export_node, start_frame, rig='', publish_path='', skelRoot='', skelOnly=False, frameHold=0, frameHoldBatchSize=0, frameHoldClips=False, compactSamples=False, adaptiveSubframes=False, subframeTolerance=0.01, skelReduce=False, skelTolerance=0.001, skelRotationTolerance=0.01, pointReduce=False, pointTolerance=0.01, normalTolerance=1.0, rigidMeshes=False, rigidTolerance=0.001, payloadSplit=False, restFrame=None, dag_root='', profile=None):
+    """
+    Does the publish-time USD manipulation of an exported animcache layer. See export_usd_animcache for the arguments.
+
+    :param f:                       The path of the exported layer.
+    :param reparented_export_node:  The long name of the export node, as it was when the layer was exported.
+    :param dag_root:                The DAG path the export node's root was parented under for the export, if it
+                                    wasn't world. It's stripped from DAG paths to match them to prim paths.
+    :param profile:                 A usd_memory_profile.MemoryProfile to mark the publish phases in.
+    """
+    if profile is None:
+        profile = usd_memory_profile.MemoryProfile(enabled=False)
+
+    if(cmds.referenceQuery(reparented_export_node, inr=True)):
+        export_node_pm = pm.PyNode(reparented_export_node)
+        rigref = pm.referenceQuery(export_node_pm, filename=True)
+        
+        modelrefs = pm.listReferences(parentReference=rigref, recursive=True)
+
+        # Edit the exported layer directly, so the stage is never composed with the tank:/ references we add
+        profile.mark("layer_open")
+        layer = Sdf.Layer.FindOrOpen(f)
+
+        # Every edit is made in one change block, and the layers are written once at the end
+        with usd_edit_session.PublishEditSession(layer) as session:
+            usd_layer_edits.fix_default_prim(layer)
+
+            #If there's a skeleton root, the CONTROLS were probably exported too. Delete them
+            if skelRoot:
+                usd_layer_edits.remove_controls_prim(layer)
+
+            if not skelOnly:
+                # Set Pref/Nref on meshes from the exported points and normals
+                profile.mark("pref_nref")
+                usd_ref_primvars.author_ref_primvars(layer, start_frame if restFrame is None else restFrame)
+
+                # Find every model's root transform in one walk of the DAG
+                profile.mark("reference_rewiring")
+                reference_index = maya_reference_index.build_reference_index(reparented_export_node)
+
+                # Built once per session, so assets referenced many times only build their URIs once
+                uri_index = usd_template_uris.get_template_uri_index(usd_utils.SG_TEMPLATE_MAP, shotgun_utils.get_project_code)
+
+                modelref_templates = []
+                for modelref in modelrefs:
+                    #Add surfacing USD references to internal model references
+                    fields = resolver.filepath_to_fields(modelref.path)
+                    asset_type = fields['asset_type']
+                    asset_name = fields['Asset']
+
+                    if asset_type == 'camera':
+                        continue
+
+                    try:
+                        templates = uri_index.get_surfacing_uris(asset_type, asset_name)
+                    except Exception as e:
+                        print("Could not find reference templates in usdUtils for " + asset_name)
+                        continue
+
+                    if len(templates) > 0:
+                        #Get dag path of this modelref's root transform
+                        reference = reference_index.get(str(modelref.refNode))
+                        if reference is None:
+                            continue
+                        modelref_dag_path = reference["dag_path"]
+                        if(reparented_export_node+"|" not in modelref_dag_path):
+                            continue
+                        #Convert dag path with namespaces to SDF path
+                        modelref_sdf_path = reference["sdf_path"]
+                        if dag_root and modelref_dag_path.startswith(dag_root + "|"):
+                            modelref_sdf_path = maya_reference_index.get_sdf_path(modelref_dag_path[len(dag_root):])
+                        print(modelref_dag_path)
+                        print(modelref_sdf_path)
+
+                        modelref_templates.append((modelref_sdf_path, templates))
+
+                #Move each child of every model under a geo prim. (So it matches our asset descriptions)
+                modelref_updates = usd_layer_edits.move_all_children_under_geo(layer, [x[0] for x in modelref_templates])
+
+                #Add templates from asset description to each model prim. Add surfacing to geo child. (Matches asset description)
+                for modelref_sdf_path, templates in modelref_templates:
+                    prim_spec = layer.GetPrimAtPath(modelref_updates[modelref_sdf_path])
+                    for template in templates:
+                        usd_layer_edits.add_reference(prim_spec, template)
+
+            # Before frame holds, so they hold the xform ops instead of the points
+            if rigidMeshes and not skelOnly:
+                profile.mark("rigid_meshes")
+                usd_rigid_motion.convert_rigid_meshes(layer, rigidTolerance, normalTolerance)
+
+            if frameHold > 1:
+                profile.mark("frame_hold")
+                if frameHoldClips:
+                    usd_frame_hold.author_frame_hold_clips(layer, start_frame, frameHold, publish_path, batchSize=frameHoldBatchSize)
+                else:
+                    usd_frame_hold.author_frame_hold_variants(layer, start_frame, frameHold, batchSize=frameHoldBatchSize)
+
+            # Sample reduction runs after frame holds, as frame holds in copy mode hold every attribute by sample index
+            if adaptiveSubframes:
+                profile.mark("adaptive_subframes")
+                usd_adaptive_sampling.reduce_subframe_samples(layer, subframeTolerance)
+
+            if pointReduce:
+                profile.mark("point_reduce")
+                usd_point_reduction.reduce_point_samples(layer, pointTolerance, normalTolerance)
+
+            if skelRoot and skelReduce:
+                profile.mark("skel_reduce")
+                usd_skel_reduction.reduce_skel_animation(layer, skelTolerance, skelRotationTolerance)
+
+            # After frame holds, so held samples are compacted too
+            if compactSamples:
+                profile.mark("compaction")
+                usd_sample_compaction.compact_time_samples(layer)
+
+            if skelOnly:
+                rig_fields = resolver.filepath_to_fields(rig)
+
+                uri_index = usd_template_uris.get_template_uri_index(usd_utils.SG_TEMPLATE_MAP, shotgun_utils.get_project_code)
+                usd_rig_uri = uri_index.get_step_uri(RIG_USD_TEMPLATE_NAME, "rig", rig_fields['asset_type'], rig_fields['Asset'])
+                usd_layer_edits.add_reference(usd_layer_edits.get_default_prim_spec(layer), usd_rig_uri)
+
+            # Measured between phases, so reading every sample isn't counted in one
+            profile.stop()
+            profile.add_top_attributes(layer)
+
+            # Last, so every pass above has edited the samples before they're moved
+            if payloadSplit:
+                profile.mark("payload_split")
+                session.add_layer(usd_payload_split.split_payload_layer(layer, usd_payload_split.get_payload_filepath(f, publish_path), save=False))
+
+            profile.mark("save")
+            session.save()
+        profile.stop()
@@ -1,4 +1,4 @@
-def export_usd_rig(node, filepath, destination, lookfile_uri, overrideRefs=True, overrideSkelProps=True, overrideSkelConstraints=True):
+def export_usd_rig(node, filepath, destination, lookfile_uri, overrideRefs=True, overrideSkelProps=True, overrideSkelConstraints=True, constraintUserProps=True):
     """
     Exports rig to USD, replacing referenced geo with a reference to the USD geo, adding surfacing URIs,
     and converting parentConstraints to rigidbody constraints.
@@ -10,6 +10,10 @@ def export_usd_rig(node, filepath, destination, lookfile_uri, overrideRefs=True,
     :param overrideRefs=True:               Whether to replace referenced geo with a reference to the USD geo
     :param overrideSkelProps=True:          Whether to override skel properties on the referenced geo
     :param overrideSkelConstraints=True:    Whether to override skel constraints on the referenced geo
+    :param constraintUserProps=True:        Whether to pass each constraint's target, skel path and weight to the USD
+                                            post-processing as Maya user properties. If False, they're kept in a table
+                                            keyed by prim path instead, so the Maya scene isn't edited and the
+                                            exported layer doesn't carry them.
     :return:
     """
 
@@ -25,23 +29,27 @@ def export_usd_rig(node, filepath, destination, lookfile_uri, overrideRefs=True,
     create_usd_user_properties(node, properties)
 
     joint_constraints = []
+    constraint_table = {}
 
     if overrideSkelConstraints:
-        for constraint in cmds.ls(type="parentConstraint", long=True):
-            targets = cmds.parentConstraint(constraint, q=True,targetList=True)
-            if not targets or len(targets) != 1:
+        # Only constraints under the exported node are exported, and each skeleton's path is looked up once
+        skel_paths = {}
+        for joint_constraint in maya_joint_constraints.find_joint_constraints(node):
+            constraint = joint_constraint["dag_path"]
+            t = get_joint_path_string(joint_constraint["joint"])
+
+            skel_root = t.split("/")[0]
+            if skel_root not in skel_paths:
+                skel_paths[skel_root] = get_skel_path_string(skel_root, node)
+            skel = skel_paths[skel_root]
+
+            if not constraintUserProps:
+                # Keyed by the constrained prim, as constraints found in the exported layer are
+                constrained_path = Sdf.Path(joint_constraint["sdf_path"]).GetParentPath().pathString
+                constraint_table[constrained_path] = [(t, skel, joint_constraint["weight"], constrained_path)]
                 continue
 
-            if cmds.objectType(targets[0]) != "joint":
-                continue
-            
-            t = get_joint_path_string(targets[0])
-
-            skel = get_skel_path_string(t.split("/")[0], node)
-
-            weight = cmds.getAttr(constraint+"."+cmds.parentConstraint(constraint, q=True,weightAliasList=True)[0])
-
-            skelprop = [("constraintTarget", t), ("skelPath",skel), ("constraintWeight",weight)]
+            skelprop = [("constraintTarget", t), ("skelPath",skel), ("constraintWeight",joint_constraint["weight"])]
             cmds.select(constraint, r=True)
             create_usd_user_properties(constraint, skelprop)
 
@@ -84,235 +92,137 @@ def export_usd_rig(node, filepath, destination, lookfile_uri, overrideRefs=True,
                   exportSelected=True,
                   preserveReferences=True)
             
-            stage = Usd.Stage.Open(filepath)
-
-            if ":" in stage.GetRootLayer().defaultPrim:
-                stage.GetRootLayer().defaultPrim = stage.GetRootLayer().defaultPrim.split(":")[-1]
-
-            controls_prim = None
-            for x in stage.GetDefaultPrim().GetChildren():
-                if "CONTROLS" in x.GetName():
-                    controls_prim = x
-                    break
-        
-            if controls_prim:
-                stage.RemovePrim(controls_prim.GetPath())
-
-            skelAttributes = {}
-            skelRelationShips = {}
-            skelConstraints = {}
-            #constraintChildren = []
-
-            if overrideSkelProps or overrideSkelConstraints:
-                for prim in stage.Traverse():
-                    if len(prim.GetPath().pathString.split("/")) < 3 or prim.GetPath().pathString.split("/")[2] != "GEO":
-                        continue
-
-                    attrList = prim.GetAuthoredAttributes()
-                    for attr in attrList:
-                        attrType = attr.GetTypeName()
-
-                        # Get skel properties to reroute to referenced geo later
-                        if attr.GetName().startswith('skel:') or ':skel:' in attr.GetName() and overrideSkelProps:
-                            if not skelAttributes.get(prim.GetPath().pathString, None):
-                                skelAttributes[prim.GetPath().pathString] = []
-                            skelAttributes[prim.GetPath().pathString] += [(attr.GetName(),attrType, attr.Get(), prim.GetPath().pathString, attr.GetAllAuthoredMetadata())]
-
-                        # Get parentConstraint targets to replace with rigidbody skinning later
-                        elif attr.GetName().endswith('constraintTarget') and overrideSkelConstraints:
-                            parentPath = "/".join(prim.GetPath().pathString.split("/")[:-1])
-                            skelConstraints[parentPath] = [(attr.Get(), prim.GetAttribute("userProperties:skelPath").Get(),prim.GetAttribute("userProperties:constraintWeight").Get(), parentPath)]
-                            # constraintChildren += prim.GetChildren()
-                    
-                    if overrideSkelProps:
-                        relList = prim.GetAuthoredRelationships()
-                        for rel in relList:
-
-                            if rel.GetName().startswith('skel:') or ':skel:' in rel.GetName():
-                                if not skelRelationShips.get(prim.GetPath().pathString, None):
-                                    skelRelationShips[prim.GetPath().pathString] = []
-                                skelRelationShips[prim.GetPath().pathString] += [(rel.GetName(), rel.GetTargets(), prim.GetPath().pathString, rel.GetAllAuthoredMetadata())]
-
-            # Replace referenced models with reference queries to model USD
-            modelref_updates = {}
-            if refs != None and len(refs) > 0:
-                for ref in refs:
-                    ref_stage = Usd.Stage.Open(cmds.getAttr(ref+".filePath"))
-                    #Add maya root translations to prim
-                    #Copy root prim from ref stage to export stage
-                    ref_parent_transform = cmds.listRelatives(ref, parent=True,f=True)[0]
-
-                    ref_dag_root = ref_parent_transform.replace("|","/")
-
-                    ref_stage_root_prim = ref_stage.GetDefaultPrim()
-                    ref_stage_ref_prim = [x for x in ref_stage.GetDefaultPrim().GetChildren() if x.GetName() == 'geo'][0]
-
-                    ref_stage_root_xform_vectors = UsdGeom.XformCommonAPI(ref_stage_root_prim).GetXformVectors(Usd.TimeCode.Default())
-                    ref_stage_ref_xform_vectors = UsdGeom.XformCommonAPI(ref_stage_ref_prim).GetXformVectors(Usd.TimeCode.Default())
-
-                    stage.DefinePrim(ref_dag_root+str(ref_stage_root_prim.GetPath()), 'Xform')
-                    stage.DefinePrim(ref_dag_root+str(ref_stage_ref_prim.GetPath()), 'Xform')
-
-                    stage_new_ref_root_prim = stage.GetPrimAtPath(ref_dag_root+str(ref_stage_root_prim.GetPath()))
-                    stage_new_ref_ref_prim = stage.GetPrimAtPath(ref_dag_root+str(ref_stage_ref_prim.GetPath()))
-                    
-                    UsdGeom.XformCommonAPI(stage_new_ref_root_prim).SetXformVectors(ref_stage_root_xform_vectors[0], ref_stage_root_xform_vectors[1], ref_stage_root_xform_vectors[2], ref_stage_root_xform_vectors[3], ref_stage_root_xform_vectors[4], Usd.TimeCode.Default())
-                    UsdGeom.XformCommonAPI(stage_new_ref_ref_prim).SetXformVectors(ref_stage_ref_xform_vectors[0], ref_stage_ref_xform_vectors[1], ref_stage_ref_xform_vectors[2], ref_stage_ref_xform_vectors[3], ref_stage_ref_xform_vectors[4], Usd.TimeCode.Default())
-
-                    Usd.ModelAPI(stage_new_ref_ref_prim).SetKind("subcomponent")
-
-                    stage_new_ref_root_prim.GetReferences().AddReference(cmds.getAttr(ref+".descriptionUri"))
-
-            if overrideRefs:
-                modelrefs = [x for x in pm.listReferences(recursive=True) if "/model/" in str(x.path)]
-                if modelrefs != None and len(modelrefs) > 0:
-                    for modelref in modelrefs:
-                        #Add surfacing USD references to internal model references
-                        fields = resolver.filepath_to_fields(modelref.path)
-                        asset_type = fields['asset_type']
-                        asset_name = fields['Asset']
-                        description_uri = 'tank:/{0}/{1}?Step=description&Task=description&asset_type={2}&version=latest&Asset={3}'.format(shotgun_utils.get_project_code(),ASSET_DESCRIPTION_TEMPLATE_NAME, asset_type, asset_name)
-
-                        #Get dag path of this modelref's root transform
-                        modelref_dag_path = ""
-                        if pm.referenceQuery(modelref, n=True, dp=True) == None:
-                            continue
-                        for n in pm.referenceQuery(modelref, n=True, dp=True):
-                            node_parents = cmds.listRelatives(n, parent=True, f=True)
-
-                            #If node has exactly one parent
-                            if node_parents != None and len(node_parents) == 1:
-                                node_parent = node_parents[0]
-
-                                #If this node's parent is not a reference OR the parent is a reference but the filepath is not the same as this nodes filepath, then this node is the top transform of the reference
-                                if (not cmds.referenceQuery(node_parent, inr=True)) or (cmds.referenceQuery(node_parent, inr=True) and cmds.referenceQuery(node_parent, filename=True, wcn=True) != modelref.path):
-                                    modelref_dag_path = cmds.ls(n,l=True)[0]
-                                    break
-
-                        if(node+"|" not in modelref_dag_path):
-                            continue
-
-                        #Convert dag path with namespaces to SDF path
-                        print("modelref_dag_path: " + modelref_dag_path)
-                        modelref_sdf_path = ""
-                        for n in modelref_dag_path.split("|"):
-                            if ":" in n:
-                                modelref_sdf_path += n.split(":")[-1]
-                            else:
-                                modelref_sdf_path += n
-                            modelref_sdf_path += "/"
-                        modelref_sdf_path = modelref_sdf_path[:-1]
-
-                        print("modelref_sdf_path: " + modelref_sdf_path)
-
-                        # Add /geo to geo path to fit our asset descriptions.
-                        original_modelref_sdf_path = modelref_sdf_path
-                        for oldPath in modelref_updates.keys():
-                            modelref_sdf_path = modelref_sdf_path.replace(oldPath, modelref_updates[oldPath])
-                        modelref_updates[original_modelref_sdf_path] = modelref_sdf_path+"/geo"
-
-                        prim = stage.GetPrimAtPath(modelref_sdf_path)
-                        xform_vectors = UsdGeom.XformCommonAPI(prim).GetXformVectors(Usd.TimeCode.Default())
-                        stage.RemovePrim(modelref_sdf_path)
-                        recreated_prim = stage.DefinePrim(modelref_sdf_path,'Xform')
-                        UsdGeom.XformCommonAPI(recreated_prim).SetXformVectors(xform_vectors[0], xform_vectors[1], xform_vectors[2], xform_vectors[3], xform_vectors[4], Usd.TimeCode.Default())
-                        Usd.ModelAPI(recreated_prim).SetKind("subcomponent")
-                        recreated_prim.GetReferences().AddReference(description_uri)
-
-                        # Get list of skel attributes and relationships for new referenced prims
-                        if overrideSkelProps:
-                            culledAttributes = skelAttributes.copy()
-                            for path in skelAttributes.keys():
-                                if path.startswith(modelref_sdf_path):
-                                    newPath = path.replace(modelref_sdf_path, modelref_sdf_path + "/geo")
-                                    currentValue = culledAttributes[path]
-                                    culledAttributes[newPath] = currentValue.copy()
-                                    del culledAttributes[path]
-                            skelAttributes = culledAttributes.copy()
-
-                            culledRelationships = skelRelationShips.copy()
-                            for path in skelRelationShips.keys():
-                                if path.startswith(modelref_sdf_path):
-                                    newPath = path.replace(modelref_sdf_path, modelref_sdf_path + "/geo")
-                                    currentValue = culledRelationships[path]
-                                    culledRelationships[newPath] = currentValue.copy()
-                                    del culledRelationships[path]
-                            skelRelationShips = culledRelationships.copy()
-
-                        # Get list of parentConstraint prims for new referenced prims
-                        if overrideSkelConstraints:
-                            culledConstraints = skelConstraints.copy()
-                            for path in skelConstraints.keys():
-                                if path.startswith(modelref_sdf_path):
-                                    newPath = path.replace(modelref_sdf_path, modelref_sdf_path + "/geo")
-                                    currentValue = culledConstraints[path]
-                                    culledConstraints[newPath] = currentValue.copy()
-                                    del culledConstraints[path]
-                            skelConstraints = culledConstraints.copy()
-
-                    stage.GetRootLayer().Save()
-            
-            if overrideSkelProps:
-                for path in skelAttributes.keys():
-                    print("Adding skel attributes to " + path)
-
-                    newPrim = stage.OverridePrim(path)
-                    UsdSkel.BindingAPI.Apply(newPrim)
-                    for attrTuple in skelAttributes[path]:
-                        newAttr = newPrim.CreateAttribute(
-                        attrTuple[0], attrTuple[1])
-
-                        newAttr.Set(attrTuple[2])
-
-                        for k, v in attrTuple[4].items():
-                            newAttr.SetMetadata(k,v)
-
-                for path in skelRelationShips.keys():
-                    print("Adding skel relationships to " + path)
-
-                    newPrim = stage.OverridePrim(path)
-                    UsdSkel.BindingAPI.Apply(newPrim)
-                    for relTuple in skelRelationShips[path]:
-                        newRel = newPrim.CreateRelationship(
-                        relTuple[0])
-
-                        for target in relTuple[1]:
-                            newRel.AddTarget(target)
-                        
-                        for k, v in relTuple[3].items():
-                            newRel.SetMetadata(k,v)
-            
-            # Convert parentConstraints to rigidbody skins
-            if overrideSkelConstraints:
-                for path in skelConstraints.keys():
-                    print("Applying parent constraint logic to " + path)
-                    newPrim = stage.OverridePrim(path)
-                    primSkel = UsdSkel.BindingAPI.Apply(newPrim)
-
-                    for constraintTuple in skelConstraints[path]:
-                        targetPath = constraintTuple[0]
-
-                        skel = constraintTuple[1]
-
-                        primSkel.CreateJointsAttr([targetPath])
-                        primSkel.CreateJointIndicesPrimvar(constant=True,elementSize=1).Set([0])
-                        primSkel.CreateJointWeightsPrimvar(constant=True,elementSize=1).Set([float(constraintTuple[2])])
-                        
-                        # Copy bind transform from siblings. TODO: Would be great if we could figure this out independantly.
-                        bindTransform = None
-
-                        xform = UsdGeom.Xformable(newPrim)
-                        time = Usd.TimeCode.Default()
-                        bindTransform = xform.ComputeLocalToWorldTransform(time)
-                        
-                        print("Computing bind transform for {0} from local xform.".format(path))
-                        newPrim.GetAttribute("primvars:skel:geomBindTransform").Set(bindTransform)
-
-                        primSkel.CreateSkeletonRel().AddTarget(skel)
+            # Edit the exported layer directly, so the stage is never composed with the tank:/ references we add
+            layer = Sdf.Layer.FindOrOpen(filepath)
+
+            # Transforms are read from the layer's own xform ops, before any prims are recreated
+            xform_stage = usd_layer_edits.get_xform_stage(layer)
+
+            # Every edit is made in one change block, and the layer is written once at the end
+            with usd_edit_session.PublishEditSession(layer) as session:
+                usd_layer_edits.fix_default_prim(layer)
+                usd_layer_edits.remove_controls_prim(layer)
+
+                # Find the skel properties to reroute, and the parentConstraints to convert, in one walk of GEO
+                skelAttributes, skelRelationShips, skelConstraints = usd_skel_properties.get_skel_properties(layer, overrideSkelProps, overrideSkelConstraints and constraintUserProps)
+                if overrideSkelConstraints and not constraintUserProps:
+                    skelConstraints = dict([(path, value) for path, value in constraint_table.items() if layer.GetPrimAtPath(path)])
+
+                # Replace referenced models with reference queries to model USD
+                geo_remap = usd_layer_edits.GeoPathRemap()
+                if refs != None and len(refs) > 0:
+                    for ref in refs:
+                        # Each model file is read once per session, however many proxies load it
+                        ref_model = usd_proxy_cache.get_model(cmds.getAttr(ref+".filePath"))
+                        #Add maya root translations to prim
+                        #Copy root prim from ref stage to export stage
+                        ref_parent_transform = cmds.listRelatives(ref, parent=True,f=True)[0]
+
+                        ref_dag_root = ref_parent_transform.replace("|","/")
+
+                        layer_new_ref_root_prim = usd_layer_edits.define_prim(layer, ref_dag_root+ref_model["root_path"], 'Xform')
+                        layer_new_ref_ref_prim = usd_layer_edits.define_prim(layer, ref_dag_root+ref_model["geo_path"], 'Xform')
+
+                        usd_layer_edits.set_xform_vectors(layer_new_ref_root_prim, *ref_model["root_xform_vectors"])
+                        usd_layer_edits.set_xform_vectors(layer_new_ref_ref_prim, *ref_model["geo_xform_vectors"])
+
+                        layer_new_ref_ref_prim.kind = "subcomponent"
+
+                        usd_layer_edits.add_reference(layer_new_ref_root_prim, cmds.getAttr(ref+".descriptionUri"))
+
+                    stats = usd_proxy_cache.get_stats()
+                    print("Proxy model cache: {0} hits, {1} misses, {2} models".format(stats["hits"], stats["misses"], stats["models"]))
+
+                if overrideRefs:
+                    modelrefs = [x for x in pm.listReferences(recursive=True) if "/model/" in str(x.path)]
+                    if modelrefs != None and len(modelrefs) > 0:
+                        # Find every model's root transform in one walk of the DAG
+                        reference_index = maya_reference_index.build_reference_index(node)
+                        uri_index = usd_template_uris.get_template_uri_index(usd_utils.SG_TEMPLATE_MAP, shotgun_utils.get_project_code)
+
+                        for modelref in modelrefs:
+                            #Add surfacing USD references to internal model references
+                            fields = resolver.filepath_to_fields(modelref.path)
+                            asset_type = fields['asset_type']
+                            asset_name = fields['Asset']
+                            description_uri = uri_index.get_step_uri(ASSET_DESCRIPTION_TEMPLATE_NAME, "description", asset_type, asset_name)
+
+                            #Get dag path of this modelref's root transform
+                            reference = reference_index.get(str(modelref.refNode))
+                            if reference is None:
+                                continue
+                            modelref_dag_path = reference["dag_path"]
+
+                            if(node+"|" not in modelref_dag_path):
+                                continue
+
+                            #Convert dag path with namespaces to SDF path
+                            print("modelref_dag_path: " + modelref_dag_path)
+                            modelref_sdf_path = reference["sdf_path"]
+
+                            print("modelref_sdf_path: " + modelref_sdf_path)
+
+                            # Add /geo to geo path to fit our asset descriptions. The model may be nested in a model
+                            # that has already been moved under its geo.
+                            original_modelref_sdf_path = modelref_sdf_path
+                            modelref_sdf_path = geo_remap.get_path(original_modelref_sdf_path).pathString
+                            geo_remap.add(original_modelref_sdf_path)
+
+                            # Read the xform from where the model was exported, as nested models have been removed by now
+                            xform_vectors = UsdGeom.XformCommonAPI(xform_stage.GetPrimAtPath(original_modelref_sdf_path)).GetXformVectors(Usd.TimeCode.Default())
+                            usd_layer_edits.remove_prim(layer, modelref_sdf_path)
+                            recreated_prim = usd_layer_edits.define_prim(layer, modelref_sdf_path,'Xform')
+                            usd_layer_edits.set_xform_vectors(recreated_prim, *xform_vectors)
+                            recreated_prim.kind = "subcomponent"
+                            usd_layer_edits.add_reference(recreated_prim, description_uri)
+
+                # Reroute the skel properties and parentConstraint prims under each model to its geo, in one pass
+                skelAttributes = geo_remap.remap_keys(skelAttributes)
+                skelRelationShips = geo_remap.remap_keys(skelRelationShips)
+                skelConstraints = geo_remap.remap_keys(skelConstraints)
+
+                if overrideSkelProps:
+                    for path in skelAttributes.keys():
+                        print("Adding skel attributes to " + path)
+
+                        newPrim = usd_layer_edits.override_prim(layer, path)
+                        usd_layer_edits.apply_api_schema(newPrim, "SkelBindingAPI")
+                        for attrTuple in skelAttributes[path]:
+                            newAttr = usd_layer_edits.create_attribute(newPrim, attrTuple[0], attrTuple[1])
+
+                            newAttr.default = attrTuple[2]
+
+                            usd_layer_edits.set_metadata(newAttr, attrTuple[4])
+
+                    for path in skelRelationShips.keys():
+                        print("Adding skel relationships to " + path)
+
+                        newPrim = usd_layer_edits.override_prim(layer, path)
+                        usd_layer_edits.apply_api_schema(newPrim, "SkelBindingAPI")
+                        for relTuple in skelRelationShips[path]:
+                            newRel = usd_layer_edits.create_relationship(newPrim, relTuple[0])
+
+                            for target in relTuple[1]:
+                                usd_layer_edits.add_target(newRel, target)
+
+                            usd_layer_edits.set_metadata(newRel, relTuple[3])
+
+                # Convert parentConstraints to rigidbody skins
+                if overrideSkelConstraints:
+                    # Copy bind transform from siblings. TODO: Would be great if we could figure this out independantly.
+                    # Computed where the constrained prims were exported, before they were rerouted under model references,
+                    # in one pass that shares the transforms of their ancestors.
+                    bindTransforms = usd_layer_edits.get_world_transforms(xform_stage, [x[3] for constraintTuples in skelConstraints.values() for x in constraintTuples])
 
+                    with Sdf.ChangeBlock():
+                        for path in skelConstraints.keys():
+                            print("Applying parent constraint logic to " + path)
+                            newPrim = usd_layer_edits.override_prim(layer, path)
 
+                            for constraintTuple in skelConstraints[path]:
+                                usd_layer_edits.apply_rigid_skin(newPrim, constraintTuple[0], constraintTuple[2], constraintTuple[1], bindTransforms[constraintTuple[3]])
 
-            stage.GetRootLayer().Save()
+                session.save()
 
     except Exception as e:
         print(traceback.format_exc())
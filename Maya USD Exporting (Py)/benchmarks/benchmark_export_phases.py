@@ -0,0 +1,213 @@
+"""
+Times each post-export phase of export_usd_animcache and export_usd_rig, with only pxr installed.
+
+The exporter snippets are run as they are, with the stand-ins in maya_standins in place of Maya, pymel, the resolver
+and ShotGrid. A synthetic scene of the requested size is built, and the layer Maya would have exported for it is
+written ahead of time. The stand-in cmds.file copies that layer, so the maya_export phase is only the exporter's own
+setup and the copy.
+
+Phases are timed by marking the start of each phase when the exporter makes its first call of that phase, so any code
+between two marks is counted in the earlier phase. Each run is its own process, so runs don't share open layers and
+their peak memory can be measured. Results are written as JSON, to track over time.
+
+Run with a usd-core or mayapy python:
+
+    python benchmark_export_phases.py --models 100 --meshes 10 --frames 48 --frameHold 2 --output results.json
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pxr import Sdf, Usd
+
+import maya_standins
+import usd_edit_session
+import usd_layer_edits
+
+from benchmark_layer_edits import get_peak_memory
+
+
+EXPORTERS = ("animcache", "rig")
+
+# (module name or object, eg. a class to time a method of, function name, phase it starts, phase started when it
+# returns, optional predicate on its first argument). Module names are looked up in the exporter's globals.
+ANIMCACHE_PHASES = [(Sdf.Layer, "FindOrOpen", "layer_open", None, None),
+                    ("usd_layer_edits", "fix_default_prim", "cleanup", None, None),
+                    ("usd_ref_primvars", "author_ref_primvars", "pref_nref", "reference_rewiring", None),
+                    ("usd_frame_hold", "author_frame_hold_variants", "frame_hold", "other", None),
+                    ("usd_frame_hold", "author_frame_hold_clips", "frame_hold", "other", None),
+                    ("usd_adaptive_sampling", "reduce_subframe_samples", "adaptive_subframes", "other", None),
+                    ("usd_point_reduction", "reduce_point_samples", "point_reduce", "other", None),
+                    ("usd_skel_reduction", "reduce_skel_animation", "skel_reduce", "other", None),
+                    ("usd_sample_compaction", "compact_time_samples", "compaction", "other", None),
+                    (usd_edit_session.PublishEditSession, "save", "save", "other", None)]
+
+RIG_PHASES = [(Sdf.Layer, "FindOrOpen", "layer_open", None, None),
+              ("usd_layer_edits", "fix_default_prim", "cleanup", None, None),
+              ("usd_layer_edits", "get_xform_stage", "xform_stage", None, None),
+              ("usd_skel_properties", "get_skel_properties", "skel_discovery", None, None),
+              (maya_standins.cmds, "getAttr", "proxy_references", None, lambda plug: plug.endswith(".filePath")),
+              (maya_standins.pm, "listReferences", "reference_rewiring", None, None),
+              (usd_layer_edits.GeoPathRemap, "remap_keys", "skel_reroute", None, None),
+              ("usd_layer_edits", "get_world_transforms", "constraint_skinning", None, None),
+              ("usd_layer_edits", "apply_rigid_skin", "constraint_skinning", None, None),
+              (usd_edit_session.PublishEditSession, "save", "save", None, None)]
+
+
+class PhaseTimer():
+    """
+    Adds up the time spent in each phase. Time is counted to the current phase until the next one is marked.
+    """
+    def __init__(self):
+        self.seconds = {}
+        self.phase = None
+        self.start = None
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.seconds[self.phase] = self.seconds.get(self.phase, 0.0) + now - self.start
+        self.phase = phase
+        self.start = now
+
+    def wrap(self, owner, name, phase, after=None, predicate=None):
+        """
+        Replaces owner.name with a function that marks phase when it's called, and after when it returns.
+        """
+        func = getattr(owner, name)
+
+        def _wrapper(*args, **kwargs):
+            marked = predicate is None or predicate(args[0])
+            if marked:
+                self.mark(phase)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if marked and after:
+                    self.mark(after)
+
+        setattr(owner, name, _wrapper)
+
+
+def run_export(job):
+    """
+    Builds the synthetic scene, runs one export in this process, and prints its phase times and peak memory as json.
+    """
+    scene = maya_standins.SyntheticScene(job["models"], job["meshes"], job["nested"], job["joints"], job["constraints"],
+                                         job["proxies"], referenced=job["exporter"] == "animcache")
+    maya_standins.install(scene)
+
+    work_dir = job["work_dir"]
+    if job["exporter"] == "animcache":
+        scene.write_animcache_layer(os.path.join(work_dir, "exported.usdc"), job["frames"], job["points"])
+        namespace = maya_standins.load_exporter("MayaUSDAnimcacheExport.py")
+        phases = ANIMCACHE_PHASES
+    else:
+        scene.write_description(os.path.join(work_dir, "description.usda"))
+        scene.write_rig_layer(os.path.join(work_dir, "exported.usdc"), job["points"])
+        namespace = maya_standins.load_exporter("MayaUSDRigExport.py")
+        phases = RIG_PHASES
+
+    timer = PhaseTimer()
+    for owner, name, phase, after, predicate in phases:
+        timer.wrap(namespace[owner] if isinstance(owner, str) else owner, name, phase, after, predicate)
+
+    filepath = os.path.join(work_dir, job["exporter"] + ".usdc")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        timer.mark("maya_export")
+        if job["exporter"] == "animcache":
+            namespace["export_usd_animcache"](scene.root, filepath, 1, job["frames"], 1.0, rig=maya_standins.RIG_FILEPATH,
+                                              publish_path=os.path.join(work_dir, "publish", "animcache.usdc"),
+                                              skelRoot=scene.skel_root if job["joints"] else '', frameHold=job["frameHold"],
+                                              compactSamples=job["compactSamples"], skelReduce=job["joints"] > 0,
+                                              pointReduce=job["pointReduce"])
+        else:
+            namespace["export_usd_rig"](scene.root, filepath, work_dir, "")
+        timer.mark(None)
+
+    print(json.dumps({"phases": timer.seconds, "total": sum(timer.seconds.values()), "peak_bytes": get_peak_memory()}))
+
+
+def summarise(runs):
+    """
+    Summarises a list of run times.
+    """
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--exporters", default=",".join(EXPORTERS), help="Comma separated exporters to time")
+    parser.add_argument("--models", type=int, default=50, help="Number of model references")
+    parser.add_argument("--meshes", type=int, default=10, help="Number of meshes in each model")
+    parser.add_argument("--points", type=int, default=500, help="Number of points in each mesh")
+    parser.add_argument("--frames", type=int, default=24)
+    parser.add_argument("--nested", type=int, default=4, help="Every nested'th model has a model reference nested in it. 0 nests none")
+    parser.add_argument("--joints", type=int, default=50, help="Number of skeleton joints. 0 exports no skeleton")
+    parser.add_argument("--constraints", type=int, default=20, help="Number of meshes parentConstrained to joints in the rig")
+    parser.add_argument("--proxies", type=int, default=5, help="Number of mayaUsdProxyShapes in the rig")
+    parser.add_argument("--frameHold", type=int, default=2)
+    parser.add_argument("--compactSamples", action="store_true")
+    parser.add_argument("--pointReduce", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs of each exporter")
+    parser.add_argument("--output", help="Path to write the json results to. They are printed if this isn't set")
+    parser.add_argument("--job", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        run_export(json.loads(args.job))
+        return
+
+    config = dict((k, v) for k, v in vars(args).items() if k not in ("job", "output", "exporters"))
+    results = {}
+    for exporter in args.exporters.split(","):
+        runs = []
+        for i in range(args.repeat):
+            work_dir = tempfile.mkdtemp(prefix="benchmarkExportPhases_")
+            try:
+                job = dict(config, exporter=exporter, work_dir=work_dir)
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--job", json.dumps(job)], universal_newlines=True)
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+        phases = []
+        for run in runs:
+            phases += [x for x in run["phases"] if x not in phases]
+        results[exporter] = {"phases": dict((x, summarise([run["phases"].get(x, 0.0) for run in runs])) for x in phases),
+                             "total": summarise([run["total"] for run in runs]),
+                             "peak_bytes": max([run["peak_bytes"] for run in runs])}
+
+        print("{0}: {1:.3f}s total, {2:.1f} MB peak".format(exporter, results[exporter]["total"]["median"], results[exporter]["peak_bytes"] / 1e6))
+        for phase in phases:
+            print("    {0:<20} {1:.4f}s".format(phase, results[exporter]["phases"][phase]["median"]))
+
+    document = {"benchmark": "export_phases",
+                "created": datetime.datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "usd": ".".join([str(x) for x in Usd.GetVersion()]),
+                "config": config,
+                "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print("Wrote results to " + args.output)
+    else:
+        print(json.dumps(document, indent=2))
+
+
+if __name__ == "__main__":
+    main()
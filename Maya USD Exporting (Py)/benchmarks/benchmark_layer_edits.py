@@ -0,0 +1,313 @@
+"""
+Benchmarks the publish-time edits of the Maya USD exporters made through a composed Usd.Stage against the same edits
+made by usd_layer_edits on the Sdf layer.
+
+A synthetic cache is written with a number of models, each with animated meshes, and each model gets references to
+description layers on disk, standing in for the tank:/ templates. The stage path is the previous implementation of
+export_usd_animcache and export_usd_rig: every reference added composes its layer. Each path runs in its own
+process so its peak memory can be measured, and the edited layers are checked to be identical.
+
+Run with a usd-core or mayapy python:
+
+    python benchmark_layer_edits.py --models 50 --meshes 20 --frames 100 --points 2000
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from pxr import Gf, Sdf, Usd, UsdGeom, Vt
+
+import usd_layer_edits
+
+
+def get_points(points):
+    """
+    Returns random points, so the crate file can't deduplicate them.
+    """
+    return Vt.Vec3fArray.FromNumpy(numpy.random.rand(points, 3).astype(numpy.float32))
+
+
+def write_description(filepath, meshes, points):
+    """
+    Writes a stand-in asset description layer with static meshes.
+    """
+    layer = Sdf.Layer.CreateNew(filepath)
+    with Sdf.ChangeBlock():
+        for j in range(meshes):
+            mesh = Sdf.CreatePrimInLayer(layer, "/asset/geo/mesh{0}".format(j))
+            mesh.specifier = Sdf.SpecifierDef
+            mesh.typeName = "Mesh"
+            Sdf.AttributeSpec(mesh, "points", Sdf.ValueTypeNames.Point3fArray).default = get_points(points)
+    layer.defaultPrim = "asset"
+    layer.Save()
+
+
+def write_cache(filepath, models, meshes, frames, points):
+    """
+    Writes a synthetic exported cache. The default prim has a namespace, there is a CONTROLS prim, and the first
+    model already has a child named geo.
+    """
+    layer = Sdf.Layer.CreateNew(filepath)
+    layer.defaultPrim = "ns:root"
+    layer.startTimeCode = 1
+    layer.endTimeCode = frames
+
+    with Sdf.ChangeBlock():
+        for path in ["/root", "/root/CONTROLS", "/root/GEO"]:
+            Sdf.CreatePrimInLayer(layer, path).specifier = Sdf.SpecifierDef
+
+        for i in range(models):
+            model = Sdf.CreatePrimInLayer(layer, "/root/GEO/model{0}".format(i))
+            model.specifier = Sdf.SpecifierDef
+            model.typeName = "Xform"
+            usd_layer_edits.set_xform_vectors(model, Gf.Vec3d(i, 0, 0), Gf.Vec3f(0, 90, 0), Gf.Vec3f(1), Gf.Vec3f(0), UsdGeom.XformCommonAPI.RotationOrderXYZ)
+
+            for j in range(meshes):
+                mesh = Sdf.PrimSpec(model, "geo" if i == 0 and j == 0 else "mesh{0}".format(j), Sdf.SpecifierDef, "Mesh")
+                attr = Sdf.AttributeSpec(mesh, "points", Sdf.ValueTypeNames.Point3fArray)
+                for frame in range(1, frames + 1):
+                    layer.SetTimeSample(attr.path, frame, get_points(points))
+
+    layer.Save()
+
+
+def edit_animcache_stage(filepath, models, templates):
+    """
+    The previous export_usd_animcache edits, through a composed stage.
+    """
+    stage = Usd.Stage.Open(filepath)
+
+    if ":" in stage.GetRootLayer().defaultPrim:
+        stage.GetRootLayer().defaultPrim = stage.GetRootLayer().defaultPrim.split(":")[-1]
+
+    controls_prim = None
+    for x in stage.GetDefaultPrim().GetChildren():
+        if "CONTROLS" in x.GetName() and x.GetParent() == stage.GetDefaultPrim():
+            controls_prim = x
+            break
+
+    if controls_prim:
+        stage.RemovePrim(controls_prim.GetPath())
+
+    for i in range(models):
+        modelref_sdf_path = "/root/GEO/model{0}".format(i)
+
+        prim = stage.GetPrimAtPath(modelref_sdf_path)
+        geoPath = modelref_sdf_path+"/geo"
+
+        if stage.GetPrimAtPath(geoPath):
+            layer = stage.GetRootLayer()
+            with Sdf.ChangeBlock():
+                edits = Sdf.BatchNamespaceEdit()
+                tempGeoPath = stage.GetPrimAtPath(geoPath).GetPath().ReplaceName("geoPUBLISHTEMP")
+                edits.Add(Sdf.Path(geoPath), tempGeoPath)
+                if not layer.Apply(edits):
+                    raise Exception("Could not apply layer edit")
+
+        stage.DefinePrim(geoPath, "Xform")
+        layer = stage.GetRootLayer()
+
+        with Sdf.ChangeBlock():
+            edits = Sdf.BatchNamespaceEdit()
+            for child in prim.GetChildren():
+                if child.GetName() != "geo":
+                    if child.GetName() == "geoPUBLISHTEMP":
+                        newChildPath = geoPath+"/geo"
+                    else:
+                        newChildPath = geoPath+"/"+child.GetName()
+                    edits.Add(child.GetPath(),Sdf.Path(newChildPath))
+            if not layer.Apply(edits):
+                raise Exception("Could not apply layer edit")
+
+        for template in templates:
+            prim.GetReferences().AddReference(template)
+
+    stage.GetRootLayer().Save()
+
+
+def edit_animcache_layer(filepath, models, templates):
+    """
+    The export_usd_animcache edits, through usd_layer_edits, in the order _publish_usd_animcache_layer makes them.
+    """
+    layer = Sdf.Layer.FindOrOpen(filepath)
+
+    usd_layer_edits.fix_default_prim(layer)
+    usd_layer_edits.remove_controls_prim(layer)
+
+    modelref_sdf_paths = ["/root/GEO/model{0}".format(i) for i in range(models)]
+    modelref_updates = usd_layer_edits.move_all_children_under_geo(layer, modelref_sdf_paths)
+
+    for modelref_sdf_path in modelref_sdf_paths:
+        prim_spec = layer.GetPrimAtPath(modelref_updates[modelref_sdf_path])
+        for template in templates:
+            usd_layer_edits.add_reference(prim_spec, template)
+
+    layer.Save()
+
+
+def edit_rig_stage(filepath, models, templates):
+    """
+    The previous export_usd_rig model reference edits, through a composed stage.
+    """
+    stage = Usd.Stage.Open(filepath)
+
+    for i in range(models):
+        modelref_sdf_path = "/root/GEO/model{0}".format(i)
+
+        prim = stage.GetPrimAtPath(modelref_sdf_path)
+        xform_vectors = UsdGeom.XformCommonAPI(prim).GetXformVectors(Usd.TimeCode.Default())
+        stage.RemovePrim(modelref_sdf_path)
+        recreated_prim = stage.DefinePrim(modelref_sdf_path,'Xform')
+        UsdGeom.XformCommonAPI(recreated_prim).SetXformVectors(xform_vectors[0], xform_vectors[1], xform_vectors[2], xform_vectors[3], xform_vectors[4], Usd.TimeCode.Default())
+        Usd.ModelAPI(recreated_prim).SetKind("subcomponent")
+        recreated_prim.GetReferences().AddReference(templates[0])
+
+    stage.GetRootLayer().Save()
+
+
+def edit_rig_layer(filepath, models, templates):
+    """
+    The export_usd_rig model reference edits, through usd_layer_edits, with paths remapped by GeoPathRemap as
+    export_usd_rig remaps them.
+    """
+    layer = Sdf.Layer.FindOrOpen(filepath)
+    xform_stage = usd_layer_edits.get_xform_stage(layer)
+    geo_remap = usd_layer_edits.GeoPathRemap()
+
+    for i in range(models):
+        original_modelref_sdf_path = "/root/GEO/model{0}".format(i)
+        modelref_sdf_path = geo_remap.get_path(original_modelref_sdf_path).pathString
+        geo_remap.add(original_modelref_sdf_path)
+
+        xform_vectors = UsdGeom.XformCommonAPI(xform_stage.GetPrimAtPath(original_modelref_sdf_path)).GetXformVectors(Usd.TimeCode.Default())
+        usd_layer_edits.remove_prim(layer, modelref_sdf_path)
+        recreated_prim = usd_layer_edits.define_prim(layer, modelref_sdf_path,'Xform')
+        usd_layer_edits.set_xform_vectors(recreated_prim, *xform_vectors)
+        recreated_prim.kind = "subcomponent"
+        usd_layer_edits.add_reference(recreated_prim, templates[0])
+
+    layer.Save()
+
+
+def layers_match(a, b):
+    """
+    Returns True if two layers hold the same specs, fields and time samples. Values are compared in C++, so large
+    caches never need to be written out as text.
+    """
+    for layer, other in [(a, b), (b, a)]:
+        paths = []
+        layer.Traverse(Sdf.Path.absoluteRootPath, paths.append)
+
+        for path in paths:
+            spec = layer.GetObjectAtPath(path)
+            other_spec = other.GetObjectAtPath(path)
+            if not other_spec or spec.ListInfoKeys() != other_spec.ListInfoKeys():
+                return False
+
+            for key in spec.ListInfoKeys():
+                if key != "timeSamples" and spec.GetInfo(key) != other_spec.GetInfo(key):
+                    return False
+
+            times = layer.ListTimeSamplesForPath(path)
+            if times != other.ListTimeSamplesForPath(path):
+                return False
+            for t in times:
+                if layer.QueryTimeSample(path, t) != other.QueryTimeSample(path, t):
+                    return False
+
+    return True
+
+
+EDITS = {"animcache_stage": edit_animcache_stage,
+         "animcache_layer": edit_animcache_layer,
+         "rig_stage": edit_rig_stage,
+         "rig_layer": edit_rig_layer}
+
+
+def get_peak_memory():
+    """
+    Returns the peak resident memory of this process in bytes.
+    """
+    # ru_maxrss is carried over from the parent process through exec on Linux, so read the high water mark instead
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+
+    # ru_maxrss is in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_edit(job):
+    """
+    Runs and saves one set of edits on a copy of the cache, and prints its time and peak memory as json.
+    """
+    start = time.perf_counter()
+    EDITS[job["edit"]](job["output"], job["models"], job["templates"])
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({"seconds": elapsed, "peak_bytes": get_peak_memory()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", type=int, default=50)
+    parser.add_argument("--meshes", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--templates", type=int, default=3, help="Number of description layers referenced per model")
+    parser.add_argument("--job", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.job:
+        run_edit(json.loads(args.job))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="benchmarkLayerEdits_")
+
+    templates = []
+    for i in range(args.templates):
+        template = os.path.join(work_dir, "description{0}.usda".format(i))
+        write_description(template, args.meshes, args.points)
+        templates.append(template)
+
+    cache = os.path.join(work_dir, "cache.usdc")
+    write_cache(cache, args.models, args.meshes, args.frames, args.points)
+    print("Cache: {0} models x {1} meshes x {2} frames x {3} points, {4:.1f} MB".format(args.models, args.meshes, args.frames, args.points, os.path.getsize(cache) / 1e6))
+
+    results = {}
+    for edit in sorted(EDITS):
+        shutil.copy(cache, os.path.join(work_dir, edit + ".usdc"))
+        job = {"edit": edit, "output": os.path.join(work_dir, edit + ".usdc"), "models": args.models, "templates": templates}
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--job", json.dumps(job)], universal_newlines=True)
+        results[edit] = json.loads(output.strip().splitlines()[-1])
+
+    print("Peak memory includes the python interpreter and pxr libraries of each process.")
+    for exporter in ["animcache", "rig"]:
+        stage_result = results[exporter + "_stage"]
+        layer_result = results[exporter + "_layer"]
+
+        identical = layers_match(Sdf.Layer.OpenAsAnonymous(os.path.join(work_dir, exporter + "_stage.usdc")), Sdf.Layer.OpenAsAnonymous(os.path.join(work_dir, exporter + "_layer.usdc")))
+
+        print("{0}: stage {1:.3f}s {2:.1f} MB, layer {3:.3f}s {4:.1f} MB, {5:.1f}x faster, identical output: {6}".format(
+            exporter,
+            stage_result["seconds"], stage_result["peak_bytes"] / 1e6,
+            layer_result["seconds"], layer_result["peak_bytes"] / 1e6,
+            stage_result["seconds"] / max(layer_result["seconds"], 1e-9),
+            identical))
+
+
+if __name__ == "__main__":
+    main()
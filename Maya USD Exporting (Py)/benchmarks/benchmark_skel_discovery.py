@@ -0,0 +1,135 @@
+"""
+Benchmarks finding the skel properties and parentConstraint user properties of an exported rig layer, as
+export_usd_rig does before rerouting them, against the previous full layer traversal.
+
+A synthetic rig layer is written with skinned meshes under GEO, parentConstraint prims, and prims outside GEO standing
+in for the rest of the rig. The previous path traverses every spec in the layer and splits each prim's path to find
+GEO. Both paths are checked to find the same properties.
+
+Run with a usd-core or mayapy python:
+
+    python benchmark_skel_discovery.py --models 500 --meshes 40 --constraints 2000 --rigPrims 10000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import maya_standins
+
+from pxr import Sdf
+
+import usd_layer_edits
+import usd_skel_properties
+
+
+def find_skel_properties_traverse(layer, overrideSkelProps=True, overrideSkelConstraints=True):
+    """
+    The previous export_usd_rig discovery, traversing the whole layer.
+    """
+    skelAttributes = {}
+    skelRelationShips = {}
+    skelConstraints = {}
+
+    prim_paths = []
+    layer.Traverse(Sdf.Path.absoluteRootPath, lambda x: prim_paths.append(x) if x.IsPrimPath() and not x.ContainsPrimVariantSelection() else None)
+
+    for prim_path in prim_paths:
+        if len(prim_path.pathString.split("/")) < 3 or prim_path.pathString.split("/")[2] != "GEO":
+            continue
+
+        prim_spec = layer.GetPrimAtPath(prim_path)
+        for attr in prim_spec.attributes:
+            attrType = attr.typeName
+
+            if attr.name.startswith('skel:') or ':skel:' in attr.name and overrideSkelProps:
+                if not skelAttributes.get(prim_path.pathString, None):
+                    skelAttributes[prim_path.pathString] = []
+                skelAttributes[prim_path.pathString] += [(attr.name,attrType, attr.default, prim_path.pathString, usd_layer_edits.get_authored_metadata(attr))]
+
+            elif attr.name.endswith('constraintTarget') and overrideSkelConstraints:
+                parentPath = prim_path.GetParentPath().pathString
+                skelPathAttr = prim_spec.attributes.get("userProperties:skelPath")
+                weightAttr = prim_spec.attributes.get("userProperties:constraintWeight")
+                skelConstraints[parentPath] = [(attr.default, skelPathAttr.default if skelPathAttr else None, weightAttr.default if weightAttr else None, parentPath)]
+
+        if overrideSkelProps:
+            for rel in prim_spec.relationships:
+                if rel.name.startswith('skel:') or ':skel:' in rel.name:
+                    if not skelRelationShips.get(prim_path.pathString, None):
+                        skelRelationShips[prim_path.pathString] = []
+                    skelRelationShips[prim_path.pathString] += [(rel.name, usd_layer_edits.get_targets(rel), prim_path.pathString, usd_layer_edits.get_authored_metadata(rel))]
+
+    return skelAttributes, skelRelationShips, skelConstraints
+
+
+def add_rig_prims(layer, scene, count):
+    """
+    Adds prims outside GEO, a few levels deep under the skeleton group, standing in for the rest of the rig.
+    """
+    parent = Sdf.CreatePrimInLayer(layer, maya_standins.get_sdf_path(scene.skel_root) + "/rig_guts")
+    with Sdf.ChangeBlock():
+        for i in range(count):
+            if i % 10 == 0:
+                group = Sdf.PrimSpec(parent, "group{0}".format(i // 10), Sdf.SpecifierDef, "Xform")
+            prim_spec = Sdf.PrimSpec(group, "node{0}".format(i), Sdf.SpecifierDef, "Xform")
+            Sdf.AttributeSpec(prim_spec, "userProperties:rigNode", Sdf.ValueTypeNames.String).default = "node{0}".format(i)
+    layer.Save()
+
+
+def time_call(function, layer, repeats):
+    """
+    Returns the best time of repeats calls, and the result of the last one.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function(layer)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", type=int, default=500)
+    parser.add_argument("--meshes", type=int, default=40)
+    parser.add_argument("--joints", type=int, default=50)
+    parser.add_argument("--constraints", type=int, default=2000)
+    parser.add_argument("--rigPrims", type=int, default=10000, help="Number of prims outside GEO")
+    parser.add_argument("--points", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="benchmarkSkelDiscovery_")
+    try:
+        scene = maya_standins.SyntheticScene(args.models, args.meshes, joints=args.joints, constraints=args.constraints, referenced=False)
+        filepath = os.path.join(work_dir, "rig.usdc")
+        scene.write_rig_layer(filepath, args.points)
+
+        layer = Sdf.Layer.FindOrOpen(filepath)
+        add_rig_prims(layer, scene, args.rigPrims)
+
+        prims = []
+        layer.Traverse(Sdf.Path.absoluteRootPath, lambda x: prims.append(x) if x.IsPrimPath() else None)
+        print("Rig layer: {0} prims, {1} under GEO".format(len(prims), len([x for x in prims if x.HasPrefix(maya_standins.get_sdf_path(scene.geo))])))
+
+        traverse_seconds, traverse_result = time_call(find_skel_properties_traverse, layer, args.repeats)
+        scoped_seconds, scoped_result = time_call(usd_skel_properties.get_skel_properties, layer, args.repeats)
+
+        identical = all(sorted(a.items()) == sorted(b.items()) for a, b in zip(traverse_result, scoped_result))
+        print("Found {0} prims with skel attributes, {1} with skel relationships, {2} constraints".format(*[len(x) for x in scoped_result]))
+        print("traverse {0:.3f}s, scoped {1:.3f}s, {2:.1f}x faster, identical results: {3}".format(
+            traverse_seconds, scoped_seconds, traverse_seconds / max(scoped_seconds, 1e-9), identical))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Checks reduce_subframe_samples on every kind of xformOp value it measures motion on.
+
+An anonymous layer is written with one prim per xformOp type, sampled every half frame: scalar quaternion orients,
+vector translates, matrix transforms and quaternion arrays, each with a prim that holds still and a prim that moves.
+The still prims should lose their sub-frame samples and the moving prims should keep them. Exits non-zero on a
+failure.
+
+Run with a usd-core or mayapy python:
+
+    python check_adaptive_sampling.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pxr import Gf, Sdf, Vt
+
+import usd_adaptive_sampling
+
+
+FRAMES = 5
+STRIDE = 0.5
+
+# (attribute name, value type, value at a time, scaled by how much the prim moves)
+ATTRIBUTES = [("xformOp:orient", Sdf.ValueTypeNames.Quatf, lambda t, m: Gf.Quatf(Gf.Rotation(Gf.Vec3d(0, 1, 0), 30 * t * m).GetQuat())),
+              ("xformOp:orient", Sdf.ValueTypeNames.Quatd, lambda t, m: Gf.Rotation(Gf.Vec3d(0, 1, 0), 30 * t * m).GetQuat()),
+              ("xformOp:translate", Sdf.ValueTypeNames.Double3, lambda t, m: Gf.Vec3d(t * m, 0, 0)),
+              ("xformOp:transform", Sdf.ValueTypeNames.Matrix4d, lambda t, m: Gf.Matrix4d(1).SetTranslate(Gf.Vec3d(t * m, 0, 0))),
+              ("rotations", Sdf.ValueTypeNames.QuatfArray, lambda t, m: Vt.QuatfArray([Gf.Quatf(Gf.Rotation(Gf.Vec3d(1, 0, 0), 30 * t * m).GetQuat())] * 3))]
+
+
+def write_layer():
+    """
+    Writes a still and a moving prim for each attribute, and returns the layer with the paths expected to be reduced.
+    """
+    layer = Sdf.Layer.CreateAnonymous("adaptiveSampling")
+    times = [1 + i * STRIDE for i in range(int((FRAMES - 1) / STRIDE) + 1)]
+
+    expected = {}
+    for i, (name, valueType, get_value) in enumerate(ATTRIBUTES):
+        for moves in (0, 1):
+            prim_spec = Sdf.CreatePrimInLayer(layer, "/prim{0}_{1}".format(i, "moving" if moves else "still"))
+            prim_spec.specifier = Sdf.SpecifierDef
+            attrSpec = Sdf.AttributeSpec(prim_spec, name, valueType)
+            for time in times:
+                layer.SetTimeSample(attrSpec.path, time, get_value(time, moves))
+            expected[attrSpec.path] = not moves
+
+    return layer, expected
+
+
+def main():
+    layer, expected = write_layer()
+    usd_adaptive_sampling.reduce_subframe_samples(layer, 0.01)
+
+    failed = 0
+    for path, reduced in sorted(expected.items()):
+        subframes = [x for x in layer.ListTimeSamplesForPath(path) if not usd_adaptive_sampling.is_whole_frame(x)]
+        ok = (not subframes) == reduced
+        failed += int(not ok)
+        print("{0:<6} {1} ({2}) kept {3} sub-frame samples".format("ok" if ok else "FAILED", path, layer.GetAttributeAtPath(path).typeName, len(subframes)))
+
+    if failed:
+        print("{0} checks failed".format(failed))
+        sys.exit(1)
+    print("All checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,702 @@
+"""
+Stand-ins for the Maya session the USD exporters run in, so their post-export code can be run and timed with only pxr.
+
+A SyntheticScene describes a character rig: a GEO group of model references, some with a model reference nested in
+them, a skeleton, parentConstraints to its joints, and mayaUsdProxyShapes. In an animcache scene the rig is referenced
+into a shot, and in a rig scene it is the open file. The stand-in cmds, pm, OpenMaya, resolver, shotgun_utils and utils
+answer the queries the exporters make from the scene. The stand-in cmds.file "exports" by copying a layer written
+ahead of time by write_animcache_layer or write_rig_layer, so Maya's own export time isn't part of any result.
+
+install() puts the stand-in maya package in sys.modules, so the helper modules can be imported, and load_exporter()
+runs an exporter snippet with the stand-ins as its globals.
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+import traceback
+import types
+
+import numpy
+
+from pxr import Gf, Sdf, Usd, UsdGeom, UsdSkel, Vt
+
+
+PROJECT_CODE = "bench"
+MAYA_VERSION = "2024"
+RIG_FILEPATH = "/proj/assets/character/hero/rig/hero_rig.mb"
+MODEL_FILEPATH = "/proj/assets/prop/{0}/model/{0}.mb"
+DESCRIPTION_TEMPLATE = "usd_asset_description"
+
+SG_TEMPLATE_MAP = {"Asset": dict((asset_type, {"model": {"model": {"template": "maya_asset_model"}},
+                                               "default": {"default": {"template": "maya_asset_default"}},
+                                               "surfacing": {"surfacing": {"template": "usd_asset_surfacing"},
+                                                             "lookdev": {"template": "usd_asset_lookdev"}},
+                                               "description": {"description": {"template": DESCRIPTION_TEMPLATE}}})
+                                 for asset_type in ("character", "prop"))}
+
+
+class SyntheticScene():
+    """
+    A synthetic rig scene. Nodes are long DAG names, and every node is a transform.
+
+    :param models:          Number of model references under GEO.
+    :param meshes:          Number of meshes in each model.
+    :param nested:          Every nested'th model has a model reference nested in it. 0 nests none.
+    :param joints:          Number of joints in the skeleton. 0 exports no skeleton.
+    :param constraints:     Number of meshes parentConstrained to a joint.
+    :param proxies:         Number of mayaUsdProxyShapes under GEO.
+    :param referenced:      If True, the rig is referenced into a shot under the char namespace, as for animcaches.
+    """
+    def __init__(self, models, meshes, nested=0, joints=0, constraints=0, proxies=0, referenced=True):
+        self.models = models
+        self.meshes = meshes
+        self.joints = joints
+        self.referenced = referenced
+
+        self.ns = "char:" if referenced else ""
+        self.root = "|" + self.ns + "rig_GRP"
+        self.geo = self.root + "|" + self.ns + "GEO"
+        self.controls = self.root + "|" + self.ns + "CONTROLS"
+        self.skel_root = self.root + "|" + self.ns + "skel_GRP"
+
+        self.nodes = []
+        self.ref_members = {}
+        self.ref_filepaths = {}
+        self.ref_parents = {}
+        self.ref_children = {}
+
+        # Model prim paths, as exported with stripNamespaces, and the mesh prim paths in each model
+        self.model_paths = []
+        self.mesh_paths = []
+
+        rig_ref = None
+        if referenced:
+            rig_ref = self._add_reference("charRN", RIG_FILEPATH, None)
+
+        for node in [self.root, self.controls, self.geo, self.skel_root]:
+            self._add_node(node, rig_ref)
+
+        self.joint_nodes = []
+        self.joint_paths = {}
+        for k in range(joints):
+            joint = self.skel_root + "|" + self.ns + "root" + ("" if k == 0 else "|" + self.ns + "joint{0}".format(k))
+            self._add_node(joint, rig_ref)
+            self.joint_nodes.append(joint)
+            self.joint_paths[joint] = "root" if k == 0 else "root/joint{0}".format(k)
+
+        for i in range(models):
+            name = "model{0:04d}".format(i)
+            model_ns = self.ns + "m{0:04d}".format(i)
+            model_ref = self._add_reference(model_ns + "RN", MODEL_FILEPATH.format(name), rig_ref)
+            model_node = self.geo + "|" + model_ns + ":" + name
+            self._add_model(model_node, model_ns, model_ref)
+
+            if nested and i % nested == 0:
+                nested_name = "nested{0:04d}".format(i)
+                nested_ns = model_ns + ":n"
+                nested_ref = self._add_reference(nested_ns + "RN", MODEL_FILEPATH.format(nested_name), model_ref)
+                self._add_model(model_node + "|" + nested_ns + ":" + nested_name, nested_ns, nested_ref)
+
+        # Constraint nodes are children of the mesh transforms they constrain, and come from the rig
+        self.constraints = {}
+        for c in range(min(constraints, len(self.mesh_paths))) if joints else []:
+            mesh_node = self.mesh_paths[c][1]
+            constraint = mesh_node + "|" + self.ns + "{0}_parentConstraint1".format(mesh_node.split(":")[-1])
+            self._add_node(constraint, rig_ref)
+            self.constraints[constraint] = self.joint_nodes[c % joints]
+
+        self.proxies = []
+        for p in range(proxies):
+            proxy = self.geo + "|" + self.ns + "proxy{0}".format(p)
+            self._add_node(proxy, rig_ref)
+            self.proxies.append(proxy + "|" + self.ns + "proxy{0}Shape".format(p))
+
+        self.uuids = dict((node, "UUID-{0}".format(i)) for i, node in enumerate(self.nodes))
+        self.uuid_nodes = dict((uuid, node) for node, uuid in self.uuids.items())
+        self.node_refs = {}
+        for refNode, members in self.ref_members.items():
+            for node in members:
+                self.node_refs[node] = refNode
+
+        self.layer_filepath = None
+        self.description_filepath = None
+
+    def _add_reference(self, refNode, filepath, parent):
+        self.ref_members[refNode] = []
+        self.ref_filepaths[refNode] = filepath
+        self.ref_parents[refNode] = parent
+        self.ref_children[refNode] = []
+        if parent:
+            self.ref_children[parent].append(refNode)
+        return refNode
+
+    def _add_node(self, node, refNode):
+        self.nodes.append(node)
+        if refNode:
+            self.ref_members[refNode].append(node)
+
+    def _add_model(self, model_node, model_ns, model_ref):
+        self._add_node(model_node, model_ref)
+        self.model_paths.append(get_sdf_path(model_node))
+        for j in range(self.meshes):
+            mesh_node = model_node + "|" + model_ns + ":mesh{0}".format(j)
+            self._add_node(mesh_node, model_ref)
+            self.mesh_paths.append((get_sdf_path(mesh_node), mesh_node))
+
+    def get_references(self, parent=None, recursive=False):
+        """
+        Returns reference nodes, parents before their children.
+        """
+        refNodes = [x for x in self.ref_members if self.ref_parents[x] == parent]
+        if recursive:
+            for refNode in list(refNodes):
+                refNodes += self.get_references(refNode, True)
+        return refNodes
+
+    def write_description(self, filepath, points=100):
+        """
+        Writes the description layer the mayaUsdProxyShapes point at.
+        """
+        layer = Sdf.Layer.CreateNew(filepath)
+        with Sdf.ChangeBlock():
+            mesh = Sdf.CreatePrimInLayer(layer, "/asset/geo/mesh")
+            for prim_spec in [layer.GetPrimAtPath("/asset"), layer.GetPrimAtPath("/asset/geo"), mesh]:
+                prim_spec.specifier = Sdf.SpecifierDef
+                prim_spec.typeName = "Xform"
+            mesh.typeName = "Mesh"
+            Sdf.AttributeSpec(mesh, "points", Sdf.ValueTypeNames.Point3fArray).default = get_points(points)
+        layer.defaultPrim = "asset"
+        layer.Save()
+        self.description_filepath = filepath
+
+    def _write_hierarchy(self, layer, points, frames):
+        """
+        Writes the rig prims, models and meshes. Meshes are animated if frames is set, half of them moving.
+        """
+        for node in [self.root, self.controls, self.geo]:
+            _define(layer, get_sdf_path(node), "Xform")
+
+        for i, path in enumerate(self.model_paths):
+            prim_spec = _define(layer, path, "Xform")
+            Sdf.AttributeSpec(prim_spec, "xformOp:translate", Sdf.ValueTypeNames.Double3).default = Gf.Vec3d(i, 0, 0)
+            Sdf.AttributeSpec(prim_spec, "xformOpOrder", Sdf.ValueTypeNames.TokenArray, Sdf.VariabilityUniform).default = ["xformOp:translate"]
+
+        counts = Vt.IntArray([4] * (points // 4))
+        indices = Vt.IntArray(list(range((points // 4) * 4)))
+        for m, (path, node) in enumerate(self.mesh_paths):
+            prim_spec = _define(layer, path, "Mesh")
+            Sdf.AttributeSpec(prim_spec, "faceVertexCounts", Sdf.ValueTypeNames.IntArray).default = counts
+            Sdf.AttributeSpec(prim_spec, "faceVertexIndices", Sdf.ValueTypeNames.IntArray).default = indices
+            pointsSpec = Sdf.AttributeSpec(prim_spec, "points", Sdf.ValueTypeNames.Point3fArray)
+            normalsSpec = Sdf.AttributeSpec(prim_spec, "normals", Sdf.ValueTypeNames.Normal3fArray)
+            normalsSpec.SetInfo("interpolation", UsdGeom.Tokens.vertex)
+
+            base = numpy.random.rand(points, 3).astype(numpy.float32)
+            normals = Vt.Vec3fArray.FromNumpy(numpy.random.rand(points, 3).astype(numpy.float32))
+            if not frames:
+                pointsSpec.default = Vt.Vec3fArray.FromNumpy(base)
+                normalsSpec.default = normals
+                continue
+
+            for frame in range(1, frames + 1):
+                offset = numpy.float32(0.01 * frame if m % 2 else 0.0)
+                layer.SetTimeSample(pointsSpec.path, frame, Vt.Vec3fArray.FromNumpy(base + offset))
+                layer.SetTimeSample(normalsSpec.path, frame, normals)
+
+    def _write_skeleton(self, layer, frames):
+        """
+        Writes the skeleton, and a skel animation if frames is set. Half of the joints move.
+        """
+        if not self.joints:
+            return None
+
+        skel_root = _define(layer, get_sdf_path(self.skel_root), "SkelRoot")
+        skeleton = _define(layer, skel_root.path.AppendChild("skeleton"), "Skeleton")
+        joints = [self.joint_paths[x] for x in self.joint_nodes]
+        rest = Vt.Matrix4dArray([Gf.Matrix4d(1).SetTranslate(Gf.Vec3d(0, k, 0)) for k in range(self.joints)])
+        Sdf.AttributeSpec(skeleton, "joints", Sdf.ValueTypeNames.TokenArray, Sdf.VariabilityUniform).default = joints
+        Sdf.AttributeSpec(skeleton, "restTransforms", Sdf.ValueTypeNames.Matrix4dArray, Sdf.VariabilityUniform).default = rest
+        Sdf.AttributeSpec(skeleton, "bindTransforms", Sdf.ValueTypeNames.Matrix4dArray, Sdf.VariabilityUniform).default = rest
+
+        if frames:
+            anim = _define(layer, skeleton.path.AppendChild("anim"), "SkelAnimation")
+            Sdf.AttributeSpec(anim, "joints", Sdf.ValueTypeNames.TokenArray, Sdf.VariabilityUniform).default = joints
+            channels = [Sdf.AttributeSpec(anim, name, typeName) for name, typeName in
+                        [("translations", Sdf.ValueTypeNames.Float3Array), ("rotations", Sdf.ValueTypeNames.QuatfArray), ("scales", Sdf.ValueTypeNames.Half3Array)]]
+            moving = numpy.arange(self.joints) % 2 == 1
+            for frame in range(1, frames + 1):
+                angle = numpy.where(moving, 0.05 * frame, 0.0)
+                translations = numpy.stack([numpy.zeros(self.joints), numpy.arange(self.joints), angle], axis=-1).astype(numpy.float32)
+                rotations = numpy.stack([numpy.sin(angle / 2), numpy.zeros(self.joints), numpy.zeros(self.joints), numpy.cos(angle / 2)], axis=-1).astype(numpy.float32)
+                layer.SetTimeSample(channels[0].path, frame, Vt.Vec3fArray.FromNumpy(translations))
+                layer.SetTimeSample(channels[1].path, frame, Vt.QuatfArray.FromNumpy(rotations))
+                layer.SetTimeSample(channels[2].path, frame, Vt.Vec3hArray([Gf.Vec3h(1, 1, 1)] * self.joints))
+
+            rel = Sdf.RelationshipSpec(skeleton, UsdSkel.Tokens.skelAnimationSource, False)
+            rel.targetPathList.prependedItems.append(anim.path)
+
+        return skeleton
+
+    def write_animcache_layer(self, filepath, frames, points):
+        """
+        Writes the layer the stand-in cmds.file copies for an animcache export.
+        """
+        layer = Sdf.Layer.CreateNew(filepath)
+        layer.startTimeCode = 1
+        layer.endTimeCode = frames
+        with Sdf.ChangeBlock():
+            self._write_hierarchy(layer, points, frames)
+            self._write_skeleton(layer, frames)
+        layer.defaultPrim = self.root.split("|")[-1]
+        layer.Save()
+        self.layer_filepath = filepath
+
+    def write_rig_layer(self, filepath, points):
+        """
+        Writes the layer the stand-in cmds.file copies for a rig export: static meshes skinned to the skeleton, and a
+        prim with the user properties of each parentConstraint.
+        """
+        layer = Sdf.Layer.CreateNew(filepath)
+        with Sdf.ChangeBlock():
+            self._write_hierarchy(layer, points, 0)
+            skeleton = self._write_skeleton(layer, 0)
+
+            for m, (path, node) in enumerate(self.mesh_paths if skeleton else []):
+                prim_spec = layer.GetPrimAtPath(path)
+                prim_spec.SetInfo("apiSchemas", Sdf.TokenListOp.Create(prependedItems=["SkelBindingAPI"]))
+                indices = Sdf.AttributeSpec(prim_spec, "primvars:skel:jointIndices", Sdf.ValueTypeNames.IntArray)
+                indices.default = Vt.IntArray([m % self.joints] * points)
+                indices.SetInfo("interpolation", UsdGeom.Tokens.vertex)
+                indices.SetInfo("elementSize", 1)
+                weights = Sdf.AttributeSpec(prim_spec, "primvars:skel:jointWeights", Sdf.ValueTypeNames.FloatArray)
+                weights.default = Vt.FloatArray([1.0] * points)
+                weights.SetInfo("interpolation", UsdGeom.Tokens.vertex)
+                weights.SetInfo("elementSize", 1)
+                rel = Sdf.RelationshipSpec(prim_spec, UsdSkel.Tokens.skelSkeleton, False)
+                rel.targetPathList.prependedItems.append(skeleton.path)
+
+            for constraint, joint in self.constraints.items():
+                prim_spec = _define(layer, get_sdf_path(constraint), "")
+                for name, typeName, value in [("constraintTarget", Sdf.ValueTypeNames.String, self.joint_paths[joint]),
+                                              ("skelPath", Sdf.ValueTypeNames.String, str(skeleton.path)),
+                                              ("constraintWeight", Sdf.ValueTypeNames.Double, 1.0)]:
+                    Sdf.AttributeSpec(prim_spec, "userProperties:" + name, typeName).default = value
+
+        layer.defaultPrim = self.root.split("|")[-1]
+        layer.Save()
+        self.layer_filepath = filepath
+
+
+def get_points(points):
+    """
+    Returns random points, so the crate file can't deduplicate them.
+    """
+    return Vt.Vec3fArray.FromNumpy(numpy.random.rand(points, 3).astype(numpy.float32))
+
+
+def get_sdf_path(dag_path):
+    """
+    Converts a long DAG path to the prim path it's exported to with stripNamespaces.
+    """
+    return "/".join([x.split(":")[-1] for x in dag_path.split("|")])
+
+
+def _define(layer, path, typeName):
+    """
+    Defines a prim spec and its ancestors.
+    """
+    prim_spec = Sdf.CreatePrimInLayer(layer, path)
+    prim_spec.specifier = Sdf.SpecifierDef
+    if typeName:
+        prim_spec.typeName = typeName
+    return prim_spec
+
+
+class StandInCmds():
+    """
+    Stand-in for maya.cmds, answering the queries the exporters make from the current SyntheticScene.
+    """
+    def __init__(self):
+        self.scene = None
+
+    def about(self, version=False):
+        return MAYA_VERSION
+
+    def select(self, *args, **kwargs):
+        pass
+
+    def addAttr(self, *args, **kwargs):
+        pass
+
+    def setAttr(self, *args, **kwargs):
+        pass
+
+    def deleteAttr(self, *args, **kwargs):
+        pass
+
+    def parent(self, *args, **kwargs):
+        pass
+
+    def group(self, empty=False, world=False, name=""):
+        return name
+
+    def delete(self, *args, **kwargs):
+        pass
+
+    def objectType(self, node):
+        return "joint" if node in self.scene.joint_paths else "transform"
+
+    def ls(self, *args, **kwargs):
+        if kwargs.get("uuid"):
+            return [self.scene.uuids[args[0]]]
+        if kwargs.get("type") == "parentConstraint":
+            return list(self.scene.constraints)
+        if kwargs.get("type") == "reference":
+            return list(self.scene.ref_members)
+        return [self.scene.uuid_nodes.get(args[0], args[0])]
+
+    def referenceQuery(self, node, **kwargs):
+        scene = self.scene
+        if kwargs.get("isNodeReferenced") or kwargs.get("inr"):
+            return node in scene.node_refs
+        if kwargs.get("child"):
+            return scene.ref_children[node]
+        if kwargs.get("parent"):
+            return scene.ref_parents[node]
+        if kwargs.get("filename"):
+            return scene.ref_filepaths[scene.node_refs.get(node, node)]
+
+        refNode = scene.node_refs[node]
+        while kwargs.get("topReference") and scene.ref_parents[refNode]:
+            refNode = scene.ref_parents[refNode]
+        return refNode
+
+    def listRelatives(self, node, **kwargs):
+        if kwargs.get("type") == "mayaUsdProxyShape":
+            return list(self.scene.proxies)
+        if kwargs.get("parent"):
+            return ["|".join(node.split("|")[:-1])]
+        return [x for x in self.scene.nodes if x.startswith(node + "|")]
+
+    def parentConstraint(self, constraint, q=False, targetList=False, weightAliasList=False):
+        if targetList:
+            return [self.scene.constraints[constraint]]
+        return ["w0"]
+
+    def getAttr(self, plug):
+        if plug.endswith(".filePath"):
+            return self.scene.description_filepath
+        if plug.endswith(".descriptionUri"):
+            return "tank:/{0}/{1}?Asset=proxy".format(PROJECT_CODE, DESCRIPTION_TEMPLATE)
+        return 1.0
+
+    def file(self, filepath, **kwargs):
+        shutil.copyfile(self.scene.layer_filepath, filepath)
+        return filepath
+
+
+class StandInFileReference():
+    """
+    Stand-in for pymel's FileReference.
+    """
+    def __init__(self, scene, refNode):
+        self.refNode = refNode
+        self.path = scene.ref_filepaths[refNode]
+
+
+class StandInPm():
+    """
+    Stand-in for pymel.core.
+    """
+    def __init__(self, cmds):
+        self.cmds = cmds
+
+    def PyNode(self, name):
+        return name
+
+    def referenceQuery(self, node, filename=False):
+        return self.cmds.referenceQuery(node, filename=True)
+
+    def listReferences(self, parentReference=None, recursive=False):
+        scene = self.cmds.scene
+        parent = None
+        if parentReference:
+            parent = [x for x in scene.ref_filepaths if scene.ref_filepaths[x] == parentReference][0]
+        return [StandInFileReference(scene, x) for x in scene.get_references(parent, recursive)]
+
+
+class _MObject():
+    def __init__(self, name):
+        self.name = name
+
+    def hasFn(self, fnType):
+        if fnType == _MFN.kJoint:
+            return self.name in cmds.scene.joint_paths
+        if fnType == _MFN.kParentConstraint:
+            return self.name in cmds.scene.constraints
+        return True
+
+
+class _MPlug():
+    """
+    Stand-in for the plugs of a parentConstraint's target array. Every constraint has one target, its joint.
+    """
+    def __init__(self, node, attr, source=None):
+        self.node_name = node
+        self.attr = attr
+        self.source_name = source
+        self.isNull = node is None
+
+    def getExistingArrayAttributeIndices(self):
+        return [0]
+
+    def elementByLogicalIndex(self, i):
+        return _MPlug(self.node_name, self.attr + "[{0}]".format(i))
+
+    def child(self, attr):
+        source = cmds.scene.constraints[self.node_name] if attr == "targetParentMatrix" else None
+        return _MPlug(self.node_name, self.attr + "." + attr, source)
+
+    def source(self):
+        return _MPlug(self.source_name, "parentMatrix")
+
+    def node(self):
+        return _MObject(self.node_name)
+
+    def asDouble(self):
+        return cmds.getAttr(self.node_name + "." + self.attr)
+
+
+class _MFnDependencyNode():
+    def __init__(self, obj):
+        self.name = obj.name
+
+    def findPlug(self, attr, wantNetworkedPlug):
+        return _MPlug(self.name, attr)
+
+    def attribute(self, attr):
+        return attr
+
+
+class _MFnDagNode(_MFnDependencyNode):
+    def partialPathName(self):
+        # get_joint_path_string's stand-in takes the long name
+        return self.name
+
+
+_MFN = types.SimpleNamespace(kTransform=0, kParentConstraint=1, kJoint=2)
+
+
+class _MObjectHandle():
+    def __init__(self, obj):
+        self.obj = obj
+
+    def hashCode(self):
+        return hash(self.obj.name)
+
+
+class _MDagPath():
+    def __init__(self, other=None):
+        self.path = other.path if isinstance(other, _MDagPath) else (other or "")
+
+    def pop(self):
+        self.path = "|".join(self.path.split("|")[:-1])
+        return self
+
+    def length(self):
+        return len(self.path.split("|")) - 1
+
+    def node(self):
+        return _MObject(self.path)
+
+    def isInstanced(self):
+        return False
+
+    def fullPathName(self):
+        return self.path
+
+
+class _MSelectionList():
+    def __init__(self):
+        self.items = []
+
+    def add(self, name):
+        self.items.append(name)
+
+    def getDependNode(self, i):
+        return _MObject(self.items[i])
+
+    def getDagPath(self, i):
+        return _MDagPath(self.items[i])
+
+
+def _make_openmaya(cmds):
+    """
+    Makes a stand-in maya.api.OpenMaya module with the classes maya_reference_index and maya_joint_constraints use.
+    """
+    om = types.ModuleType("maya.api.OpenMaya")
+
+    class MFnReference():
+        def __init__(self, obj):
+            self.refNode = obj.name
+
+        def nodes(self):
+            return [_MObject(x) for x in cmds.scene.ref_members[self.refNode]]
+
+    class MItDag():
+        kDepthFirst = 0
+
+        def __init__(self, traversal=0, filterType=0):
+            self.reset(None)
+
+        def reset(self, root, traversal=0, filterType=0):
+            nodes = cmds.scene.nodes
+            if root is not None:
+                nodes = [x for x in nodes if x == root.path or x.startswith(root.path + "|")]
+            if filterType == _MFN.kParentConstraint:
+                nodes = [x for x in nodes if x in cmds.scene.constraints]
+            self.nodes = nodes
+            self.i = 0
+
+        def isDone(self):
+            return self.i >= len(self.nodes)
+
+        def next(self):
+            self.i += 1
+
+        def getPath(self):
+            return _MDagPath(self.nodes[self.i])
+
+        def currentItem(self):
+            return _MObject(self.nodes[self.i])
+
+        def fullPathName(self):
+            return self.nodes[self.i]
+
+    om.MFn = _MFN
+    om.MFnDependencyNode = _MFnDependencyNode
+    om.MFnDagNode = _MFnDagNode
+    om.MFnReference = MFnReference
+    om.MItDag = MItDag
+    om.MDagPath = _MDagPath
+    om.MObjectHandle = _MObjectHandle
+    om.MSelectionList = _MSelectionList
+    return om
+
+
+cmds = StandInCmds()
+pm = StandInPm(cmds)
+
+
+def install(scene):
+    """
+    Makes scene the current scene, and puts the stand-in maya package in sys.modules.
+    """
+    cmds.scene = scene
+
+    if "maya" not in sys.modules:
+        maya = types.ModuleType("maya")
+        maya.cmds = cmds
+        maya.api = types.ModuleType("maya.api")
+        maya.api.OpenMaya = _make_openmaya(cmds)
+        sys.modules.update({"maya": maya, "maya.cmds": cmds, "maya.api": maya.api, "maya.api.OpenMaya": maya.api.OpenMaya})
+
+
+def _get_root_reference_node(node):
+    return "|" + node.split("|")[1]
+
+
+@contextlib.contextmanager
+def _maya_keep_parent(node):
+    yield node
+
+
+def _filepath_to_fields(filepath):
+    parts = filepath.split("/")
+    return {"asset_type": parts[3], "Asset": parts[4]}
+
+
+class TankError(Exception):
+    pass
+
+
+def get_globals():
+    """
+    Returns the globals the exporter snippets expect, with the stand-ins in place of Maya and ShotGrid.
+    """
+    # Imported here, as they import maya themselves
+    import maya_joint_constraints
+    import maya_reference_index
+    import usd_adaptive_sampling
+    import usd_batch_export
+    import usd_chunked_export
+    import usd_edit_session
+    import usd_export_cache
+    import usd_frame_hold
+    import usd_layer_edits
+    import usd_memory_profile
+    import usd_payload_split
+    import usd_point_reduction
+    import usd_proxy_cache
+    import usd_ref_primvars
+    import usd_rigid_motion
+    import usd_sample_compaction
+    import usd_skel_properties
+    import usd_skel_reduction
+    import usd_template_uris
+
+    noop = lambda *args, **kwargs: None
+    scene_cmds = cmds
+
+    return {"cmds": cmds,
+            "pm": pm,
+            "utils": types.SimpleNamespace(get_root_reference_node=_get_root_reference_node, maya_keep_parent=_maya_keep_parent),
+            "usd_utils": types.SimpleNamespace(SG_TEMPLATE_MAP=SG_TEMPLATE_MAP),
+            "resolver": types.SimpleNamespace(filepath_to_fields=_filepath_to_fields),
+            "shotgun_utils": types.SimpleNamespace(get_project_code=lambda: PROJECT_CODE),
+            "create_usd_user_properties": noop,
+            "delete_usd_user_properties": noop,
+            "change_to_uris": noop,
+            "get_joint_path_string": lambda joint: scene_cmds.scene.joint_paths[joint],
+            "get_skel_path_string": lambda root, node: get_sdf_path(scene_cmds.scene.skel_root) + "/skeleton",
+            "RIG_USD_TEMPLATE_NAME": "usd_rig",
+            "ASSET_DESCRIPTION_TEMPLATE_NAME": DESCRIPTION_TEMPLATE,
+            "TankError": TankError,
+            "traceback": traceback,
+            "contextlib": contextlib,
+            "Sdf": Sdf, "Usd": Usd, "UsdGeom": UsdGeom, "UsdSkel": UsdSkel,
+            "maya_joint_constraints": maya_joint_constraints,
+            "maya_reference_index": maya_reference_index,
+            "usd_adaptive_sampling": usd_adaptive_sampling,
+            "usd_batch_export": usd_batch_export,
+            "usd_chunked_export": usd_chunked_export,
+            "usd_edit_session": usd_edit_session,
+            "usd_export_cache": usd_export_cache,
+            "usd_frame_hold": usd_frame_hold,
+            "usd_layer_edits": usd_layer_edits,
+            "usd_memory_profile": usd_memory_profile,
+            "usd_payload_split": usd_payload_split,
+            "usd_point_reduction": usd_point_reduction,
+            "usd_proxy_cache": usd_proxy_cache,
+            "usd_ref_primvars": usd_ref_primvars,
+            "usd_rigid_motion": usd_rigid_motion,
+            "usd_sample_compaction": usd_sample_compaction,
+            "usd_skel_properties": usd_skel_properties,
+            "usd_skel_reduction": usd_skel_reduction,
+            "usd_template_uris": usd_template_uris}
+
+
+def load_exporter(filename):
+    """
+    Runs an exporter snippet from the Maya USD Exporting folder with the stand-in globals.
+
+    :param filename:    The snippet's file name, eg. MayaUSDAnimcacheExport.py
+    :return:            Dict of the snippet's globals, with its functions in it.
+    """
+    filepath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), filename)
+    namespace = get_globals()
+    with open(filepath) as f:
+        exec(compile(f.read(), filepath, "exec"), namespace)
+    return namespace
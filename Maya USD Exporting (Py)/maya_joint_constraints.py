@@ -0,0 +1,82 @@
+"""
+Joint parentConstraint discovery for rig exports.
+
+export_usd_rig turns parentConstraints to a single joint into rigid skins. Finding them with cmds lists every
+parentConstraint in the scene, then queries each one's targets, target type and weight alias separately, so scenes
+with many rigs make thousands of queries for constraints that aren't exported. This walks only the exported DAG
+hierarchy with an OpenMaya iterator, and reads each constraint's target and weight straight from its plugs.
+
+A constraint's targets are the nodes connected to the targetParentMatrix of its target array, as
+cmds.parentConstraint(targetList=True) finds them. Its weight is the weight alias attribute driving the first
+target's targetWeight, or targetWeight itself if nothing drives it.
+"""
+
+from maya.api import OpenMaya as om
+
+import maya_reference_index
+
+
+TARGET_ATTR = "target"
+TARGET_PARENT_MATRIX_ATTR = "targetParentMatrix"
+TARGET_WEIGHT_ATTR = "targetWeight"
+
+
+def _get_targets(fn):
+    """
+    Returns the connected target plugs of a constraint, as (target node MObject, targetWeight MPlug) tuples.
+    """
+    targetPlug = fn.findPlug(TARGET_ATTR, False)
+    parentMatrixAttr = fn.attribute(TARGET_PARENT_MATRIX_ATTR)
+    weightAttr = fn.attribute(TARGET_WEIGHT_ATTR)
+
+    targets = []
+    for i in targetPlug.getExistingArrayAttributeIndices():
+        element = targetPlug.elementByLogicalIndex(i)
+        source = element.child(parentMatrixAttr).source()
+        if not source.isNull:
+            targets.append((source.node(), element.child(weightAttr)))
+
+    return targets
+
+
+def _get_weight(weightPlug):
+    """
+    Returns the weight of a constraint target, from the weight alias attribute driving it if there is one.
+    """
+    source = weightPlug.source()
+    return (weightPlug if source.isNull else source).asDouble()
+
+
+def find_joint_constraints(root):
+    """
+    Finds the parentConstraints under a DAG node that have a single target, which is a joint.
+
+    :param root:    The DAG node to search under, eg. the exported node.
+    :return:        List of dicts with the constraint's "dag_path", the "sdf_path" it's exported to, its target "joint"
+                    name, as cmds.parentConstraint(targetList=True) returns it, and the target's "weight".
+    """
+    selection = om.MSelectionList()
+    selection.add(root)
+
+    iterator = om.MItDag(om.MItDag.kDepthFirst, om.MFn.kParentConstraint)
+    iterator.reset(selection.getDagPath(0), om.MItDag.kDepthFirst, om.MFn.kParentConstraint)
+
+    constraints = []
+    numConstraints = 0
+    while not iterator.isDone():
+        numConstraints += 1
+        targets = _get_targets(om.MFnDependencyNode(iterator.currentItem()))
+
+        if len(targets) == 1 and targets[0][0].hasFn(om.MFn.kJoint):
+            joint, weightPlug = targets[0]
+            dag_path = iterator.fullPathName()
+            constraints.append({"dag_path": dag_path,
+                                "sdf_path": maya_reference_index.get_sdf_path(dag_path),
+                                "joint": om.MFnDagNode(joint).partialPathName(),
+                                "weight": _get_weight(weightPlug)})
+
+        iterator.next()
+
+    print("Found {0} joint parentConstraints of {1} parentConstraints under {2}".format(len(constraints), numConstraints, root))
+
+    return constraints
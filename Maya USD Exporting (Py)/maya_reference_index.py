@@ -0,0 +1,112 @@
+"""
+Reference topology index for USD exports.
+
+Both exporters need the top transform of each model reference, and the prim path it was exported to. Finding it one
+reference at a time takes several cmds queries per node of every reference. The index reads the members of each
+reference once, walks the exported DAG hierarchy once with an OpenMaya iterator, and records for every reference its
+root DAG path, its namespace stripped SDF path and the reference it is parented under.
+
+A reference's top transform is the first transform of the reference whose parent isn't in the same reference.
+Instanced transforms are skipped, as they have no single path.
+"""
+
+from maya import cmds
+from maya.api import OpenMaya as om
+
+
+IGNORED_REFERENCE_NODES = ("sharedReferenceNode", "_UNKNOWN_REF_NODE_")
+
+
+def get_sdf_path(dag_path):
+    """
+    Converts a long DAG path to the SDF path it's exported to with stripNamespaces, eg. |ns:rig|ns:geo to /rig/geo.
+    """
+    return "/".join([x.split(":")[-1] for x in dag_path.split("|")])
+
+
+def get_reference_nodes(root=None):
+    """
+    Finds the reference nodes an index needs, parents before their children.
+
+    :param root:    The DAG node the index is built under. If it is referenced, only its reference and the references
+                    nested in it are returned. Otherwise every reference in the scene is.
+    :return:        List of reference node names.
+    """
+    if root and cmds.referenceQuery(root, isNodeReferenced=True):
+        refNodes = [cmds.referenceQuery(root, referenceNode=True, topReference=True)]
+    else:
+        refNodes = [x for x in cmds.ls(type="reference") if x not in IGNORED_REFERENCE_NODES and
+                    not cmds.referenceQuery(x, referenceNode=True, parent=True)]
+
+    i = 0
+    while i < len(refNodes):
+        refNodes += cmds.referenceQuery(refNodes[i], child=True, referenceNode=True) or []
+        i += 1
+
+    return refNodes
+
+
+def _get_dependency_node(name):
+    """
+    Returns the MObject of a node by name.
+    """
+    selection = om.MSelectionList()
+    selection.add(name)
+    return selection.getDependNode(0)
+
+
+def _get_reference_members(refNodes):
+    """
+    Maps every node of the references to the reference node it's from. References are read parents first, so nodes
+    of nested references end up mapped to the innermost reference.
+
+    :return:    Dict of MObjectHandle hash code to reference node name.
+    """
+    members = {}
+    for refNode in refNodes:
+        for obj in om.MFnReference(_get_dependency_node(refNode)).nodes():
+            members[om.MObjectHandle(obj).hashCode()] = refNode
+
+    return members
+
+
+def build_reference_index(root=None):
+    """
+    Builds an index of the references under a DAG node.
+
+    :param root:    The DAG node to index the references under. If None, the whole scene is indexed.
+    :return:        Dict of reference node name to dict with the reference's "filepath" (without copy number),
+                    "dag_path" of its top transform, "sdf_path" of that transform after stripping namespaces, and
+                    "parent" reference node of the top transform, or None.
+    """
+    refNodes = get_reference_nodes(root)
+    members = _get_reference_members(refNodes)
+
+    iterator = om.MItDag(om.MItDag.kDepthFirst, om.MFn.kTransform)
+    if root:
+        selection = om.MSelectionList()
+        selection.add(root)
+        iterator.reset(selection.getDagPath(0), om.MItDag.kDepthFirst, om.MFn.kTransform)
+
+    index = {}
+    while not iterator.isDone():
+        dagPath = iterator.getPath()
+        refNode = members.get(om.MObjectHandle(dagPath.node()).hashCode())
+
+        if refNode and refNode not in index and not dagPath.isInstanced():
+            parentPath = om.MDagPath(dagPath)
+            parentPath.pop()
+            parentRefNode = members.get(om.MObjectHandle(parentPath.node()).hashCode()) if parentPath.length() > 0 else None
+
+            if parentRefNode != refNode:
+                dag_path = dagPath.fullPathName()
+                index[refNode] = {"filepath": cmds.referenceQuery(refNode, filename=True, withoutCopyNumber=True),
+                                  "dag_path": dag_path,
+                                  "sdf_path": get_sdf_path(dag_path),
+                                  "parent": parentRefNode}
+
+        iterator.next()
+
+    print("Indexed {0} references in {1} reference nodes".format(len(index), len(refNodes)))
+
+    return index
@@ -0,0 +1,201 @@
+"""
+Adaptive sub-frame sampling for motion-blurred animcaches.
+
+Animcaches for motion blur are exported at a sub-frame stride, which multiplies the samples of every prim, including
+prims that are barely moving. This pass looks at how far each prim's points and transforms move between whole frames,
+and drops the sub-frame samples of every frame the prim doesn't move more than a tolerance in. Between whole frames
+those prims are then linearly interpolated, which isn't visible in blur, while fast moving prims keep every sample.
+
+Motion is measured on each prim's own local values. A static mesh under a moving transform keeps its points samples
+on whole frames only, as the blur comes from the transform above it.
+
+Only the attributes motion is measured on lose every sub-frame sample in a static frame. Other attributes, eg.
+visibility or primvars, can change inside a frame the prim doesn't move in, so they only lose sub-frame samples that
+sit in a run of the same value.
+"""
+
+import math
+
+import numpy as np
+
+from pxr import Gf, Sdf
+
+import usd_frame_hold
+import usd_sample_compaction
+
+
+# Attributes that move a prim: mesh points, skel animation and blend shape weights. xformOps are checked by prefix.
+MOTION_ATTRS = ("points", "translations", "rotations", "scales", "blendShapeWeights")
+XFORM_ATTR_PREFIX = "xformOp:"
+
+# Tolerance for float time codes landing on whole frames, eg. after a 0.1 stride
+FRAME_EPSILON = 1e-6
+
+
+def is_motion_attribute(name):
+    """
+    Returns True if the attribute moves its prim.
+    """
+    return name in MOTION_ATTRS or name.startswith(XFORM_ATTR_PREFIX)
+
+
+def get_motion(a, b):
+    """
+    Measures how far a value moves between two samples.
+
+    For point and vector arrays this is the furthest any one element moves. xformOp rotations are in degrees, and
+    quaternions, eg. skel rotations or an xformOp:orient, are compared by component.
+
+    :param a:   The first sample value.
+    :param b:   The second sample value.
+    :return:    The distance moved, or infinity if the values can't be compared, eg. a topology change.
+    """
+    try:
+        a = _to_array(a)
+        b = _to_array(b)
+    except (TypeError, ValueError):
+        return math.inf
+
+    if a.shape != b.shape:
+        return math.inf
+    if a.size == 0:
+        return 0.0
+    if a.ndim == 0:
+        return float(abs(b - a))
+
+    diff = (b - a).reshape(-1, a.shape[-1])
+    return float(np.sqrt((diff * diff).sum(axis=-1)).max())
+
+
+def _to_array(value):
+    """
+    Converts a sample value to a float NumPy array. Single quaternions are converted to their components, real first,
+    as quaternion arrays are.
+    """
+    if isinstance(value, (Gf.Quatf, Gf.Quatd, Gf.Quath)):
+        value = [value.GetReal()] + list(value.GetImaginary())
+
+    return np.asarray(value, dtype=np.float64)
+
+
+def get_frame(time):
+    """
+    Returns the whole frame at or before a time code.
+    """
+    return int(math.floor(time + FRAME_EPSILON))
+
+
+def is_whole_frame(time):
+    """
+    Returns True if a time code is on a whole frame.
+    """
+    return abs(time - round(time)) < FRAME_EPSILON
+
+
+def get_moving_frames(layer, path, tolerance):
+    """
+    Finds the frames an attribute moves more than tolerance in, from each whole frame to the next.
+
+    :param layer:       The Sdf.Layer to read from.
+    :param path:        The Sdf.Path of the attribute.
+    :param tolerance:   The distance an attribute can move in a frame and still be treated as static.
+    :return:            Tuple of (set of frames that move, set of frames that were measured).
+    """
+    times = layer.ListTimeSamplesForPath(path)
+    frames = dict((int(round(t)), t) for t in times if is_whole_frame(t))
+
+    measured = set()
+    moving = set()
+    for frame in frames:
+        if frame + 1 not in frames:
+            continue
+
+        measured.add(frame)
+        if get_motion(layer.QueryTimeSample(path, frames[frame]), layer.QueryTimeSample(path, frames[frame + 1])) > tolerance:
+            moving.add(frame)
+
+    return moving, measured
+
+
+def get_sampled_attributes_by_prim(layer):
+    """
+    Groups every time sampled attribute in the layer by the prim it's on. Prims inside variants are kept separate.
+
+    :param layer:   The Sdf.Layer to search.
+    :return:        Dict of prim Sdf.Path to list of attribute Sdf.Paths.
+    """
+    prims = {}
+    for path in usd_sample_compaction.get_sampled_attribute_paths(layer):
+        prims.setdefault(path.GetPrimOrPrimVariantSelectionPath(), []).append(path)
+
+    return prims
+
+
+def _get_static_subframe_times(layer, path, static):
+    """
+    Returns the sub-frame sample times of an attribute that fall in the given frames.
+    """
+    return [x for x in layer.ListTimeSamplesForPath(path) if not is_whole_frame(x) and get_frame(x) in static]
+
+
+def _reduce_prim(layer, paths, tolerance):
+    """
+    Drops the sub-frame samples of a prim's motion attributes in every frame none of them move in, and the sub-frame
+    samples of its other attributes in those frames that don't change their value.
+
+    :return:    The number of samples removed.
+    """
+    motion_paths = [x for x in paths if is_motion_attribute(x.name)]
+    if not motion_paths:
+        return 0
+
+    # A frame is only static if every motion attribute was measured across it and none of them moved
+    moving = set()
+    static = None
+    for path in motion_paths:
+        attrMoving, attrMeasured = get_moving_frames(layer, path, tolerance)
+        moving |= attrMoving
+        static = attrMeasured if static is None else static & attrMeasured
+    static -= moving
+
+    removed = 0
+    for path in paths:
+        dropped = _get_static_subframe_times(layer, path, static)
+        if dropped and not is_motion_attribute(path.name):
+            times, values = usd_frame_hold.read_time_samples(layer, path)
+            redundant = set(times[usd_sample_compaction.get_redundant_sample_mask(values)].tolist())
+            dropped = [x for x in dropped if x in redundant]
+
+        for time in dropped:
+            layer.EraseTimeSample(path, time)
+        removed += len(dropped)
+
+    return removed
+
+
+def reduce_subframe_samples(layer, tolerance):
+    """
+    Drops sub-frame samples from every prim in the layer that doesn't move more than tolerance between whole frames.
+
+    Run this before sample compaction, which can drop the whole frame samples motion is measured between.
+
+    :param layer:       The Sdf.Layer to reduce.
+    :param tolerance:   The distance a prim's points or transform can move in a frame and still be treated as static.
+                        In scene units, or degrees for rotations.
+    :return:            Dict with the number of "prims" checked, how many were "reduced", and the number of
+                        "samples" removed.
+    """
+    report = {"prims": 0, "reduced": 0, "samples": 0}
+
+    with Sdf.ChangeBlock():
+        for paths in get_sampled_attributes_by_prim(layer).values():
+            removed = _reduce_prim(layer, paths, tolerance)
+
+            report["prims"] += 1
+            report["reduced"] += int(removed > 0)
+            report["samples"] += removed
+
+    print("Adaptive sampling on {0} prims: dropped sub-frame samples on {1}, removed {2} samples".format(
+        report["prims"], report["reduced"], report["samples"]))
+
+    return report
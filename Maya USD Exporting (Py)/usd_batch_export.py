@@ -0,0 +1,81 @@
+"""
+Multi-asset animcache export.
+
+Every asset of a shot is exported by one Maya USD export into a single batch layer, then split into a layer per asset.
+Each asset's reference root is parented under its own empty group for the export, so assets whose root transforms
+have the same name once namespaces are stripped don't collide. Splitting copies each group's children to the root of
+the asset's layer, so every asset layer matches what a single asset export would have written.
+"""
+
+import os
+import shutil
+import tempfile
+
+from pxr import Sdf
+
+
+BATCH_GROUP_NAME = "usdBatchAsset"
+
+
+def get_batch_filepath(filepath):
+    """
+    Returns a path in a new temporary directory to export the batch layer to, with the same format as filepath.
+
+    :param filepath:    The path of one of the asset layers.
+    :return:            The batch layer path. Remove it with remove_batch_filepath.
+    """
+    work_dir = tempfile.mkdtemp(prefix="usdBatchExport_")
+    return os.path.join(work_dir, "batch" + os.path.splitext(filepath)[-1])
+
+
+def remove_batch_filepath(batch_filepath):
+    """
+    Removes a batch layer and the temporary directory it was exported to.
+    """
+    shutil.rmtree(os.path.dirname(batch_filepath), ignore_errors=True)
+
+
+def split_batch_layer(batch_filepath, group_paths, filepaths):
+    """
+    Splits a batch layer into a layer per asset.
+
+    The children of each asset's group are copied to the root of the asset's layer, with the batch layer's metadata.
+    The default prim is set to the asset's first root prim.
+
+    :param batch_filepath:  The path of the exported batch layer.
+    :param group_paths:     The Sdf.Path of each asset's group in the batch layer.
+    :param filepaths:       The path to write each asset's layer to, in the same order as group_paths.
+    :return:                List of the asset Sdf.Layers, which are kept open for the publish passes.
+    """
+    batch_layer = Sdf.Layer.FindOrOpen(batch_filepath)
+    if not batch_layer:
+        raise Exception("Could not open batch layer " + batch_filepath)
+
+    layers = []
+    for group_path, filepath in zip(group_paths, filepaths):
+        group_spec = batch_layer.GetPrimAtPath(group_path)
+        if not group_spec:
+            raise Exception("Could not find {0} in batch layer {1}".format(group_path, batch_filepath))
+
+        # Reuse an already open layer, so the session doesn't keep a stale copy of a previous export
+        layer = Sdf.Layer.Find(filepath)
+        if layer:
+            layer.Clear()
+        else:
+            layer = Sdf.Layer.CreateNew(filepath)
+
+        for key in batch_layer.pseudoRoot.ListInfoKeys():
+            layer.pseudoRoot.SetInfo(key, batch_layer.pseudoRoot.GetInfo(key))
+
+        for child in group_spec.nameChildren:
+            if not Sdf.CopySpec(batch_layer, child.path, layer, Sdf.Path.absoluteRootPath.AppendChild(child.name)):
+                raise Exception("Could not copy {0} to {1}".format(child.path, filepath))
+
+        if layer.rootPrims:
+            layer.defaultPrim = layer.rootPrims[0].name
+        layer.Save()
+
+        print("Split {0} into {1}".format(group_path, filepath))
+        layers.append(layer)
+
+    return layers
@@ -0,0 +1,213 @@
+"""
+Parallel frame-range export for animcaches.
+
+The frame range is split into chunks, and each chunk is exported at the same time by its own mayapy process working
+from a snapshot of the current scene. The chunk layers are stitched together with value clips, and the stitched stage
+is flattened back into a single layer. That way the publish-time passes in export_usd_animcache run on the result
+exactly as they would on a serial export.
+
+Chunks start on the sample times of the whole range, so they export the same samples a serial export would. Each
+worker starts evaluating the scene at its chunk's start, so anything that depends on the frames evaluated before it,
+eg. simulations and dynamics, only matches a serial export if the worker pre-rolls through those frames first.
+
+Every worker is a full mayapy session holding the scene, so the number that run at once is kept low by default.
+
+This module is also the mayapy worker script. Each worker is run as:
+
+    mayapy usd_chunked_export.py '<json job>'
+"""
+
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+from maya import cmds
+from pxr import Sdf, Usd, UsdUtils
+
+
+USD_EXPORT_PLUGINS = {"USD Export": "mayaUsdPlugin", "pxrUsdExport": "pxrUsd"}
+
+DEFAULT_WORKERS = 2
+
+# Tolerance for float frames landing on a sample, eg. after a 0.1 stride
+FRAME_EPSILON = 1e-6
+
+
+def get_frame_chunks(start_frame, end_frame, frame_stride, num_chunks):
+    """
+    Splits a frame range into chunks that don't overlap, each starting on one of the range's sample times,
+    start_frame + k * frame_stride.
+
+    Each chunk ends one stride before the next one starts, so the chunks together export exactly the samples a
+    single export of the whole range would.
+
+    :param start_frame:     The start frame of the range.
+    :param end_frame:       The end frame of the range.
+    :param frame_stride:    The frame stride the range is exported at.
+    :param num_chunks:      The number of chunks to split the range into. Capped at the number of samples.
+    :return:                List of (chunk start frame, chunk end frame) tuples.
+    """
+    num_samples = int(math.floor((end_frame - start_frame) / float(frame_stride) + FRAME_EPSILON)) + 1
+    chunk_size = int(math.ceil(float(num_samples) / max(min(num_chunks, num_samples), 1)))
+
+    chunk_starts = [start_frame + i * frame_stride for i in range(0, num_samples, chunk_size)]
+    chunk_ends = [x - float(frame_stride) for x in chunk_starts[1:]] + [end_frame]
+
+    return list(zip(chunk_starts, chunk_ends))
+
+
+def get_mayapy():
+    """
+    Returns the path to the mayapy of the running Maya.
+    """
+    mayapy = os.path.join(os.environ["MAYA_LOCATION"], "bin", "mayapy")
+    if sys.platform == "win32":
+        mayapy += ".exe"
+
+    return mayapy
+
+
+def _run_chunk_worker(job):
+    """
+    Runs one chunk export in a mayapy process, raising if it fails.
+    """
+    print("Exporting frames {0}-{1} to {2}".format(job["startTime"], job["endTime"], job["filepath"]))
+    result = subprocess.run([get_mayapy(), os.path.abspath(__file__), json.dumps(job)], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+
+    if result.returncode != 0 or not os.path.exists(job["filepath"]):
+        print(result.stdout)
+        raise Exception("Failed to export frames {0}-{1} in mayapy worker".format(job["startTime"], job["endTime"]))
+
+    return job["filepath"]
+
+
+def stitch_chunks(filepath, chunk_files, chunks, work_dir):
+    """
+    Stitches chunk layers together with value clips and flattens the result into a single layer.
+
+    Each root prim of the chunks gets its own clip set, as clips can't be authored on the pseudo root.
+
+    :param filepath:        The path to write the stitched layer to.
+    :param chunk_files:     The chunk layer paths, in frame order.
+    :param chunks:          The (start frame, end frame) of each chunk, from get_frame_chunks.
+    :param work_dir:        Directory to write the intermediate clip layers to.
+    :return:                The stitched Sdf.Layer.
+    """
+    start_frame = chunks[0][0]
+    end_frame = chunks[-1][1]
+
+    # Clips are made active from the time codes of each chunk, so make sure they match the chunk's frames
+    for chunk_file, (chunk_start, chunk_end) in zip(chunk_files, chunks):
+        chunk_layer = Sdf.Layer.FindOrOpen(chunk_file)
+        chunk_layer.startTimeCode = chunk_start
+        chunk_layer.endTimeCode = chunk_end
+        chunk_layer.Save()
+
+    first_chunk = Sdf.Layer.FindOrOpen(chunk_files[0])
+
+    stitched_root = Sdf.Layer.CreateNew(os.path.join(work_dir, "stitched.usda"))
+    for root_prim in first_chunk.rootPrims:
+        clip_layer = Sdf.Layer.CreateNew(os.path.join(work_dir, "stitched_" + root_prim.name + ".usda"))
+        UsdUtils.StitchClips(clip_layer, chunk_files, root_prim.path, start_frame, end_frame)
+        clip_layer.Save()
+        stitched_root.subLayerPaths.append(clip_layer.identifier)
+    stitched_root.Save()
+
+    layer = Usd.Stage.Open(stitched_root).Flatten(False)
+
+    # Keep the layer metadata Maya wrote (defaultPrim, upAxis, metersPerUnit...) for the whole range
+    for key in first_chunk.pseudoRoot.ListInfoKeys():
+        layer.pseudoRoot.SetInfo(key, first_chunk.pseudoRoot.GetInfo(key))
+    layer.startTimeCode = start_frame
+    layer.endTimeCode = end_frame
+
+    if not layer.Export(filepath):
+        raise Exception("Could not write stitched layer to " + filepath)
+
+    return layer
+
+
+def export_usd_chunked(filepath, options, usd_export_type, start_frame, end_frame, frame_stride, num_chunks, workers=DEFAULT_WORKERS, pre_roll=0):
+    """
+    Exports the current selection to USD by exporting frame range chunks in parallel mayapy processes.
+
+    :param filepath:            The path to export the USD file to.
+    :param options:             List of USD export options. startTime and endTime are set for each chunk.
+    :param usd_export_type:     The Maya file type to export with, "USD Export" or "pxrUsdExport".
+    :param start_frame:         The start frame to export the animation at.
+    :param end_frame:           The end frame to export the animation at.
+    :param frame_stride:        The frame stride to export the animation at.
+    :param num_chunks:          The number of chunks to split the frame range into.
+    :param workers:             The number of mayapy processes to run at once. Each one holds the whole scene, so
+                                raise it only as far as the machine's memory allows.
+    :param pre_roll:            The number of frames each worker evaluates before its chunk, so simulations and
+                                dynamics have run up to it. It doesn't go back past start_frame. Set it to cover the
+                                whole range for results that match a serial export.
+    :return:                    The exported file path, like cmds.file.
+    """
+    chunks = get_frame_chunks(start_frame, end_frame, frame_stride, num_chunks)
+    chunk_options = [x for x in options if not x.startswith("startTime=") and not x.startswith("endTime=")]
+    ext = os.path.splitext(filepath)[-1]
+
+    work_dir = tempfile.mkdtemp(prefix="usdChunkedExport_")
+    try:
+        # Workers open a snapshot of the scene as it is now, with the export node reparented and user properties set
+        scene = os.path.join(work_dir, "scene.mb")
+        cmds.file(scene, force=True, exportAll=True, preserveReferences=True, type="mayaBinary")
+
+        selection = cmds.ls(sl=True, long=True)
+
+        jobs = []
+        for i, (chunk_start, chunk_end) in enumerate(chunks):
+            jobs.append({"scene": scene,
+                         "selection": selection,
+                         "filepath": os.path.join(work_dir, "chunk{0}{1}".format(i, ext)),
+                         "options": ';'.join(chunk_options + ['startTime=%s' % chunk_start, 'endTime=%s' % chunk_end]),
+                         "type": usd_export_type,
+                         "plugin": USD_EXPORT_PLUGINS[usd_export_type],
+                         "startTime": chunk_start,
+                         "endTime": chunk_end,
+                         "preRollStart": max(start_frame, chunk_start - pre_roll)})
+
+        with ThreadPoolExecutor(max_workers=max(min(workers, len(jobs)), 1)) as executor:
+            chunk_files = list(executor.map(_run_chunk_worker, jobs))
+
+        print("Stitching {0} chunks into {1}".format(len(chunk_files), filepath))
+        stitch_chunks(filepath, chunk_files, chunks, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return filepath
+
+
+def _export_chunk(job):
+    """
+    Worker side of export_usd_chunked. Opens the scene snapshot and exports one chunk of the frame range.
+    """
+    import maya.standalone
+    maya.standalone.initialize()
+
+    try:
+        cmds.loadPlugin(job["plugin"], quiet=True)
+        cmds.file(job["scene"], open=True, force=True)
+        cmds.select(job["selection"], r=True)
+
+        # Evaluate the frames before the chunk in order, so simulations have run up to its start
+        frame = job["preRollStart"]
+        while frame < job["startTime"] - FRAME_EPSILON:
+            cmds.currentTime(frame)
+            frame += 1
+
+        cmds.file(job["filepath"], force=True, options=job["options"], type=job["type"], pr=True, es=True)
+    finally:
+        maya.standalone.uninitialize()
+
+
+if __name__ == "__main__":
+    _export_chunk(json.loads(sys.argv[1]))
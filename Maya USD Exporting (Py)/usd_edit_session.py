@@ -0,0 +1,98 @@
+"""
+Transactional edit sessions for publishing exported layers.
+
+After Maya writes a layer, the exporters make many small spec edits to it. Edits made outside an Sdf.ChangeBlock each
+process their changes and send their notices on their own, and a layer saved part way through its edits leaves a
+published file that doesn't match what the publish ends up with.
+
+A PublishEditSession holds one change block open for every post-export edit of a publish, and writes each of its
+layers that was edited once, at the end, with usd_layer_edits.save_layer. Each file is written to a temporary file
+and renamed into place, so nothing reading the publish sees it half written, and the layer is read back from it, so it
+isn't dirty once it's saved. If the edits raise, nothing is written.
+
+Usd.Stages composed from a session's layers only see its edits once its change block ends, when the session saves.
+Read the layers' specs directly during the session, eg. with usd_layer_edits.get_xform_stage, which copies them.
+"""
+
+from pxr import Sdf
+
+import usd_layer_edits
+
+
+class PublishEditSession():
+    """
+    Batches the post-export edits of a publish, and writes its layers once. Use it as a context manager, and save it
+    at the end of the edits:
+
+        with usd_edit_session.PublishEditSession(layer) as session:
+            usd_layer_edits.fix_default_prim(layer)
+            ...
+            session.save()
+
+    A session that's left without an error is saved if it hasn't been already.
+
+    :param layer:   The exported Sdf.Layer being published.
+    """
+    def __init__(self, layer):
+        self.layers = [layer]
+        self.saved = False
+        self._changeBlock = None
+
+    def add_layer(self, layer):
+        """
+        Adds another layer the publish writes, eg. a payload layer, to be saved with the session.
+        """
+        if layer not in self.layers:
+            self.layers.append(layer)
+
+    def get_dirty_layers(self):
+        """
+        Returns the session's layers that have been edited since they were opened or last saved.
+        """
+        return [x for x in self.layers if x.dirty]
+
+    def _end_change_block(self):
+        """
+        Closes the session's change block, if it's open, which processes every change made in it.
+        """
+        if self._changeBlock is not None:
+            changeBlock = self._changeBlock
+            self._changeBlock = None
+            changeBlock.__exit__(None, None, None)
+
+    def save(self):
+        """
+        Ends the session's change block, and writes each edited layer once. A session can only be saved once.
+
+        :return:    List of the Sdf.Layers written.
+        """
+        if self.saved:
+            raise Exception("Publish edit session of " + self.layers[0].identifier + " was already saved")
+
+        self._end_change_block()
+
+        written = []
+        for layer in self.get_dirty_layers():
+            if not usd_layer_edits.save_layer(layer):
+                raise Exception("Could not save " + layer.identifier)
+            written.append(layer)
+        self.saved = True
+
+        print("Saved {0} of {1} publish layers".format(len(written), len(self.layers)))
+
+        return written
+
+    def __enter__(self):
+        self._changeBlock = Sdf.ChangeBlock()
+        self._changeBlock.__enter__()
+        return self
+
+    def __exit__(self, excType, excValue, excTraceback):
+        self._end_change_block()
+
+        if excType is None and not self.saved:
+            self.save()
+        elif excType is not None:
+            print("Publish edits of " + self.layers[0].identifier + " failed, so nothing was saved")
+
+        return False
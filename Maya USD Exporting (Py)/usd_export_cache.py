@@ -0,0 +1,287 @@
+"""
+Content-addressed cache of exported animcache layers.
+
+Shot publishes are re-run constantly, and most assets in them haven't changed since the last run. Each export is keyed
+by a hash of everything that decides what it writes: the export arguments and options, the rig and model reference
+files and the shot's edits to them, the world matrix the asset is reparented with, and the keys of every animation
+curve upstream of the asset or its parents, including through anim layers and pairBlend and blendWeighted nodes. If a
+layer was already exported with the same key, it is copied from the cache instead of exporting again.
+
+Keys only stat the reference files and read the animation curves' keys, so building one costs a small fraction of an
+export. Animation that doesn't come from animation curves, eg. simulations or expressions, and edits to nodes that
+aren't referenced, other than blend nodes, aren't part of the key, so don't use the cache for assets driven that way.
+
+The cache is kept under a size limit by evicting the least recently used layers.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from maya import cmds
+from pxr import Sdf
+
+
+ANIM_CURVE_TANGENT_FLAGS = ("inAngle", "outAngle", "inWeight", "outWeight", "inTangentType", "outTangentType")
+ANIM_CURVE_ATTRS = ("preInfinity", "postInfinity", "weightedTangents")
+
+# Nodes between animation curves and the plugs they drive, whose own values change the result, eg. anim layer weights
+BLEND_NODE_TYPES = ("animBlendNodeBase", "animLayer", "pairBlend", "blendWeighted")
+
+
+def get_file_key(filepath):
+    """
+    Returns a cheap stand in for the contents of a file: its path, size and modification time.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return [filepath, None, None]
+
+    return [filepath, stat.st_size, stat.st_mtime_ns]
+
+
+def get_reference_nodes(node):
+    """
+    Finds the reference node a node is from, and every reference node nested in it.
+
+    :param node:    The node to find the reference nodes of.
+    :return:        List of reference node names. Empty if the node isn't referenced.
+    """
+    if not cmds.referenceQuery(node, isNodeReferenced=True):
+        return []
+
+    found = []
+    refNodes = [cmds.referenceQuery(node, referenceNode=True)]
+    while refNodes:
+        refNode = refNodes.pop(0)
+        found.append(refNode)
+        refNodes += cmds.referenceQuery(refNode, child=True, referenceNode=True) or []
+
+    return found
+
+
+def get_reference_files(node):
+    """
+    Finds the reference file a node is from, and every reference nested in it.
+
+    :param node:    The node to find the reference files of.
+    :return:        List of reference file paths. Empty if the node isn't referenced.
+    """
+    return [cmds.referenceQuery(x, filename=True, withoutCopyNumber=True) for x in get_reference_nodes(node)]
+
+
+def get_reference_edits(node):
+    """
+    Finds the edits the scene makes to the references a node is from, eg. setAttrs and connections made in the shot.
+
+    :param node:    The node to find the reference edits of.
+    :return:        List of (reference node, edit strings) tuples. Empty if the node isn't referenced.
+    """
+    return [(x, cmds.referenceQuery(x, editStrings=True) or []) for x in get_reference_nodes(node)]
+
+
+def get_history(node):
+    """
+    Finds everything upstream of a node, every node under it, and its parents, which are baked in when it's reparented.
+
+    :param node:    The root node to search from.
+    :return:        List of node names.
+    """
+    nodes = [node] + (cmds.listRelatives(node, allDescendents=True, fullPath=True) or []) + \
+            (cmds.listRelatives(node, allParents=True, fullPath=True) or [])
+
+    return cmds.listHistory(nodes) or []
+
+
+def get_anim_curves(node, history=None):
+    """
+    Finds the animation curves upstream of a node, every node under it, and its parents. Curves driving them through
+    anim layers, pairBlends and blendWeighted nodes are found too.
+
+    :param node:        The root node to search from.
+    :param history:     The node's history, from get_history. Found if it isn't given.
+    :return:            Sorted list of animation curve names.
+    """
+    if history is None:
+        history = get_history(node)
+
+    return sorted(set(cmds.ls(history, type="animCurve") or []))
+
+
+def get_blend_nodes(node, history=None):
+    """
+    Finds the anim layers, and anim layer, pairBlend and blendWeighted blend nodes, upstream of a node, every node
+    under it, and its parents.
+
+    :param node:        The root node to search from.
+    :param history:     The node's history, from get_history. Found if it isn't given.
+    :return:            Sorted list of node names.
+    """
+    if history is None:
+        history = get_history(node)
+
+    return sorted(set(cmds.ls(history, type=list(BLEND_NODE_TYPES)) or []))
+
+
+def _get_anim_curve_key(curve):
+    """
+    Returns everything that decides how an animation curve evaluates, and the plugs it drives.
+    """
+    key = [cmds.listConnections(curve, source=False, destination=True, plugs=True) or [],
+           cmds.keyframe(curve, query=True, timeChange=True) or [],
+           cmds.keyframe(curve, query=True, valueChange=True) or []]
+
+    for flag in ANIM_CURVE_TANGENT_FLAGS:
+        key.append(cmds.keyTangent(curve, query=True, **{flag: True}) or [])
+    for attr in ANIM_CURVE_ATTRS:
+        key.append(cmds.getAttr(curve + "." + attr))
+
+    return key
+
+
+def _get_blend_node_key(node):
+    """
+    Returns the values of a blend node's keyable attributes, eg. its weights, which aren't curves but change the result.
+    """
+    key = [cmds.nodeType(node)]
+    for attr in cmds.listAttr(node, keyable=True, scalar=True) or []:
+        key.append([attr, cmds.getAttr(node + "." + attr)])
+
+    return key
+
+
+def get_cache_key(node, options, params):
+    """
+    Builds the cache key of an export.
+
+    :param node:        The node whose hierarchy is exported. Reference files and edits, animation curves and blend nodes
+                        are found from it, and its world matrix is baked in when it's reparented.
+    :param options:     The list of USD export options.
+    :param params:      Dict of every other argument that changes what is exported or published, eg. the frame range,
+                        frameHold, skelRoot and skelOnly. Values must be JSON serialisable.
+    :return:            The key, as a hex string.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([cmds.about(version=True), options, params], sort_keys=True).encode("utf-8"))
+
+    for filepath in get_reference_files(node):
+        hasher.update(json.dumps(get_file_key(filepath)).encode("utf-8"))
+
+    for refNode, edits in get_reference_edits(node):
+        hasher.update(json.dumps([refNode, edits]).encode("utf-8"))
+
+    hasher.update(json.dumps(cmds.xform(node, query=True, matrix=True, worldSpace=True)).encode("utf-8"))
+
+    history = get_history(node)
+    for curve in get_anim_curves(node, history):
+        hasher.update(json.dumps([curve, _get_anim_curve_key(curve)]).encode("utf-8"))
+
+    for blendNode in get_blend_nodes(node, history):
+        hasher.update(json.dumps([blendNode, _get_blend_node_key(blendNode)]).encode("utf-8"))
+
+    return hasher.hexdigest()
+
+
+def get_cached_filepath(cache_dir, key, filepath):
+    """
+    Returns the path a layer with this key is cached at, with the same format as filepath.
+    """
+    return os.path.join(cache_dir, key + os.path.splitext(filepath)[-1])
+
+
+def fetch_cached_layer(cache_dir, key, filepath):
+    """
+    Copies a cached layer to filepath, if there is one for the key.
+
+    :param cache_dir:   The export cache directory.
+    :param key:         The cache key, from get_cache_key.
+    :param filepath:    The path to copy the cached layer to.
+    :return:            True if the layer was in the cache.
+    """
+    cached_filepath = get_cached_filepath(cache_dir, key, filepath)
+    if not os.path.exists(cached_filepath):
+        print("Export cache miss for " + filepath)
+        return False
+
+    shutil.copyfile(cached_filepath, filepath)
+
+    # Mark it as recently used, so it's evicted last
+    os.utime(cached_filepath, None)
+
+    # A copy of the file may already be open from a previous export
+    layer = Sdf.Layer.Find(filepath)
+    if layer:
+        layer.Reload(True)
+
+    print("Export cache hit for {0}, copied from {1}".format(filepath, cached_filepath))
+    return True
+
+
+def store_cached_layer(cache_dir, key, filepath, maxBytes):
+    """
+    Adds an exported layer to the cache, then evicts layers until the cache is under its size limit.
+
+    :param cache_dir:   The export cache directory. Created if it doesn't exist.
+    :param key:         The cache key, from get_cache_key.
+    :param filepath:    The path of the exported layer.
+    :param maxBytes:    The size the cache is kept under, in bytes.
+    :return:            The path the layer was cached at.
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    cached_filepath = get_cached_filepath(cache_dir, key, filepath)
+
+    # Copy then rename, so a publish running at the same time never reads a partly copied layer
+    fd, temp_filepath = tempfile.mkstemp(dir=cache_dir, prefix=".tmp_", suffix=os.path.splitext(filepath)[-1])
+    os.close(fd)
+    try:
+        shutil.copyfile(filepath, temp_filepath)
+        os.replace(temp_filepath, cached_filepath)
+    except Exception:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        raise
+
+    print("Added {0} to export cache as {1}".format(filepath, cached_filepath))
+
+    evict_cached_layers(cache_dir, maxBytes)
+
+    return cached_filepath
+
+
+def evict_cached_layers(cache_dir, maxBytes):
+    """
+    Removes the least recently used layers from the cache until it is under its size limit.
+
+    :param cache_dir:   The export cache directory.
+    :param maxBytes:    The size the cache is kept under, in bytes.
+    :return:            The number of layers removed.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith(".tmp_") or not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum([x[1] for x in entries])
+    removed = 0
+    for mtime, size, path in sorted(entries):
+        if total <= maxBytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    if removed:
+        print("Evicted {0} layers from export cache, {1:.1f} GB left".format(removed, total / 1e9))
+
+    return removed
@@ -0,0 +1,356 @@
+"""
+Frame hold authoring for published animcaches.
+
+Frame holds are authored as a "frameHold" variant set on the default prim of the exported layer. Each "heldFromN"
+variant holds every animated attribute on every frameHold'th sample, starting from sample N, and a "normal" variant
+carries the samples as exported. An int "sourceFrame" attribute on the default prim records which frame is being
+shown at each time so comp can line up the held frames.
+
+The variants can either carry their own copy of the held samples, or share one set of samples through value clips,
+where each variant only carries the clip times that hold the frames.
+
+All edits are made directly on the Sdf layer. Time samples are read once per attribute into NumPy arrays, the held
+samples for each variant are picked with array indexing, and the picked values are written back without copying. The
+"normal" variant's samples are copied across in one Sdf.CopySpec per attribute. Held samples are set one at a time, as
+a whole time sample map can't be set from Python: dicts are converted to VtDictionary, which only has string keys.
+"""
+
+import os
+
+import numpy as np
+
+from pxr import Sdf, Vt
+
+
+FRAME_HOLD_VARIANT_SET = "frameHold"
+FRAME_HOLD_NORMAL_VARIANT = "normal"
+SOURCE_FRAME_ATTR = "sourceFrame"
+FRAME_HOLD_SAMPLES_PRIM = "frameHoldSamples"
+
+# Attribute spec fields copied into the normal variant. The source keeps its default and metadata.
+SAMPLE_SPEC_FIELDS = ("typeName", "variability", "custom", "timeSamples")
+
+
+def get_held_variant_name(start_frame, frameHoldVariant):
+    """
+    Returns the name of the variant holding frames from the given offset.
+
+    :param start_frame:         The start frame of the exported animation.
+    :param frameHoldVariant:    The offset of the first held sample.
+    :return:                    The variant name, eg. heldFrom1001
+    """
+    return "heldFrom" + str(start_frame + frameHoldVariant)
+
+
+def get_held_sample_indices(num_samples, frameHold, frameHoldVariant):
+    """
+    For every sample, finds the index of the sample that should be shown in a held variant.
+
+    Sample i is shown where i % frameHold == frameHoldVariant, and held until the next one. Samples before the first
+    shown sample hold the first sample.
+
+    :param num_samples:         Number of time samples on the attribute.
+    :param frameHold:           Number of frames to hold each frame for.
+    :param frameHoldVariant:    The offset of the first held sample.
+    :return:                    NumPy array of sample indices.
+    """
+    indices = np.arange(num_samples)
+    shown = np.where(indices % frameHold == frameHoldVariant, indices, 0)
+    return np.maximum.accumulate(shown) if num_samples else shown
+
+
+def get_animated_attribute_paths(layer, root_path):
+    """
+    Finds every attribute under root_path that has time samples authored in the layer. Attributes inside variants are
+    skipped.
+
+    :param layer:       The Sdf.Layer to search.
+    :param root_path:   The Sdf.Path of the prim to search under.
+    :return:            List of attribute Sdf.Paths.
+    """
+    paths = []
+
+    def _collect(path):
+        if path.IsPrimPropertyPath() and not path.ContainsPrimVariantSelection():
+            if layer.GetNumTimeSamplesForPath(path) > 0:
+                paths.append(path)
+
+    layer.Traverse(root_path, _collect)
+    return paths
+
+
+def read_time_samples(layer, path):
+    """
+    Reads all time samples of an attribute spec.
+
+    The values are kept as the Vt objects stored in the layer, so indexing the returned array doesn't copy any
+    point data.
+
+    :param layer:   The Sdf.Layer to read from.
+    :param path:    The Sdf.Path of the attribute.
+    :return:        Tuple of (times, values) NumPy arrays.
+    """
+    timeSamples = layer.GetAttributeAtPath(path).GetInfo("timeSamples")
+    times = np.array(sorted(timeSamples.keys()), dtype=np.float64)
+
+    # Fill element-wise so NumPy doesn't try to unpack the array values
+    values = np.empty(len(times), dtype=object)
+    for i, time in enumerate(times):
+        values[i] = timeSamples[time]
+
+    return times, values
+
+
+def _get_variant_path(default_prim_path, variant, path):
+    """
+    Maps a path under the default prim into the given frameHold variant.
+    """
+    variantPrimPath = default_prim_path.AppendVariantSelection(FRAME_HOLD_VARIANT_SET, variant)
+    return path.ReplacePrefix(default_prim_path, variantPrimPath)
+
+
+def get_frame_hold_paths(layer, path):
+    """
+    Finds everywhere the samples of a prim or attribute under the default prim can be once frame holds are authored:
+    the path itself, the same path in each frameHold variant, and the same path under the shared clip samples prim.
+
+    Passes that edit samples after frame holds use this to edit every copy of them.
+
+    :param layer:   The Sdf.Layer to search.
+    :param path:    The Sdf.Path of the prim or attribute, as exported.
+    :return:        List of the Sdf.Paths that have a spec in the layer.
+    """
+    path = Sdf.Path(path)
+    default_prim_path = Sdf.Path.absoluteRootPath.AppendChild(layer.defaultPrim)
+
+    paths = [path]
+    if path.HasPrefix(default_prim_path):
+        default_prim_spec = layer.GetPrimAtPath(default_prim_path)
+        if default_prim_spec and FRAME_HOLD_VARIANT_SET in default_prim_spec.variantSets:
+            for variant in default_prim_spec.variantSets[FRAME_HOLD_VARIANT_SET].variants.keys():
+                paths.append(_get_variant_path(default_prim_path, variant, path))
+
+        paths.append(path.ReplacePrefix(default_prim_path, Sdf.Path.absoluteRootPath.AppendChild(FRAME_HOLD_SAMPLES_PRIM)))
+
+    return [x for x in paths if layer.GetObjectAtPath(x)]
+
+
+def _write_variant_samples(layer, sourceSpec, variantPath, times, values):
+    """
+    Writes samples to an attribute inside a variant, creating the overs and attribute spec if needed.
+    """
+    attrSpec = layer.GetAttributeAtPath(variantPath)
+    if not attrSpec:
+        primSpec = Sdf.CreatePrimInLayer(layer, variantPath.GetPrimOrPrimVariantSelectionPath())
+        attrSpec = Sdf.AttributeSpec(primSpec, variantPath.name, sourceSpec.typeName, sourceSpec.variability, sourceSpec.custom)
+
+    for time, value in zip(times.tolist(), values):
+        layer.SetTimeSample(variantPath, time, value)
+
+
+def _copy_variant_samples(layer, sourceSpec, variantPath):
+    """
+    Copies the samples of an attribute, as they are, to an attribute inside a variant, creating the overs if needed.
+    """
+    Sdf.CreatePrimInLayer(layer, variantPath.GetPrimOrPrimVariantSelectionPath())
+
+    shouldCopyValue = lambda specType, field, *args: field in SAMPLE_SPEC_FIELDS
+    if not Sdf.CopySpec(layer, sourceSpec.path, layer, variantPath, shouldCopyValue, lambda *args: False):
+        raise Exception("Could not copy samples of " + str(sourceSpec.path) + " to " + str(variantPath))
+
+
+def _author_batch(layer, default_prim_path, paths, start_frame, frameHold):
+    """
+    Moves the time samples of a batch of attributes into every frameHold variant.
+    """
+    batchTimes = np.empty(0, dtype=np.float64)
+
+    with Sdf.ChangeBlock():
+        for path in paths:
+            sourceSpec = layer.GetAttributeAtPath(path)
+            times, values = read_time_samples(layer, path)
+            batchTimes = np.union1d(batchTimes, times)
+
+            for frameHoldVariant in range(0, frameHold):
+                heldIndices = get_held_sample_indices(len(times), frameHold, frameHoldVariant)
+                variant = get_held_variant_name(start_frame, frameHoldVariant)
+                _write_variant_samples(layer, sourceSpec, _get_variant_path(default_prim_path, variant, path), times, values[heldIndices])
+
+            _copy_variant_samples(layer, sourceSpec, _get_variant_path(default_prim_path, FRAME_HOLD_NORMAL_VARIANT, path))
+
+            # Samples now live in the variants, so clear them from the base layer
+            sourceSpec.ClearInfo("timeSamples")
+            sourceSpec.ClearDefaultValue()
+
+    return batchTimes
+
+
+def _move_batch_to_samples_prim(layer, default_prim_path, samples_prim_path, paths):
+    """
+    Moves the time samples of a batch of attributes from under the default prim to the shared samples prim.
+    """
+    batchTimes = np.empty(0, dtype=np.float64)
+
+    with Sdf.ChangeBlock():
+        for path in paths:
+            sourceSpec = layer.GetAttributeAtPath(path)
+            batchTimes = np.union1d(batchTimes, layer.ListTimeSamplesForPath(path))
+
+            samplesPath = path.ReplacePrefix(default_prim_path, samples_prim_path)
+            Sdf.CreatePrimInLayer(layer, samplesPath.GetPrimPath())
+            if not Sdf.CopySpec(layer, path, layer, samplesPath):
+                raise Exception("Could not copy samples of " + str(path) + " to " + str(samplesPath))
+
+            # Keep the attribute spec so the attribute keeps its type, but read values from the clip
+            sourceSpec.ClearInfo("timeSamples")
+            sourceSpec.ClearDefaultValue()
+
+    return batchTimes
+
+
+def get_held_clip_times(times, heldIndices):
+    """
+    Builds value clip times that hold samples, by stepping the clip time at every change of held sample.
+
+    Each step is a jump discontinuity, so the stage time at the step is authored twice. Between steps the clip time is
+    constant, so the held sample's value is shown.
+
+    :param times:           NumPy array of sample times.
+    :param heldIndices:     NumPy array of the held sample index for every sample, from get_held_sample_indices.
+    :return:                Vt.Vec2dArray of (stage time, clip time) pairs.
+    """
+    heldTimes = times[heldIndices]
+    steps = np.nonzero(heldIndices[1:] != heldIndices[:-1])[0] + 1
+
+    # Only hold to the last sample if it isn't a step itself, as a stage time can't be authored more than twice
+    end = [] if len(steps) and steps[-1] == len(times) - 1 else [len(times) - 1]
+
+    stageTimes = np.concatenate(([times[0]], np.repeat(times[steps], 2), times[end]))
+    clipTimes = np.concatenate(([heldTimes[0]], np.stack((heldTimes[steps - 1], heldTimes[steps]), axis=1).ravel(), heldTimes[end]))
+
+    return Vt.Vec2dArray.FromNumpy(np.stack((stageTimes, clipTimes), axis=1))
+
+
+def _get_default_prim_spec(layer):
+    """
+    Returns the default prim spec of the layer, erroring if it doesn't exist.
+    """
+    default_prim_spec = layer.GetPrimAtPath(Sdf.Path.absoluteRootPath.AppendChild(layer.defaultPrim))
+    if not default_prim_spec:
+        raise Exception("Could not find default prim " + str(layer.defaultPrim) + " to author frame holds on")
+
+    return default_prim_spec
+
+
+def _get_source_frame_spec(default_prim_spec):
+    """
+    Returns the sourceFrame attribute spec on the default prim, creating it if needed.
+    """
+    sourceFrameSpec = default_prim_spec.attributes.get(SOURCE_FRAME_ATTR)
+    if not sourceFrameSpec:
+        sourceFrameSpec = Sdf.AttributeSpec(default_prim_spec, SOURCE_FRAME_ATTR, Sdf.ValueTypeNames.Int, Sdf.VariabilityVarying, True)
+
+    return sourceFrameSpec
+
+
+def _author_source_frames(layer, default_prim_spec, sourceFrameSpec, times, start_frame, frameHold, clipAssetPath=None, clipPrimPath=None):
+    """
+    Authors sourceFrame in every variant, and the clip times over the shared samples if a clip asset is given.
+    """
+    # Record which frame each variant is showing, for comp
+    sourceFrames = np.empty(len(times), dtype=object)
+    for i, time in enumerate(times):
+        sourceFrames[i] = int(time)
+
+    variants = [(get_held_variant_name(start_frame, x), get_held_sample_indices(len(times), frameHold, x)) for x in range(0, frameHold)]
+    variants.append((FRAME_HOLD_NORMAL_VARIANT, np.arange(len(times))))
+
+    with Sdf.ChangeBlock():
+        for variant, heldIndices in variants:
+            _write_variant_samples(layer, sourceFrameSpec, _get_variant_path(default_prim_spec.path, variant, sourceFrameSpec.path), times, sourceFrames[heldIndices])
+
+            if clipAssetPath and len(times) > 0:
+                if variant == FRAME_HOLD_NORMAL_VARIANT:
+                    clipTimes = Vt.Vec2dArray([(times[0], times[0]), (times[-1], times[-1])])
+                else:
+                    clipTimes = get_held_clip_times(times, heldIndices)
+
+                variantPrimSpec = layer.GetPrimAtPath(default_prim_spec.path.AppendVariantSelection(FRAME_HOLD_VARIANT_SET, variant))
+                variantPrimSpec.SetInfo("clips", {"default": {
+                    "assetPaths": Sdf.AssetPathArray([Sdf.AssetPath(clipAssetPath)]),
+                    "primPath": str(clipPrimPath),
+                    "active": Vt.Vec2dArray([(times[0], 0)]),
+                    "times": clipTimes}})
+
+        default_prim_spec.variantSelections[FRAME_HOLD_VARIANT_SET] = FRAME_HOLD_NORMAL_VARIANT
+
+
+def _get_batches(paths, batchSize):
+    """
+    Splits the attribute paths into batches, printing progress as each batch is handed out.
+    """
+    if batchSize <= 0:
+        batchSize = max(len(paths), 1)
+
+    for i in range(0, len(paths), batchSize):
+        print("Authoring frame holds for attributes {0}-{1} of {2}".format(i + 1, min(i + batchSize, len(paths)), len(paths)))
+        yield paths[i:i + batchSize]
+
+
+def author_frame_hold_variants(layer, start_frame, frameHold, batchSize=0):
+    """
+    Authors the frameHold variant set on the default prim of a layer, with a copy of the held samples in each variant.
+
+    :param layer:           The Sdf.Layer to author the variants on. Usually the root layer of the exported stage.
+    :param start_frame:     The start frame of the exported animation. Used to name the variants.
+    :param frameHold:       Number of frames to hold each frame for. A variant will be created for each offset.
+    :param batchSize:       If greater than 0, attributes are processed this many at a time so only one batch of
+                            samples is held in Python at once. 0 processes every attribute together.
+    :return:                Number of animated attributes moved into the variants.
+    """
+    default_prim_spec = _get_default_prim_spec(layer)
+    sourceFrameSpec = _get_source_frame_spec(default_prim_spec)
+
+    paths = [x for x in get_animated_attribute_paths(layer, default_prim_spec.path) if x != sourceFrameSpec.path]
+
+    allTimes = np.empty(0, dtype=np.float64)
+    for batch in _get_batches(paths, batchSize):
+        allTimes = np.union1d(allTimes, _author_batch(layer, default_prim_spec.path, batch, start_frame, frameHold))
+
+    _author_source_frames(layer, default_prim_spec, sourceFrameSpec, allTimes, start_frame, frameHold)
+
+    return len(paths)
+
+
+def author_frame_hold_clips(layer, start_frame, frameHold, publish_path, batchSize=0):
+    """
+    Authors the frameHold variant set on the default prim of a layer as value clip time mappings.
+
+    The animated samples are moved once to an over prim at the root of the layer, and the layer uses itself as the
+    value clip. Each variant only carries clip times that hold the shared samples, so the layer stays the size of the
+    raw cache however many variants there are.
+
+    :param layer:           The Sdf.Layer to author the variants on. Usually the root layer of the exported stage.
+    :param start_frame:     The start frame of the exported animation. Used to name the variants.
+    :param frameHold:       Number of frames to hold each frame for. A variant will be created for each offset.
+    :param publish_path:    The path the layer will be published to. The clip asset path points at this file.
+    :param batchSize:       If greater than 0, attributes are processed this many at a time. 0 processes every
+                            attribute together.
+    :return:                Number of animated attributes moved to the shared samples.
+    """
+    default_prim_spec = _get_default_prim_spec(layer)
+    sourceFrameSpec = _get_source_frame_spec(default_prim_spec)
+
+    samples_prim_path = Sdf.Path.absoluteRootPath.AppendChild(FRAME_HOLD_SAMPLES_PRIM)
+    if layer.GetPrimAtPath(samples_prim_path):
+        raise Exception("Layer already has a " + str(samples_prim_path) + " prim. Frame holds may have been authored already.")
+
+    paths = [x for x in get_animated_attribute_paths(layer, default_prim_spec.path) if x != sourceFrameSpec.path]
+
+    allTimes = np.empty(0, dtype=np.float64)
+    for batch in _get_batches(paths, batchSize):
+        allTimes = np.union1d(allTimes, _move_batch_to_samples_prim(layer, default_prim_spec.path, samples_prim_path, batch))
+
+    _author_source_frames(layer, default_prim_spec, sourceFrameSpec, allTimes, start_frame, frameHold, "./" + os.path.basename(publish_path), samples_prim_path)
+
+    return len(paths)
@@ -0,0 +1,513 @@
+"""
+Publish-time edits made directly on the exported Sdf layer.
+
+The Maya USD exporters fix up their output before publishing: fixing the default prim, removing CONTROLS, moving
+model geo under a geo prim, recreating model references, and adding tank:/ references. Making those edits through a
+Usd.Stage composes the whole stage, and resolves every tank:/ reference through turret as it is added. These
+functions make the same edits on the layer specs, so nothing is composed and no external asset is ever resolved.
+
+Where an edit needs transforms (xform vectors, world transforms), get_xform_stage builds a scratch stage holding only
+the local xform opinions of the layer, which can be evaluated with UsdGeom without opening any references.
+"""
+
+import os
+
+from pxr import Sdf, Usd, UsdGeom
+
+
+XFORM_ATTR_PREFIX = "xformOp"
+
+# Spec fields holding values rather than metadata
+VALUE_INFO_KEYS = ("default", "timeSamples", "targetPaths", "connectionPaths")
+
+TEMP_FILE_SUFFIX = ".publishtmp"
+
+
+def fix_default_prim(layer):
+    """
+    Strips any namespace from the layer's default prim.
+
+    :param layer:   The Sdf.Layer to edit.
+    :return:
+    """
+    if ":" in layer.defaultPrim:
+        layer.defaultPrim = layer.defaultPrim.split(":")[-1]
+
+
+def get_default_prim_spec(layer):
+    """
+    Returns the spec of the layer's default prim.
+    """
+    return layer.GetPrimAtPath(Sdf.Path.absoluteRootPath.AppendChild(layer.defaultPrim))
+
+
+def get_defined_children(prim_spec):
+    """
+    Returns the children of a prim spec that a stage would list as children, ie. active defs.
+
+    :param prim_spec:   The Sdf.PrimSpec to get the children of.
+    :return:            List of child Sdf.PrimSpecs, in namespace order.
+    """
+    return [x for x in prim_spec.nameChildren if x.specifier == Sdf.SpecifierDef and x.active]
+
+
+def remove_prim(layer, path):
+    """
+    Removes a prim spec and everything under it from the layer. Equivalent to Usd.Stage.RemovePrim.
+
+    :param layer:   The Sdf.Layer to edit.
+    :param path:    The path of the prim to remove.
+    :return:        True if the prim was removed.
+    """
+    if not layer.GetPrimAtPath(path):
+        return False
+
+    edits = Sdf.BatchNamespaceEdit()
+    edits.Add(Sdf.NamespaceEdit.Remove(Sdf.Path(path)))
+
+    return layer.Apply(edits)
+
+
+def remove_controls_prim(layer):
+    """
+    Removes the first child of the default prim with CONTROLS in its name, if there is one.
+
+    :param layer:   The Sdf.Layer to edit.
+    :return:
+    """
+    for child in get_defined_children(get_default_prim_spec(layer)):
+        if "CONTROLS" in child.name:
+            remove_prim(layer, child.path)
+            break
+
+
+def has_composition_arcs(prim_spec):
+    """
+    Returns True if the prim spec brings in other layers through references or payloads.
+    """
+    return prim_spec.hasReferences or prim_spec.hasPayloads
+
+
+def define_prim(layer, path, typeName=""):
+    """
+    Defines a prim in the layer. Equivalent to Usd.Stage.DefinePrim: any ancestors without a spec are defined as
+    typeless prims. Ancestors under a prim with references are assumed to be defined by the reference, so like on a
+    stage they are authored as overs.
+
+    :param layer:       The Sdf.Layer to edit.
+    :param path:        The path of the prim to define.
+    :param typeName:    The type of the prim.
+    :return:            The Sdf.PrimSpec of the prim.
+    """
+    path = Sdf.Path(path)
+    referenced = False
+
+    for prefix in path.GetPrefixes():
+        prim_spec = layer.GetPrimAtPath(prefix)
+        if not prim_spec:
+            parent = layer.GetPrimAtPath(prefix.GetParentPath()) if prefix.GetParentPath() != Sdf.Path.absoluteRootPath else layer
+            prim_spec = Sdf.PrimSpec(parent, prefix.name, Sdf.SpecifierOver if referenced else Sdf.SpecifierDef)
+        referenced = referenced or has_composition_arcs(prim_spec)
+
+    prim_spec.specifier = Sdf.SpecifierDef
+    if typeName:
+        prim_spec.typeName = typeName
+
+    return prim_spec
+
+
+def override_prim(layer, path):
+    """
+    Returns the spec of a prim, creating it and any missing ancestors as overs. Equivalent to Usd.Stage.OverridePrim.
+
+    :param layer:   The Sdf.Layer to edit.
+    :param path:    The path of the prim.
+    :return:        The Sdf.PrimSpec of the prim.
+    """
+    return layer.GetPrimAtPath(path) or Sdf.CreatePrimInLayer(layer, path)
+
+
+def apply_api_schema(prim_spec, schemaName):
+    """
+    Adds an API schema to a prim spec's apiSchemas, if it isn't there already. Equivalent to Usd.APISchemaBase.Apply.
+
+    :param prim_spec:   The Sdf.PrimSpec to apply the schema to.
+    :param schemaName:  The name of the schema, eg. SkelBindingAPI
+    :return:
+    """
+    listOp = prim_spec.GetInfo("apiSchemas")
+
+    if listOp.isExplicit:
+        if schemaName not in listOp.explicitItems:
+            listOp.explicitItems = list(listOp.explicitItems) + [schemaName]
+    elif schemaName not in listOp.prependedItems and schemaName not in listOp.appendedItems:
+        listOp.deletedItems = [x for x in listOp.deletedItems if x != schemaName]
+        listOp.prependedItems = list(listOp.prependedItems) + [schemaName]
+
+    prim_spec.SetInfo("apiSchemas", listOp)
+
+
+def create_attribute(prim_spec, name, typeName, custom=True, variability=Sdf.VariabilityVarying):
+    """
+    Returns an attribute spec on a prim spec, creating it if needed. Equivalent to Usd.Prim.CreateAttribute.
+    """
+    return prim_spec.attributes.get(name) or Sdf.AttributeSpec(prim_spec, name, typeName, variability, custom)
+
+
+def create_relationship(prim_spec, name, custom=True):
+    """
+    Returns a relationship spec on a prim spec, creating it if needed. Equivalent to Usd.Prim.CreateRelationship.
+    """
+    return prim_spec.relationships.get(name) or Sdf.RelationshipSpec(prim_spec, name, custom)
+
+
+def add_target(rel_spec, target):
+    """
+    Adds a target to a relationship spec, if it isn't there already. Equivalent to Usd.Relationship.AddTarget.
+    """
+    target = Sdf.Path(target)
+    if target not in rel_spec.targetPathList.prependedItems:
+        rel_spec.targetPathList.prependedItems.append(target)
+
+
+def get_targets(rel_spec):
+    """
+    Returns the targets a relationship spec authors.
+    """
+    return list(rel_spec.targetPathList.ApplyEditsToList([]))
+
+
+def get_authored_metadata(spec):
+    """
+    Returns the metadata authored on a property spec, without its values. Equivalent to
+    Usd.Object.GetAllAuthoredMetadata.
+    """
+    return dict((key, spec.GetInfo(key)) for key in spec.ListInfoKeys() if key not in VALUE_INFO_KEYS)
+
+
+def set_metadata(spec, metadata):
+    """
+    Sets metadata from get_authored_metadata on a property spec.
+    """
+    for key, value in metadata.items():
+        spec.SetInfo(key, value)
+
+
+def apply_rigid_skin(prim_spec, joint, weight, skel, bindTransform):
+    """
+    Binds a prim rigidly to a single joint, as UsdSkel.BindingAPI would author it.
+
+    :param prim_spec:       The Sdf.PrimSpec to bind.
+    :param joint:           The joint path token within the skeleton.
+    :param weight:          The joint weight.
+    :param skel:            The path of the skeleton prim.
+    :param bindTransform:   Gf.Matrix4d world transform of the prim at bind time.
+    :return:
+    """
+    apply_api_schema(prim_spec, "SkelBindingAPI")
+
+    create_attribute(prim_spec, "skel:joints", Sdf.ValueTypeNames.TokenArray, False, Sdf.VariabilityUniform).default = [joint]
+
+    for name, typeName, value in [("primvars:skel:jointIndices", Sdf.ValueTypeNames.IntArray, [0]), ("primvars:skel:jointWeights", Sdf.ValueTypeNames.FloatArray, [float(weight)])]:
+        primvar_spec = create_attribute(prim_spec, name, typeName, False)
+        primvar_spec.SetInfo("interpolation", UsdGeom.Tokens.constant)
+        primvar_spec.SetInfo("elementSize", 1)
+        primvar_spec.default = value
+
+    create_attribute(prim_spec, "primvars:skel:geomBindTransform", Sdf.ValueTypeNames.Matrix4d, False).default = bindTransform
+
+    add_target(create_relationship(prim_spec, "skel:skeleton", False), skel)
+
+
+def add_reference(prim_spec, uri):
+    """
+    Adds a reference to a prim spec without resolving it. Equivalent to Usd.References.AddReference.
+
+    :param prim_spec:   The Sdf.PrimSpec to add the reference to.
+    :param uri:         The asset path or URI to reference.
+    :return:
+    """
+    reference = Sdf.Reference(uri)
+    if reference not in prim_spec.referenceList.prependedItems:
+        prim_spec.referenceList.prependedItems.append(reference)
+
+
+def _get_op_name(opType, suffix=""):
+    """
+    Returns the attribute name of an xform op, eg. xformOp:translate:pivot
+    """
+    return ":".join([XFORM_ATTR_PREFIX, UsdGeom.XformOp.GetOpTypeToken(opType)] + ([suffix] if suffix else []))
+
+
+def set_xform_vectors(prim_spec, translation, rotation, scale, pivot, rotOrder):
+    """
+    Authors the xform ops of a prim from xform vectors, in the form UsdGeom.XformCommonAPI.SetXformVectors does.
+
+    :param prim_spec:       The Sdf.PrimSpec to author the ops on.
+    :param translation:     Gf.Vec3d translation.
+    :param rotation:        Gf.Vec3f rotation in degrees.
+    :param scale:           Gf.Vec3f scale.
+    :param pivot:           Gf.Vec3f pivot.
+    :param rotOrder:        UsdGeom.XformCommonAPI.RotationOrder of the rotation.
+    :return:
+    """
+    rotateOp = _get_op_name(UsdGeom.XformCommonAPI.ConvertRotationOrderToOpType(rotOrder))
+    translateOp = _get_op_name(UsdGeom.XformOp.TypeTranslate)
+    pivotOp = _get_op_name(UsdGeom.XformOp.TypeTranslate, "pivot")
+    scaleOp = _get_op_name(UsdGeom.XformOp.TypeScale)
+
+    ops = [(rotateOp, Sdf.ValueTypeNames.Float3, rotation),
+           (scaleOp, Sdf.ValueTypeNames.Float3, scale),
+           (translateOp, Sdf.ValueTypeNames.Double3, translation),
+           (pivotOp, Sdf.ValueTypeNames.Float3, pivot)]
+
+    for name, typeName, value in ops:
+        attr_spec = prim_spec.attributes.get(name) or Sdf.AttributeSpec(prim_spec, name, typeName)
+        attr_spec.default = value
+
+    order_spec = prim_spec.attributes.get(UsdGeom.Tokens.xformOpOrder) or Sdf.AttributeSpec(prim_spec, UsdGeom.Tokens.xformOpOrder, Sdf.ValueTypeNames.TokenArray, Sdf.VariabilityUniform)
+    order_spec.default = [translateOp, pivotOp, rotateOp, scaleOp, "!invert!" + pivotOp]
+
+
+class _PathTreeNode():
+    """
+    Node of a prim path prefix tree. isMarked is set on nodes whose path was added to the tree.
+    """
+    def __init__(self):
+        self.isMarked = False
+        self.children = {}
+
+
+def _mark_tree_path(root, path):
+    """
+    Adds a prim path to a prefix tree, with a node for every prefix, and marks its node.
+    """
+    node = root
+    for prefix in Sdf.Path(path).GetPrefixes():
+        node = node.children.setdefault(prefix.name, _PathTreeNode())
+    node.isMarked = True
+
+
+def _get_path_tree(paths):
+    """
+    Builds a prefix tree of prim paths, with a node for every prefix and the paths themselves marked.
+    """
+    root = _PathTreeNode()
+    for path in paths:
+        _mark_tree_path(root, path)
+
+    return root
+
+
+def _add_geo_moves(node, path, newPath, moves):
+    """
+    Adds the moved path of every marked node under a prefix tree node to moves, parents first.
+    """
+    for name, child in node.children.items():
+        childPath = path.AppendChild(name)
+        childNewPath = newPath.AppendChild(name)
+        if child.isMarked:
+            moves.append((childPath, childNewPath))
+            childNewPath = childNewPath.AppendChild("geo")
+        _add_geo_moves(child, childPath, childNewPath, moves)
+
+
+def get_geo_moves(prim_paths):
+    """
+    Works out where each prim ends up when the children of every prim are moved under a geo child. Prims nested
+    under other prims in prim_paths move with them, eg. /rig/a/b becomes /rig/a/geo/b if /rig/a is moved first.
+
+    :param prim_paths:  The paths of the prims to move the children of, as they are before any are moved.
+    :return:            List of (original Sdf.Path, moved Sdf.Path) tuples, with parents before the prims under them.
+    """
+    moves = []
+    _add_geo_moves(_get_path_tree(prim_paths), Sdf.Path.absoluteRootPath, Sdf.Path.absoluteRootPath, moves)
+    return moves
+
+
+class GeoPathRemap():
+    """
+    Remaps paths for prims whose contents are rerouted under a geo child, eg. model references recreated to fit our
+    asset descriptions. Reroutes are recorded by their paths as they were exported, so nested reroutes can be added in
+    any order, and every path is remapped in one walk of its prefixes, eg. /rig/a/b/c becomes /rig/a/geo/b/geo/c once
+    /rig/a and /rig/a/b are added.
+    """
+    def __init__(self):
+        self._root = _PathTreeNode()
+
+    def add(self, path):
+        """
+        Records that everything under a prim, as it was exported, is rerouted under its geo child.
+        """
+        _mark_tree_path(self._root, path)
+
+    def get_path(self, path):
+        """
+        Returns where a prim, or anything under it, ends up after every recorded reroute. A rerouted prim's own path
+        maps to its geo child.
+
+        :param path:    The path as it was exported.
+        :return:        The remapped Sdf.Path.
+        """
+        names = []
+        node = self._root
+        for prefix in Sdf.Path(path).GetPrefixes():
+            names.append(prefix.name)
+            if node is not None:
+                node = node.children.get(prefix.name)
+                if node is not None and node.isMarked:
+                    names.append("geo")
+
+        return Sdf.Path("/" + "/".join(names))
+
+    def remap_keys(self, paths):
+        """
+        Remaps the keys of a dict of path strings, as they were exported, to where they end up.
+
+        :param paths:   Dict keyed by path strings.
+        :return:        New dict with the same values, keyed by remapped path strings.
+        """
+        return dict([(self.get_path(key).pathString, value) for key, value in paths.items()])
+
+
+def move_all_children_under_geo(layer, prim_paths):
+    """
+    Moves every child of each prim under a new "geo" Xform child, so it matches our asset descriptions, in one change
+    block. If a prim already had a child called geo, it ends up at geo/geo. Every edit is planned from the prefix tree
+    of prim_paths before any are made, so nested prims are moved along with the prims above them, then have their own
+    children moved.
+
+    :param layer:       The Sdf.Layer to edit.
+    :param prim_paths:  The paths of the prims to move the children of, as they are before any are moved.
+    :return:            Dict of each original prim path string to its moved Sdf.Path.
+    """
+    moves = get_geo_moves(prim_paths)
+
+    # Plan every edit before any are made, as the children of each prim are read from where they were exported
+    plan = []
+    for path, newPath in moves:
+        prim_spec = layer.GetPrimAtPath(path)
+        if not prim_spec:
+            raise Exception("Could not find prim " + str(path) + " to move under geo")
+
+        names = [x.name for x in get_defined_children(prim_spec) if x.name != "geo"]
+
+        # An existing geo child is moved last, into the new geo prim, so it ends up at geo/geo
+        if prim_spec.nameChildren.get("geo"):
+            names.append("geo")
+        plan.append((newPath, names))
+
+    with Sdf.ChangeBlock():
+        for newPath, names in plan:
+            # The geo prim is made under a temporary name, then renamed once the existing geo child has moved into it
+            tempPath = define_prim(layer, newPath.AppendChild("geoPUBLISHTEMP"), "Xform").path
+
+            # Each prim gets its own edit, as validating one edit for every prim gets slower with every prim added
+            edits = Sdf.BatchNamespaceEdit()
+            for name in names:
+                edits.Add(newPath.AppendChild(name), tempPath.AppendChild(name))
+            edits.Add(tempPath, newPath.AppendChild("geo"))
+            if not layer.Apply(edits):
+                raise Exception("Could not apply layer edit")
+
+    return dict([(x[0].pathString, x[1]) for x in moves])
+
+
+def _get_prim_paths(prim_spec, prim_paths):
+    """
+    Adds the paths of every prim under a prim spec to prim_paths, parents first. Unlike Sdf.Layer.Traverse, properties
+    and variants are never visited.
+    """
+    for child in prim_spec.nameChildren:
+        prim_paths.append(child.path)
+        _get_prim_paths(child, prim_paths)
+
+
+def get_xform_stage(layer, paths=None):
+    """
+    Builds an in-memory stage holding only the prim types and xform ops the layer authors on the given prims and their
+    ancestors. Nothing is referenced, so transforms can be evaluated with UsdGeom without composing the layer.
+
+    :param layer:   The Sdf.Layer to read the xform opinions from.
+    :param paths:   The prim paths to copy. If None, every prim in the layer is copied.
+    :return:        A Usd.Stage.
+    """
+    xform_layer = Sdf.Layer.CreateAnonymous("xforms")
+
+    if paths is None:
+        prim_paths = []
+        _get_prim_paths(layer.pseudoRoot, prim_paths)
+    else:
+        prim_paths = sorted(set(prefix for path in paths for prefix in Sdf.Path(path).GetPrefixes()))
+
+    with Sdf.ChangeBlock():
+        for path in prim_paths:
+            prim_spec = layer.GetPrimAtPath(path)
+            if not prim_spec:
+                continue
+
+            xform_spec = Sdf.CreatePrimInLayer(xform_layer, path)
+            xform_spec.specifier = Sdf.SpecifierDef
+            if prim_spec.typeName:
+                xform_spec.typeName = prim_spec.typeName
+
+            for attr_spec in prim_spec.attributes:
+                if attr_spec.name.startswith(XFORM_ATTR_PREFIX):
+                    Sdf.CopySpec(layer, attr_spec.path, xform_layer, attr_spec.path)
+
+    return Usd.Stage.Open(xform_layer)
+
+
+def get_world_transforms(stage, paths, time=Usd.TimeCode.Default()):
+    """
+    Computes the world transforms of many prims with one UsdGeom.XformCache, so the transforms of shared ancestors
+    are computed once rather than once per prim.
+
+    :param stage:   The Usd.Stage to evaluate, eg. from get_xform_stage.
+    :param paths:   The prim paths to compute.
+    :param time:    The Usd.TimeCode to compute at.
+    :return:        Dict of each path, as given, to its Gf.Matrix4d world transform.
+    """
+    xform_cache = UsdGeom.XformCache(time)
+    return dict([(path, xform_cache.GetLocalToWorldTransform(stage.GetPrimAtPath(path))) for path in paths])
+
+
+def save_layer(layer):
+    """
+    Saves a layer by writing it out to a temporary file next to it, which is renamed over the old one once it's
+    written, so anything reading the layer sees the old file or the new one, never a half written one.
+
+    Saving a usdc layer in place only appends the edited data to the file, and keeps everything it replaced. Samples
+    removed by the publish passes would still be in the published file, and every edit would make it bigger.
+
+    The layer lets go of the file it was read from before it's replaced, as Windows can't replace a file that's mapped,
+    then reads the new file back, so it isn't dirty once it's saved. Stages on the layer see it change once.
+
+    :param layer:   The Sdf.Layer to save.
+    :return:        True if the layer was saved.
+    """
+    filepath = layer.realPath
+    name, ext = os.path.splitext(filepath)
+    # Keeps the extension, as it picks the file format
+    temp_filepath = name + TEMP_FILE_SUFFIX + str(os.getpid()) + ext
+
+    try:
+        if not layer.Export(temp_filepath):
+            return False
+
+        with Sdf.ChangeBlock():
+            layer.Clear()
+            try:
+                os.replace(temp_filepath, filepath)
+            except OSError:
+                # Put the edits back, so the layer can still be saved
+                layer.Import(temp_filepath)
+                raise
+
+            if not layer.Reload(True):
+                raise Exception("Saved " + filepath + " but could not read it back")
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+    return True
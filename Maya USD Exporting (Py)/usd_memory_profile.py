@@ -0,0 +1,217 @@
+"""
+Per-phase memory accounting for animcache publishing.
+
+The farm kills publish jobs that go over their memory request. A MemoryProfile records the peak resident memory and
+the peak Python allocated memory of each phase of a publish, and names the attributes holding the most sample data in
+the published layer, so memory requests can be set per asset.
+
+Resident memory is read from /proc on Linux. The resident high water mark is reset at the start of each phase, so each
+phase's peak is its own. Where it can't be reset, or outside Linux, each phase's peak includes the phases before it.
+Python memory is measured with tracemalloc, which only sees allocations made by Python, not USD's C++ allocations, and
+slows Python allocations down while it runs, so profiling is opt-in.
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+from pxr import Sdf
+
+import usd_sample_compaction
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+TOP_ATTRIBUTE_COUNT = 20
+
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def _read_proc_status(key):
+    """
+    Returns a memory value from /proc/self/status in bytes, or None if it can't be read.
+    """
+    try:
+        with open(PROC_STATUS) as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def get_rss():
+    """
+    Returns the current resident memory of this process in bytes, or None if it can't be read.
+    """
+    return _read_proc_status("VmRSS")
+
+
+def get_peak_rss():
+    """
+    Returns the resident high water mark of this process in bytes, or None if it can't be read.
+    """
+    peak = _read_proc_status("VmHWM")
+    if peak is None and resource is not None:
+        # ru_maxrss is in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak
+
+
+def reset_peak_rss():
+    """
+    Resets the resident high water mark to the current resident memory.
+
+    :return:    True if it was reset.
+    """
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def get_top_attributes(layer, count=TOP_ATTRIBUTE_COUNT):
+    """
+    Finds the attributes holding the most sample data in a layer, including attributes inside variants.
+
+    :param layer:   The Sdf.Layer to measure.
+    :param count:   The number of attributes to return.
+    :return:        List of dicts with the attribute "path", its number of "samples", and the "bytes" of its samples
+                    and default value, largest first.
+    """
+    attributes = []
+
+    def _measure(path):
+        if not path.IsPrimPropertyPath():
+            return
+        attrSpec = layer.GetAttributeAtPath(path)
+        if not attrSpec:
+            return
+
+        times = layer.ListTimeSamplesForPath(path)
+        numBytes = sum([usd_sample_compaction.get_value_bytes(layer.QueryTimeSample(path, t)) for t in times])
+        if attrSpec.default is not None:
+            numBytes += usd_sample_compaction.get_value_bytes(attrSpec.default)
+        attributes.append({"path": path.pathString, "samples": len(times), "bytes": int(numBytes)})
+
+    layer.Traverse(Sdf.Path.absoluteRootPath, _measure)
+    attributes.sort(key=lambda x: x["bytes"], reverse=True)
+
+    return attributes[:count]
+
+
+class MemoryProfile():
+    """
+    Records the memory of each phase of a publish. Phases are started with mark, and each one ends when the next is
+    marked or the profile is stopped. A disabled profile does nothing, so callers can mark phases unconditionally.
+
+    :param enabled:     If False, the profile records nothing.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = []
+        self.attributes = []
+        self._current = None
+        self._startedTracing = False
+
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracing = True
+
+    def mark(self, name):
+        """
+        Ends the current phase and starts a new one.
+        """
+        if not self.enabled:
+            return
+
+        self.stop()
+
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        self._current = {"name": name,
+                         "start": time.time(),
+                         "startRss": get_rss(),
+                         "startPython": tracemalloc.get_traced_memory()[0],
+                         "peakReset": reset_peak_rss()}
+
+    def stop(self):
+        """
+        Ends the current phase, if there is one.
+        """
+        if not self.enabled or self._current is None:
+            return
+
+        current = self._current
+        python, peakPython = tracemalloc.get_traced_memory()
+        self.phases.append({"name": current["name"],
+                            "seconds": time.time() - current["start"],
+                            "startRss": current["startRss"],
+                            "endRss": get_rss(),
+                            "peakRss": get_peak_rss(),
+                            "peakIsCumulative": not current["peakReset"],
+                            "startPython": current["startPython"],
+                            "endPython": python,
+                            "peakPython": peakPython})
+        self._current = None
+
+    def add_top_attributes(self, layer, count=TOP_ATTRIBUTE_COUNT):
+        """
+        Records the attributes holding the most sample data in a layer. Call this while no phase is running, so the
+        measuring isn't counted in a phase.
+        """
+        if self.enabled:
+            self.attributes = get_top_attributes(layer, count)
+
+    def get_report(self):
+        """
+        Returns the profile as a dict, with the "phases", the overall "peakRss" and "peakPython", and the top
+        "attributes" by bytes.
+        """
+        return {"phases": self.phases,
+                "peakRss": max([x["peakRss"] or 0 for x in self.phases] or [0]),
+                "peakPython": max([x["peakPython"] for x in self.phases] or [0]),
+                "attributes": self.attributes}
+
+    def write(self, filepath):
+        """
+        Stops the profile, prints its report, and writes it to filepath as json.
+
+        :param filepath:    The path to write the report to.
+        :return:            The report dict.
+        """
+        if not self.enabled:
+            return None
+
+        self.stop()
+        if self._startedTracing:
+            tracemalloc.stop()
+            self._startedTracing = False
+
+        report = self.get_report()
+
+        print("Memory profile (peak resident MB, peak Python MB, seconds):")
+        for phase in self.phases:
+            print("    {0:<24} {1:>10.1f} {2:>10.1f} {3:>10.2f}{4}".format(phase["name"], (phase["peakRss"] or 0) / 1e6, phase["peakPython"] / 1e6,
+                                                                        phase["seconds"], " (includes earlier phases)" if phase["peakIsCumulative"] else ""))
+        print("Top attributes by bytes:")
+        for attribute in report["attributes"]:
+            print("    {0:>10.1f} MB  {1:>6} samples  {2}".format(attribute["bytes"] / 1e6, attribute["samples"], attribute["path"]))
+
+        directory = os.path.dirname(filepath)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(filepath, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Wrote memory profile to " + filepath)
+
+        return report
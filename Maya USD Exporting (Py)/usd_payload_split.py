@@ -0,0 +1,149 @@
+"""
+Payload split layout for published animcaches.
+
+A published animcache holds its hierarchy, references and user properties in the same layer as every animated
+point, so opening a shot reads every sample just to show the scene graph. Splitting moves the heavy attribute data
+into a payload layer, which the default prim of the published layer payloads. Lighting can open shots with payloads
+unloaded, and load them only for what it renders.
+
+Heavy attributes are the time sampled and array valued ones, wherever they are under the default prim, including
+inside frameHold variants. The payload layer mirrors their paths, so the frameHold variant selection in the published
+layer picks the payload's samples too. Attributes needed to see and place the unloaded structure, like transforms,
+extents, visibility and sourceFrame, stay in the published layer.
+
+Frame holds authored as value clips are moved too: the shared samples prim and the clip metadata go into the payload
+layer, and the clips point at the payload layer.
+"""
+
+import os
+
+from pxr import Sdf
+
+import usd_frame_hold
+import usd_layer_edits
+
+
+PAYLOAD_SUFFIX = "_payload"
+
+STRUCTURAL_ATTRS = ("extent", "extentsHint", "visibility", "purpose", "xformOpOrder", usd_frame_hold.SOURCE_FRAME_ATTR)
+STRUCTURAL_ATTR_PREFIXES = ("xformOp:", "userProperties:")
+
+
+def get_payload_filepath(filepath, publish_path):
+    """
+    Returns the path the payload layer of an animcache is written to, next to the exported layer. It's named after
+    publish_path, as the published layer references it relative to where it's published.
+
+    :param filepath:        The path of the exported layer.
+    :param publish_path:    The path the layer will be published to.
+    :return:                The payload layer path. It has to be published next to publish_path.
+    """
+    name, ext = os.path.splitext(os.path.basename(publish_path))
+    return os.path.join(os.path.dirname(filepath), name + PAYLOAD_SUFFIX + ext)
+
+
+def is_heavy_attribute(attrSpec):
+    """
+    Returns True if an attribute spec holds data that belongs in the payload.
+    """
+    name = attrSpec.name
+    if name in STRUCTURAL_ATTRS or name.startswith(STRUCTURAL_ATTR_PREFIXES):
+        return False
+
+    return attrSpec.HasInfo("timeSamples") or (attrSpec.typeName.isArray and attrSpec.default is not None)
+
+
+def _get_heavy_attribute_paths(layer, root_path):
+    """
+    Finds the heavy attributes under a prim, including attributes inside variants.
+    """
+    paths = []
+
+    def _collect(path):
+        if path.IsPrimPropertyPath() and path.HasPrefix(root_path):
+            attrSpec = layer.GetAttributeAtPath(path)
+            if attrSpec and is_heavy_attribute(attrSpec):
+                paths.append(path)
+
+    layer.Traverse(root_path, _collect)
+    return paths
+
+
+def _move_clips(layer, payload_layer, default_prim_path, payload_asset_path):
+    """
+    Moves the frame hold clip metadata from the frameHold variants to the payload layer, pointing it at the payload.
+    """
+    default_prim_spec = layer.GetPrimAtPath(default_prim_path)
+    if usd_frame_hold.FRAME_HOLD_VARIANT_SET not in default_prim_spec.variantSets:
+        return
+
+    for variant in default_prim_spec.variantSets[usd_frame_hold.FRAME_HOLD_VARIANT_SET].variants.keys():
+        variantPath = default_prim_path.AppendVariantSelection(usd_frame_hold.FRAME_HOLD_VARIANT_SET, variant)
+        variantPrimSpec = layer.GetPrimAtPath(variantPath)
+        if not variantPrimSpec.HasInfo("clips"):
+            continue
+
+        clips = variantPrimSpec.GetInfo("clips")
+        for clipSet in clips.values():
+            clipSet["assetPaths"] = Sdf.AssetPathArray([Sdf.AssetPath(payload_asset_path)])
+
+        Sdf.CreatePrimInLayer(payload_layer, variantPath).SetInfo("clips", clips)
+        variantPrimSpec.ClearInfo("clips")
+
+
+def split_payload_layer(layer, payload_filepath, save=True):
+    """
+    Moves the heavy attribute data of a layer into a payload layer, and payloads it from the default prim.
+
+    Run this last before saving, after every pass that edits samples.
+
+    :param layer:               The Sdf.Layer to split. It's edited in place, and isn't saved.
+    :param payload_filepath:    The path to write the payload layer to, from get_payload_filepath.
+    :param save:                If False, the payload layer isn't saved, eg. so a publish edit session saves it.
+    :return:                    The payload Sdf.Layer.
+    """
+    default_prim_path = Sdf.Path.absoluteRootPath.AppendChild(layer.defaultPrim)
+    if not layer.GetPrimAtPath(default_prim_path):
+        raise Exception("Could not find default prim " + str(layer.defaultPrim) + " to payload the split data from")
+
+    payload_layer = Sdf.Layer.Find(payload_filepath)
+    if payload_layer:
+        payload_layer.Clear()
+    else:
+        payload_layer = Sdf.Layer.CreateNew(payload_filepath)
+
+    payload_asset_path = "./" + os.path.basename(payload_filepath)
+    paths = _get_heavy_attribute_paths(layer, default_prim_path)
+
+    with Sdf.ChangeBlock():
+        for path in paths:
+            Sdf.CreatePrimInLayer(payload_layer, path.GetPrimPath())
+            if not Sdf.CopySpec(layer, path, payload_layer, path):
+                raise Exception("Could not copy " + str(path) + " to the payload layer")
+            layer.GetPrimAtPath(path.GetPrimPath()).RemoveProperty(layer.GetAttributeAtPath(path))
+
+        # Frame holds authored as clips keep their shared samples outside the default prim
+        samples_prim_path = Sdf.Path.absoluteRootPath.AppendChild(usd_frame_hold.FRAME_HOLD_SAMPLES_PRIM)
+        if layer.GetPrimAtPath(samples_prim_path):
+            Sdf.CreatePrimInLayer(payload_layer, samples_prim_path)
+            if not Sdf.CopySpec(layer, samples_prim_path, payload_layer, samples_prim_path):
+                raise Exception("Could not copy " + str(samples_prim_path) + " to the payload layer")
+            usd_layer_edits.remove_prim(layer, samples_prim_path)
+
+            _move_clips(layer, payload_layer, default_prim_path, payload_asset_path)
+
+        if not payload_layer.GetPrimAtPath(default_prim_path):
+            Sdf.CreatePrimInLayer(payload_layer, default_prim_path)
+        payload_layer.defaultPrim = layer.defaultPrim
+        for key in ("startTimeCode", "endTimeCode", "timeCodesPerSecond", "framesPerSecond", "upAxis", "metersPerUnit"):
+            if layer.pseudoRoot.HasInfo(key):
+                payload_layer.pseudoRoot.SetInfo(key, layer.pseudoRoot.GetInfo(key))
+
+        layer.GetPrimAtPath(default_prim_path).payloadList.Prepend(Sdf.Payload(payload_asset_path, default_prim_path))
+
+    if save:
+        usd_layer_edits.save_layer(payload_layer)
+
+    print("Moved {0} attributes to payload layer {1}".format(len(paths), payload_filepath))
+
+    return payload_layer
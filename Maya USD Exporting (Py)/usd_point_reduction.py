@@ -0,0 +1,184 @@
+"""
+Error budgeted point and normal reduction for animcaches.
+
+Points and normals are most of the bytes of a published animcache. Background assets rarely need every exported sample
+of them, so this pass fits each animated points and normals attribute with as few samples as it can find that
+linearly interpolate, as USD and renderers do, back to every exported sample within an error budget. Hero assets skip the pass
+and keep every sample at full precision.
+
+Kept samples are written back untouched. Points stay point3f[] and normals normal3f[], as UsdGeom only reads those
+types, and the usdc format doesn't compress arrays of vectors, so rounding them to half precision or a grid wouldn't
+make the layer any smaller.
+"""
+
+import numpy as np
+
+from pxr import Sdf
+
+import usd_frame_hold
+import usd_sample_compaction
+import usd_skel_reduction
+
+
+POINTS_ATTRS = ("points",)
+NORMALS_ATTRS = ("normals", "primvars:normals")
+
+
+def get_normal_error(a, b):
+    """
+    Measures the angle between two arrays of normals, per normal.
+
+    :param a:   NumPy array of normals, with components on the last axis.
+    :param b:   NumPy array of normals, the same shape as a.
+    :return:    NumPy array of angles in degrees, with the last axis removed.
+    """
+    dot = (a * b).sum(axis=-1) / np.maximum(np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1), 1e-12)
+    return np.degrees(np.arccos(np.clip(dot, -1.0, 1.0)))
+
+
+def _fits(times, values, start, end, tolerance):
+    """
+    Returns True if every sample between start and end linearly interpolates back from them within tolerance.
+    """
+    if end - start < 2:
+        return True
+
+    u = (times[start + 1:end] - times[start]) / (times[end] - times[start])
+    approx = values[start] + (values[end] - values[start]) * u[:, np.newaxis, np.newaxis]
+    diff = values[start + 1:end] - approx
+
+    return (diff * diff).sum(axis=-1).max() <= tolerance * tolerance
+
+
+def fit_point_keys(times, values, tolerance):
+    """
+    Picks samples of a points or normals attribute that linearly interpolate back to every sample within tolerance.
+
+    Unlike usd_skel_reduction.fit_keys, each key's gap is doubled while it fits, then bisected between the last gap
+    that fit and the first that didn't. That checks each sample a few times instead of once per gap it's in, which
+    matters with thousands of points. Every dropped sample is still checked against the tolerance, but a key can stop
+    short of the longest gap that would have fit.
+
+    :param times:       NumPy array of sample times, in order.
+    :param values:      NumPy array of sample values, shape (samples, points, components).
+    :param tolerance:   The largest distance allowed from any point to its exported position.
+    :return:            NumPy array of the indices of the samples to keep.
+    """
+    keys = [0]
+    anchor = 0
+    last = len(times) - 1
+
+    while anchor < last:
+        good = anchor + 1
+        bad = None
+        gap = 2
+        while good < last:
+            end = min(anchor + gap, last)
+            if not _fits(times, values, anchor, end, tolerance):
+                bad = end
+                break
+            good = end
+            gap *= 2
+
+        if bad is not None:
+            while bad - good > 1:
+                middle = (good + bad) // 2
+                if _fits(times, values, anchor, middle, tolerance):
+                    good = middle
+                else:
+                    bad = middle
+
+        keys.append(good)
+        anchor = good
+
+    return np.array(keys, dtype=np.int64)
+
+
+def _get_reduced_attribute_paths(layer):
+    """
+    Finds the sampled points and normals attributes in the layer, including attributes inside variants.
+
+    :return:    List of (attribute Sdf.Path, whether it's normals) tuples.
+    """
+    paths = []
+    for path in usd_sample_compaction.get_sampled_attribute_paths(layer):
+        if path.name in POINTS_ATTRS:
+            paths.append((path, False))
+        elif path.name in NORMALS_ATTRS:
+            paths.append((path, True))
+
+    return paths
+
+
+def _reduce_attribute(layer, path, normals, tolerance):
+    """
+    Fits the samples of one attribute and erases the samples it doesn't need.
+
+    :return:    Tuple of (samples removed, bytes removed, worst error), or None if the attribute changes topology.
+    """
+    times, values = usd_frame_hold.read_time_samples(layer, path)
+    if len(times) < 3:
+        return 0, 0, 0.0
+
+    arrays = [np.asarray(x, dtype=np.float64) for x in values]
+    if any(x.shape != arrays[0].shape for x in arrays) or not arrays[0].size:
+        return None
+    arrays = np.stack(arrays)
+
+    if normals:
+        # Unit normals that are chord sin(tolerance) apart are at most tolerance degrees apart, so fit by chord
+        fitTolerance = np.sin(np.radians(tolerance))
+        normalized = arrays / np.maximum(np.linalg.norm(arrays, axis=-1, keepdims=True), 1e-12)
+        keys = fit_point_keys(times, normalized, fitTolerance)
+    else:
+        keys = fit_point_keys(times, arrays, tolerance)
+
+    # Measure what's left against the exported samples
+    approx = usd_skel_reduction.interpolate(usd_skel_reduction.TRANSLATIONS, times, times[keys], arrays[keys])
+    if normals:
+        error = get_normal_error(arrays, approx).max()
+    else:
+        error = usd_skel_reduction.get_error(usd_skel_reduction.TRANSLATIONS, arrays, approx).max()
+
+    dropped = np.setdiff1d(np.arange(len(times)), keys)
+    for time in times[dropped].tolist():
+        layer.EraseTimeSample(path, time)
+
+    return len(dropped), sum(usd_sample_compaction.get_value_bytes(x) for x in values[dropped]), float(error)
+
+
+def reduce_point_samples(layer, tolerance=0.01, normalTolerance=1.0):
+    """
+    Drops the points and normals samples of every mesh in the layer that interpolate back within tolerance.
+
+    Run this after frame holds are authored, as frame holds in copy mode hold every attribute by sample index. Held
+    variants and clip samples are reduced along with the animation. Attributes that change topology are left alone.
+
+    :param layer:           The Sdf.Layer to reduce.
+    :param tolerance:       The largest error allowed in any point, in scene units.
+    :param normalTolerance: The largest error allowed in any normal, in degrees.
+    :return:                Dict with the number of "attributes" reduced, the number skipped for changing
+                            "topology", the "samples" and estimated "bytes" of sample data removed, and the worst
+                            "pointError" and "normalError".
+    """
+    report = {"attributes": 0, "topology": 0, "samples": 0, "bytes": 0, "pointError": 0.0, "normalError": 0.0}
+
+    with Sdf.ChangeBlock():
+        for path, normals in _get_reduced_attribute_paths(layer):
+            result = _reduce_attribute(layer, path, normals, normalTolerance if normals else tolerance)
+            if result is None:
+                report["topology"] += 1
+                continue
+
+            samples, numBytes, error = result
+            report["attributes"] += 1
+            report["samples"] += samples
+            report["bytes"] += numBytes
+            errorKey = "normalError" if normals else "pointError"
+            report[errorKey] = max(report[errorKey], error)
+
+    print("Reduced points and normals on {0} attributes: removed {1} samples ({2:.1f} MB), skipped {3} that change topology".format(
+        report["attributes"], report["samples"], report["bytes"] / 1e6, report["topology"]))
+    print("Worst point error {0:.6f}, worst normal error {1:.6f} degrees".format(report["pointError"], report["normalError"]))
+
+    return report
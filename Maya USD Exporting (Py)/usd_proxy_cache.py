@@ -0,0 +1,96 @@
+"""
+Session cache of the models mayaUsdProxyShapes load, for rig exports.
+
+export_usd_rig recreates the default prim and geo prim of every mayaUsdProxyShape's file in the exported layer, with
+their transforms. Rigs often load the same model in many proxies, and opening and composing the file for every proxy
+reads it again each time. The cache reads each file once per session, and keeps only the prim paths and transforms.
+
+Files are opened with a population mask of just the geo prim and its ancestors, with payloads unloaded except on the
+default prim and geo prim themselves, which can hold their transforms. Entries are keyed by file path and checked
+against the file's modification time, so a republished model is read again.
+"""
+
+import os
+
+from pxr import Ar, Sdf, Usd, UsdGeom
+
+
+GEO_PRIM_NAME = "geo"
+
+_cache = {}
+_stats = {"hits": 0, "misses": 0}
+
+
+def _get_modification_time(filepath):
+    """
+    Returns the modification time of a file, resolving it first if it's an asset path, or None if it can't be found.
+    """
+    resolved = Ar.GetResolver().Resolve(filepath)
+    try:
+        return os.path.getmtime(resolved.GetPathString() if resolved else filepath)
+    except (IOError, OSError):
+        return None
+
+
+def _read_model(filepath):
+    """
+    Opens a model file with only its default prim and geo prim populated, and reads their paths and transforms.
+    """
+    stage = Usd.Stage.OpenMasked(filepath, Usd.StagePopulationMask(), Usd.Stage.LoadNone)
+    if not stage:
+        raise Exception("Could not open " + filepath)
+
+    root_path = Sdf.Path.absoluteRootPath.AppendChild(stage.GetRootLayer().defaultPrim)
+    geo_path = root_path.AppendChild(GEO_PRIM_NAME)
+    stage.SetPopulationMask(Usd.StagePopulationMask([geo_path]))
+    for path in [root_path, geo_path]:
+        stage.Load(path, Usd.LoadWithoutDescendants)
+
+    root_prim = stage.GetPrimAtPath(root_path)
+    geo_prim = stage.GetPrimAtPath(geo_path)
+    if not geo_prim or not geo_prim.IsDefined():
+        raise Exception("Could not find a " + GEO_PRIM_NAME + " prim under the default prim of " + filepath)
+
+    time = Usd.TimeCode.Default()
+    return {"root_path": root_path.pathString,
+            "geo_path": geo_path.pathString,
+            "root_xform_vectors": UsdGeom.XformCommonAPI(root_prim).GetXformVectors(time),
+            "geo_xform_vectors": UsdGeom.XformCommonAPI(geo_prim).GetXformVectors(time)}
+
+
+def get_model(filepath):
+    """
+    Returns the default prim and geo prim of a model file, reading it if it isn't cached or has changed.
+
+    :param filepath:    The model file, eg. a mayaUsdProxyShape's filePath.
+    :return:            Dict with the "root_path" of the default prim and "geo_path" of its geo child, as path
+                        strings, and their "root_xform_vectors" and "geo_xform_vectors", as
+                        UsdGeom.XformCommonAPI.GetXformVectors returns them. Don't edit it, as it's shared.
+    """
+    mtime = _get_modification_time(filepath)
+    entry = _cache.get(filepath)
+    if entry is not None and entry[0] == mtime and mtime is not None:
+        _stats["hits"] += 1
+        return entry[1]
+
+    _stats["misses"] += 1
+    model = _read_model(filepath)
+    _cache[filepath] = (mtime, model)
+
+    return model
+
+
+def get_stats():
+    """
+    Returns the cache's "hits", "misses" and number of cached "models" this session.
+    """
+    return {"hits": _stats["hits"], "misses": _stats["misses"], "models": len(_cache)}
+
+
+def clear_cache():
+    """
+    Drops every cached model and resets the counters.
+    """
+    _cache.clear()
+    _stats["hits"] = 0
+    _stats["misses"] = 0
@@ -0,0 +1,129 @@
+"""
+Bulk Pref/Nref authoring for published animcaches.
+
+RenderMan reads reference positions and normals from the __Pref and __Nref primvars. Rather than querying each mesh
+in Maya, the reference primvars are taken from the exported points and normals of every mesh at a rest frame. The rest
+frame values are the Vt arrays already in the layer, so they are authored without copying any point data, and every
+mesh is authored in one change block.
+"""
+
+import numpy as np
+
+from pxr import Sdf, UsdGeom
+
+
+MESH_TYPE = "Mesh"
+PREF_ATTR = "primvars:__Pref"
+NREF_ATTR = "primvars:__Nref"
+INDICES_SUFFIX = ":indices"
+
+# Authored normals primvar first, as it overrides the normals attribute
+NORMALS_ATTRS = ("primvars:normals", "normals")
+
+
+def get_value_at_frame(layer, path, frame):
+    """
+    Returns the value of an attribute spec at a frame, without interpolating.
+
+    :param layer:   The Sdf.Layer to read from.
+    :param path:    The Sdf.Path of the attribute.
+    :param frame:   The frame to read. If it isn't sampled, the nearest sample is used.
+    :return:        The value, or None if the attribute has no samples or default.
+    """
+    times = layer.ListTimeSamplesForPath(path)
+    if not times:
+        attrSpec = layer.GetAttributeAtPath(path)
+        return attrSpec.default if attrSpec else None
+
+    nearest = times[int(np.argmin(np.abs(np.array(times) - frame)))]
+    return layer.QueryTimeSample(path, nearest)
+
+
+def get_mesh_paths(layer, root_path):
+    """
+    Finds every Mesh prim under root_path. Meshes inside variants are skipped.
+
+    :param layer:       The Sdf.Layer to search.
+    :param root_path:   The Sdf.Path of the prim to search under.
+    :return:            List of mesh Sdf.Paths.
+    """
+    paths = []
+
+    def _collect(path):
+        if path.IsPrimPath() and not path.ContainsPrimVariantSelection() and layer.GetPrimAtPath(path).typeName == MESH_TYPE:
+            paths.append(path)
+
+    layer.Traverse(root_path, _collect)
+    return paths
+
+
+def _author_primvar(prim_spec, name, typeName, value, interpolation):
+    """
+    Authors a constant primvar value on a prim spec.
+    """
+    attrSpec = prim_spec.attributes.get(name) or Sdf.AttributeSpec(prim_spec, name, typeName)
+    attrSpec.ClearInfo("timeSamples")
+    attrSpec.default = value
+    attrSpec.SetInfo("interpolation", interpolation)
+
+    return attrSpec
+
+
+def _author_mesh_ref_primvars(layer, prim_spec, rest_frame):
+    """
+    Authors __Pref and __Nref on one mesh from its points and normals at the rest frame.
+
+    :return:    Tuple of whether (__Pref, __Nref) were authored.
+    """
+    points = get_value_at_frame(layer, prim_spec.path.AppendProperty(UsdGeom.Tokens.points), rest_frame)
+    if points is None:
+        return False, False
+
+    _author_primvar(prim_spec, PREF_ATTR, Sdf.ValueTypeNames.Point3fArray, points, UsdGeom.Tokens.vertex)
+
+    for normalsAttr in NORMALS_ATTRS:
+        normalsSpec = prim_spec.attributes.get(normalsAttr)
+        normals = get_value_at_frame(layer, normalsSpec.path, rest_frame) if normalsSpec else None
+        if normals is None:
+            continue
+
+        interpolation = normalsSpec.GetInfo("interpolation") if normalsSpec.HasInfo("interpolation") else UsdGeom.Tokens.vertex
+        _author_primvar(prim_spec, NREF_ATTR, Sdf.ValueTypeNames.Normal3fArray, normals, interpolation)
+
+        # Indexed normals keep their indices, so __Nref lines up with them
+        indicesSpec = prim_spec.attributes.get(normalsAttr + INDICES_SUFFIX)
+        if indicesSpec:
+            indices = get_value_at_frame(layer, indicesSpec.path, rest_frame)
+            if indices is not None:
+                indicesSpec = prim_spec.attributes.get(NREF_ATTR + INDICES_SUFFIX) or Sdf.AttributeSpec(prim_spec, NREF_ATTR + INDICES_SUFFIX, Sdf.ValueTypeNames.IntArray)
+                indicesSpec.default = indices
+
+        return True, True
+
+    return True, False
+
+
+def author_ref_primvars(layer, rest_frame):
+    """
+    Authors __Pref and __Nref on every mesh under the default prim of a layer, from the exported points and normals at
+    a rest frame. Meshes without authored normals only get __Pref.
+
+    Run this before frame holds, which move the exported samples into variants.
+
+    :param layer:       The Sdf.Layer to author the primvars in.
+    :param rest_frame:  The frame to take the reference positions and normals from.
+    :return:            Tuple of the number of meshes given (__Pref, __Nref).
+    """
+    default_prim_path = Sdf.Path.absoluteRootPath.AppendChild(layer.defaultPrim)
+
+    numPref = 0
+    numNref = 0
+    with Sdf.ChangeBlock():
+        for path in get_mesh_paths(layer, default_prim_path):
+            pref, nref = _author_mesh_ref_primvars(layer, layer.GetPrimAtPath(path), rest_frame)
+            numPref += int(pref)
+            numNref += int(nref)
+
+    print("Authored Pref on {0} meshes and Nref on {1} meshes from frame {2}".format(numPref, numNref, rest_frame))
+
+    return numPref, numNref
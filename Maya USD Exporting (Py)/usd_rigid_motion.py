@@ -0,0 +1,228 @@
+"""
+Rigid motion conversion for published animcaches.
+
+Props, armour plates and constrained pieces under a character move rigidly, but are exported as deformed meshes with
+their points on every sample. This pass finds meshes whose points on every sample are a rotation and translation of
+their first sample, within a tolerance, and rewrites them as a static mesh with an animated matrix xform op appended to
+the end of their xform ops. The rest of the mesh's xform ops are left as exported.
+
+Each sample's transform is the best fit of the first sample onto it, by the Kabsch algorithm, and the mesh is only
+converted if every point of every sample is within tolerance of where the transform puts it. Normals are rotated by the
+same transform, and extents are recomputed for the static points.
+
+Run this before frame holds, so the frame holds hold the xform op rather than the points.
+"""
+
+import numpy as np
+
+from pxr import Gf, Sdf, UsdGeom, Vt
+
+import usd_frame_hold
+import usd_layer_edits
+import usd_point_reduction
+import usd_sample_compaction
+
+
+MESH_TYPE = "Mesh"
+POINTS_ATTR = "points"
+NORMALS_ATTRS = usd_point_reduction.NORMALS_ATTRS
+EXTENT_ATTR = "extent"
+
+# Attributes in points space that a rigid transform can't carry over
+UNCONVERTIBLE_ATTRS = ("velocities", "accelerations")
+
+RIGID_XFORM_OP = "xformOp:transform:rigid"
+
+# Samples fit at a time, so deforming meshes are rejected early and memory stays bounded on dense meshes
+FIT_BATCH_SIZE = 16
+
+
+def fit_rigid_transforms(rest, samples):
+    """
+    Finds the rotation and translation that best map rest points onto each sample, by the Kabsch algorithm.
+
+    :param rest:        NumPy array of rest points, shape (points, 3).
+    :param samples:     NumPy array of sample points, shape (samples, points, 3).
+    :return:            Tuple of NumPy arrays of (rotations, shape (samples, 3, 3), translations, shape (samples, 3),
+                        and the furthest any point is from its fit position on each sample).
+    """
+    restCentre = rest.mean(axis=0)
+    centres = samples.mean(axis=1)
+    q = rest - restCentre
+
+    covariance = np.einsum("ni,snj->sij", q, samples - centres[:, np.newaxis])
+    u, _, vt = np.linalg.svd(covariance)
+    v = vt.transpose(0, 2, 1)
+    ut = u.transpose(0, 2, 1)
+
+    # Flip the smallest axis where the best fit would be a reflection
+    flip = np.ones((len(samples), 3))
+    flip[:, 2] = np.where(np.linalg.det(np.matmul(v, ut)) < 0.0, -1.0, 1.0)
+    rotations = np.matmul(v * flip[:, np.newaxis, :], ut)
+
+    fit = np.matmul(q, rotations.transpose(0, 2, 1)) + centres[:, np.newaxis]
+    errors = np.sqrt(((samples - fit) ** 2).sum(axis=-1)).max(axis=-1)
+
+    return rotations, centres - np.matmul(restCentre, rotations.transpose(0, 2, 1)), errors
+
+
+def get_rigid_matrices(rotations, translations):
+    """
+    Builds the row vector matrices USD uses from rotations and translations.
+
+    :return:    NumPy array of matrices, shape (samples, 4, 4).
+    """
+    matrices = np.zeros((len(rotations), 4, 4))
+    matrices[:, :3, :3] = rotations.transpose(0, 2, 1)
+    matrices[:, 3, :3] = translations
+    matrices[:, 3, 3] = 1.0
+
+    return matrices
+
+
+def _get_mesh_paths(layer):
+    """
+    Finds the meshes in the layer, outside variants.
+    """
+    paths = []
+
+    def _collect(path):
+        if path.IsPrimPath() and not path.ContainsPrimVariantSelection() and layer.GetPrimAtPath(path).typeName == MESH_TYPE:
+            paths.append(path)
+
+    layer.Traverse(Sdf.Path.absoluteRootPath, _collect)
+    return paths
+
+
+def _read_arrays(layer, path):
+    """
+    Reads the samples of a points space attribute as one array.
+
+    :return:    Tuple of (times, Vt values, NumPy array of shape (samples, elements, 3)), or None if it changes size.
+    """
+    times, values = usd_frame_hold.read_time_samples(layer, path)
+    arrays = [np.asarray(x, dtype=np.float64) for x in values]
+    if not arrays or any(x.shape != arrays[0].shape for x in arrays) or not arrays[0].size:
+        return None
+
+    return times, values, np.stack(arrays)
+
+
+def _fit_mesh(layer, prim_spec, tolerance, normalTolerance):
+    """
+    Fits a rigid transform to every sample of a mesh.
+
+    :return:    Tuple of (times, matrices, worst point error, points path, list of normals paths), or None if the
+                mesh isn't rigid.
+    """
+    for name in UNCONVERTIBLE_ATTRS:
+        attrSpec = prim_spec.attributes.get(name)
+        if attrSpec and attrSpec.HasInfo("timeSamples"):
+            return None
+
+    points_path = prim_spec.path.AppendProperty(POINTS_ATTR)
+    if layer.GetNumTimeSamplesForPath(points_path) < 2:
+        return None
+
+    points = _read_arrays(layer, points_path)
+    if points is None:
+        return None
+    times, _, pointArrays = points
+
+    normals = []
+    for name in NORMALS_ATTRS:
+        normals_path = prim_spec.path.AppendProperty(name)
+        if layer.GetNumTimeSamplesForPath(normals_path) > 0:
+            normal = _read_arrays(layer, normals_path)
+            if normal is None or not np.array_equal(normal[0], times):
+                return None
+            normals.append((normals_path, normal[2]))
+
+    rotations = np.empty((len(times), 3, 3))
+    translations = np.empty((len(times), 3))
+    error = 0.0
+    for start in range(0, len(times), FIT_BATCH_SIZE):
+        batch = slice(start, start + FIT_BATCH_SIZE)
+        rotations[batch], translations[batch], errors = fit_rigid_transforms(pointArrays[0], pointArrays[batch])
+        error = max(error, errors.max())
+        if error > tolerance:
+            return None
+
+        for _, normalArrays in normals:
+            rotated = np.matmul(normalArrays[0], rotations[batch].transpose(0, 2, 1))
+            if usd_point_reduction.get_normal_error(rotated, normalArrays[batch]).max() > normalTolerance:
+                return None
+
+    return times, get_rigid_matrices(rotations, translations), error, points_path, [x[0] for x in normals]
+
+
+def _convert_mesh(layer, prim_spec, times, matrices, points_path, normals_paths):
+    """
+    Makes a mesh's points and normals static at their first sample, and animates them with a matrix xform op.
+
+    :return:    Estimated bytes of sample data removed, less the bytes of the xform op samples.
+    """
+    removed = 0
+    for path in [points_path] + normals_paths:
+        attrSpec = layer.GetAttributeAtPath(path)
+        _, values = usd_frame_hold.read_time_samples(layer, path)
+        removed += sum(usd_sample_compaction.get_value_bytes(x) for x in values[1:])
+        attrSpec.ClearInfo("timeSamples")
+        attrSpec.default = values[0]
+
+    # The extent is in points space, so it's now the extent of the static points
+    extentSpec = prim_spec.attributes.get(EXTENT_ATTR)
+    if extentSpec:
+        rest = np.asarray(layer.GetAttributeAtPath(points_path).default, dtype=np.float32)
+        if extentSpec.HasInfo("timeSamples"):
+            _, values = usd_frame_hold.read_time_samples(layer, extentSpec.path)
+            removed += sum(usd_sample_compaction.get_value_bytes(x) for x in values)
+            extentSpec.ClearInfo("timeSamples")
+        extentSpec.default = Vt.Vec3fArray.FromNumpy(np.stack((rest.min(axis=0), rest.max(axis=0))))
+
+    op_spec = usd_layer_edits.create_attribute(prim_spec, RIGID_XFORM_OP, Sdf.ValueTypeNames.Matrix4d, False)
+    for time, matrix in zip(times.tolist(), matrices):
+        layer.SetTimeSample(op_spec.path, time, Gf.Matrix4d(matrix.tolist()))
+
+    order_spec = usd_layer_edits.create_attribute(prim_spec, UsdGeom.Tokens.xformOpOrder, Sdf.ValueTypeNames.TokenArray, False, Sdf.VariabilityUniform)
+    order = list(order_spec.default) if order_spec.default is not None else []
+    if RIGID_XFORM_OP not in order:
+        order_spec.default = order + [RIGID_XFORM_OP]
+
+    return removed - matrices[0].nbytes * len(matrices)
+
+
+def convert_rigid_meshes(layer, tolerance=0.001, normalTolerance=1.0):
+    """
+    Rewrites the meshes in the layer that move rigidly as static meshes with an animated xform op.
+
+    :param layer:           The Sdf.Layer to convert.
+    :param tolerance:       The furthest any point can be from where its mesh's rigid transform puts it, in scene
+                            units.
+    :param normalTolerance: The largest angle any normal can be from where its mesh's rigid transform puts it, in
+                            degrees.
+    :return:                Dict with the number of animated "meshes" checked, how many were "converted", the
+                            estimated "bytes" saved, and the worst "error" of the converted meshes.
+    """
+    report = {"meshes": 0, "converted": 0, "bytes": 0, "error": 0.0}
+
+    with Sdf.ChangeBlock():
+        for path in _get_mesh_paths(layer):
+            prim_spec = layer.GetPrimAtPath(path)
+            if layer.GetNumTimeSamplesForPath(path.AppendProperty(POINTS_ATTR)) < 2:
+                continue
+            report["meshes"] += 1
+
+            fit = _fit_mesh(layer, prim_spec, tolerance, normalTolerance)
+            if fit is None:
+                continue
+
+            times, matrices, error, points_path, normals_paths = fit
+            report["bytes"] += _convert_mesh(layer, prim_spec, times, matrices, points_path, normals_paths)
+            report["converted"] += 1
+            report["error"] = max(report["error"], float(error))
+
+    print("Converted {0} of {1} animated meshes to rigid transforms, saving {2:.1f} MB. Worst error {3:.6f}".format(
+        report["converted"], report["meshes"], report["bytes"] / 1e6, report["error"]))
+
+    return report
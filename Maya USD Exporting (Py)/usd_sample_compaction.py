@@ -0,0 +1,123 @@
+"""
+Time sample compaction for published animcaches.
+
+With animation=1 the Maya USD exporters time sample every attribute they write, whether or not it changes over the
+frame range. Attributes that hold the same value on every sample are collapsed to a default value, and samples in the
+middle of a run of identical values are dropped. Only the first and last sample of each run are needed for held or
+linear interpolation to give the same value at every time, so compaction never changes what the cache evaluates to.
+
+The shared samples of value clip frame holds are never collapsed to a default value, as value clips only read time
+samples. They keep a single sample instead.
+"""
+
+import sys
+
+import numpy as np
+
+from pxr import Sdf
+
+import usd_frame_hold
+
+
+CLIP_SAMPLES_PATH = Sdf.Path.absoluteRootPath.AppendChild(usd_frame_hold.FRAME_HOLD_SAMPLES_PRIM)
+
+
+def get_sampled_attribute_paths(layer):
+    """
+    Finds every attribute in the layer with time samples, including attributes inside variants.
+
+    :param layer:   The Sdf.Layer to search.
+    :return:        List of attribute Sdf.Paths.
+    """
+    paths = []
+
+    def _collect(path):
+        if path.IsPrimPropertyPath() and layer.GetNumTimeSamplesForPath(path) > 0:
+            paths.append(path)
+
+    layer.Traverse(Sdf.Path.absoluteRootPath, _collect)
+    return paths
+
+
+def get_redundant_sample_mask(values):
+    """
+    Finds the samples that are in the middle of a run of identical values.
+
+    :param values:  NumPy object array of sample values, in time order.
+    :return:        NumPy bool array, True for each sample that can be dropped.
+    """
+    redundant = np.zeros(len(values), dtype=bool)
+    if len(values) < 3:
+        return redundant
+
+    # Vt values compare in C++, so this doesn't copy any array data
+    same = np.fromiter((values[i] == values[i - 1] for i in range(1, len(values))), dtype=bool, count=len(values) - 1)
+    redundant[1:-1] = same[:-1] & same[1:]
+
+    return redundant
+
+
+def get_value_bytes(value):
+    """
+    Estimates the size of a sample value in bytes.
+    """
+    try:
+        return np.asarray(value).nbytes
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def _compact_attribute(layer, path):
+    """
+    Compacts the time samples of one attribute.
+
+    :return:    Tuple of (whether the attribute was made constant, number of samples removed, bytes removed).
+    """
+    times, values = usd_frame_hold.read_time_samples(layer, path)
+
+    if len(values) == 1 or all(values[i] == values[0] for i in range(1, len(values))):
+        if path.HasPrefix(CLIP_SAMPLES_PATH):
+            for time in times[1:].tolist():
+                layer.EraseTimeSample(path, time)
+
+            return True, len(values) - 1, get_value_bytes(values[0]) * (len(values) - 1)
+
+        attrSpec = layer.GetAttributeAtPath(path)
+        attrSpec.ClearInfo("timeSamples")
+        attrSpec.default = values[0]
+
+        return True, len(values), get_value_bytes(values[0]) * (len(values) - 1)
+
+    redundant = get_redundant_sample_mask(values)
+    for time in times[redundant].tolist():
+        layer.EraseTimeSample(path, time)
+
+    return False, int(redundant.sum()), sum(get_value_bytes(x) for x in values[redundant])
+
+
+def compact_time_samples(layer):
+    """
+    Collapses constant attributes to default values and drops redundant samples from every attribute in the layer.
+
+    Run this after frame holds are authored, as held variants and clip samples are compacted too. Frame holds in
+    copy mode hold each attribute by sample index, so they need every sample to still be there.
+
+    :param layer:   The Sdf.Layer to compact.
+    :return:        Dict with the number of "attributes" checked, how many were made "constant", and the number of
+                    "samples" and estimated "bytes" of sample data removed.
+    """
+    report = {"attributes": 0, "constant": 0, "samples": 0, "bytes": 0}
+
+    with Sdf.ChangeBlock():
+        for path in get_sampled_attribute_paths(layer):
+            constant, samples, numBytes = _compact_attribute(layer, path)
+
+            report["attributes"] += 1
+            report["constant"] += int(constant)
+            report["samples"] += samples
+            report["bytes"] += numBytes
+
+    print("Compacted time samples on {0} attributes: {1} made constant, removed {2} samples ({3:.1f} MB)".format(
+        report["attributes"], report["constant"], report["samples"], report["bytes"] / 1e6))
+
+    return report
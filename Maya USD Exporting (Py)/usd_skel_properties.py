@@ -0,0 +1,108 @@
+"""
+Skel properties of exported rigs, found on the Sdf layer.
+
+export_usd_rig reroutes the skel bindings Maya exports on model geo onto the model references that replace it, and
+turns the user properties Maya exports for parentConstraints into rigid skins. Both only ever live under the GEO prim
+of a rig, so they are found by walking the prim specs under GEO, reading the names of each prim's properties once. The rest of
+the layer, and the property specs Sdf.Layer.Traverse would visit, are never touched.
+"""
+
+from pxr import Sdf
+
+import usd_layer_edits
+
+
+GEO_PRIM_NAME = "GEO"
+
+# Prim spec fields listing the names of its children and properties
+CHILDREN_FIELD = "primChildren"
+PROPERTIES_FIELD = "properties"
+
+SKEL_NAMESPACE = "skel:"
+
+CONSTRAINT_TARGET_ATTR = "constraintTarget"
+SKEL_PATH_ATTR = "userProperties:skelPath"
+CONSTRAINT_WEIGHT_ATTR = "userProperties:constraintWeight"
+
+
+def is_skel_property(name):
+    """
+    Returns True if a property is in the skel namespace, eg. skel:skeleton or primvars:skel:jointIndices.
+    """
+    return name.startswith(SKEL_NAMESPACE) or ":" + SKEL_NAMESPACE in name
+
+
+def get_geo_prim_specs(layer):
+    """
+    Returns the specs of the GEO prims under the layer's root prims.
+    """
+    prim_specs = []
+    for root_spec in layer.rootPrims:
+        geo_spec = root_spec.nameChildren.get(GEO_PRIM_NAME)
+        if geo_spec:
+            prim_specs.append(geo_spec)
+
+    return prim_specs
+
+
+def _get_value(prim_spec, name):
+    """
+    Returns the default of one of a prim's attributes, or None if it isn't authored.
+    """
+    attrSpec = prim_spec.attributes.get(name)
+    return attrSpec.default if attrSpec else None
+
+
+def get_skel_properties(layer, skelProps=True, skelConstraints=True):
+    """
+    Finds the skel properties and parentConstraint user properties under the GEO prims of a layer, in one walk of
+    their prim specs. Variants aren't searched.
+
+    :param layer:               The Sdf.Layer to search.
+    :param skelProps:           Whether to find skel attributes and relationships.
+    :param skelConstraints:     Whether to find parentConstraint user properties.
+    :return:                    Tuple of dicts keyed by prim path string, of (skel attributes, as lists of
+                                (name, typeName, default, prim path string, metadata) tuples, skel relationships, as
+                                lists of (name, targets, prim path string, metadata) tuples, and constraints, keyed by
+                                the constrained prim, the constraint's parent, as lists of one (target, skel path,
+                                weight, constrained prim path string) tuple).
+    """
+    skelAttributes = {}
+    skelRelationships = {}
+    constraints = {}
+
+    if not skelProps and not skelConstraints:
+        return skelAttributes, skelRelationships, constraints
+
+    # Walk paths and read the names of children and properties from their fields, so only the specs of properties
+    # that are found are ever wrapped. Children are pushed reversed, so prims are found in the order they're authored.
+    stack = [x.path for x in reversed(get_geo_prim_specs(layer))]
+    while stack:
+        prim_path = stack.pop()
+        prim_spec = layer.GetPrimAtPath(prim_path)
+        stack.extend([prim_path.AppendChild(x) for x in reversed(prim_spec.GetInfo(CHILDREN_FIELD))])
+
+        pathString = None
+        for name in prim_spec.GetInfo(PROPERTIES_FIELD):
+            if is_skel_property(name):
+                if not skelProps:
+                    continue
+
+                if pathString is None:
+                    pathString = prim_path.pathString
+                propSpec = layer.GetObjectAtPath(prim_path.AppendProperty(name))
+                if isinstance(propSpec, Sdf.RelationshipSpec):
+                    skelRelationships.setdefault(pathString, []).append((name, usd_layer_edits.get_targets(propSpec), pathString, usd_layer_edits.get_authored_metadata(propSpec)))
+                else:
+                    skelAttributes.setdefault(pathString, []).append((name, propSpec.typeName, propSpec.default, pathString, usd_layer_edits.get_authored_metadata(propSpec)))
+
+            elif skelConstraints and name.endswith(CONSTRAINT_TARGET_ATTR):
+                attrSpec = prim_spec.attributes.get(name)
+                if not attrSpec:
+                    continue
+
+                # The constraint node is a child of the prim it constrains
+                parentPath = prim_path.GetParentPath().pathString
+                constraints[parentPath] = [(attrSpec.default, _get_value(prim_spec, SKEL_PATH_ATTR), _get_value(prim_spec, CONSTRAINT_WEIGHT_ATTR), parentPath)]
+
+    return skelAttributes, skelRelationships, constraints
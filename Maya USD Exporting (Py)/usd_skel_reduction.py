@@ -0,0 +1,339 @@
+"""
+Keyframe reduction for exported skeleton animation.
+
+Maya USD exports every joint of a SkelAnimation at every frame. This pass reduces the exported animation in two
+steps:
+
+    - Joints that hold their rest pose over the whole animation are removed from the animation, so UsdSkel falls back
+      to the Skeleton's restTransforms for them.
+    - Each of the translations, rotations and scales curves is fit with the fewest samples that linearly interpolate
+      (slerp for rotations, as USD does) back to every exported sample within tolerance.
+
+Rotations are kept at full precision. UsdSkel only reads quatf[] rotations, and silently falls back to identity for
+quath[], so rounding them to half precision would add error without making them any smaller.
+
+The worst error of the result is measured against the exported samples, so it includes both steps.
+"""
+
+import numpy as np
+
+from pxr import Sdf, UsdSkel, Vt
+
+import usd_frame_hold
+import usd_layer_edits
+import usd_sample_compaction
+
+
+TRANSLATIONS = "translations"
+ROTATIONS = "rotations"
+SCALES = "scales"
+CHANNELS = (TRANSLATIONS, ROTATIONS, SCALES)
+
+SKEL_ANIMATION_TYPE = "SkelAnimation"
+JOINTS_ATTR = "joints"
+REST_TRANSFORMS_ATTR = "restTransforms"
+ANIMATION_SOURCE_REL = "skel:animationSource"
+
+
+def get_error(channel, a, b):
+    """
+    Measures the error between two arrays of joint values, per joint.
+
+    :param channel: The channel the values are from. Rotations are measured in degrees, translations and scales by
+                    distance.
+    :param a:       NumPy array of values, with components on the last axis.
+    :param b:       NumPy array of values, the same shape as a.
+    :return:        NumPy array of errors, with the last axis removed.
+    """
+    if channel == ROTATIONS:
+        dot = np.abs((a * b).sum(axis=-1)) / np.maximum(np.linalg.norm(a, axis=-1) * np.linalg.norm(b, axis=-1), 1e-12)
+        return np.degrees(2.0 * np.arccos(np.clip(dot, 0.0, 1.0)))
+
+    return np.linalg.norm(a - b, axis=-1)
+
+
+def slerp(q0, q1, u):
+    """
+    Spherically interpolates between arrays of quaternions, taking the shortest path like GfSlerp.
+
+    :param q0:  NumPy array of quaternions, shape (samples, joints, 4).
+    :param q1:  NumPy array of quaternions, the same shape as q0.
+    :param u:   NumPy array of interpolation weights, one per sample.
+    :return:    NumPy array of quaternions, the same shape as q0.
+    """
+    u = u[:, np.newaxis, np.newaxis]
+
+    dot = (q0 * q1).sum(axis=-1, keepdims=True)
+    q1 = np.where(dot < 0.0, -q1, q1)
+    dot = np.clip(np.abs(dot), 0.0, 1.0)
+
+    theta = np.arccos(dot)
+    sinTheta = np.sin(theta)
+    nearlyEqual = sinTheta < 1e-6
+    sinTheta = np.where(nearlyEqual, 1.0, sinTheta)
+
+    w0 = np.where(nearlyEqual, 1.0 - u, np.sin((1.0 - u) * theta) / sinTheta)
+    w1 = np.where(nearlyEqual, u, np.sin(u * theta) / sinTheta)
+
+    return w0 * q0 + w1 * q1
+
+
+def interpolate(channel, times, keyTimes, keyValues):
+    """
+    Evaluates joint values at the given times from key samples, the way USD interpolates them.
+
+    :param channel:     The channel the values are from.
+    :param times:       NumPy array of times to evaluate at.
+    :param keyTimes:    NumPy array of key times, in order.
+    :param keyValues:   NumPy array of key values, shape (keys, joints, components).
+    :return:            NumPy array of values, shape (times, joints, components).
+    """
+    if len(keyTimes) == 1:
+        return np.repeat(keyValues, len(times), axis=0)
+
+    i1 = np.clip(np.searchsorted(keyTimes, times, side="left"), 1, len(keyTimes) - 1)
+    i0 = i1 - 1
+    u = np.clip((times - keyTimes[i0]) / (keyTimes[i1] - keyTimes[i0]), 0.0, 1.0)
+
+    if channel == ROTATIONS:
+        return slerp(keyValues[i0], keyValues[i1], u)
+
+    return keyValues[i0] + (keyValues[i1] - keyValues[i0]) * u[:, np.newaxis, np.newaxis]
+
+
+def fit_keys(channel, times, values, tolerance):
+    """
+    Picks the fewest samples of a curve that interpolate back to every sample within tolerance.
+
+    Each key is extended as far as it can go before any sample in between is more than tolerance out, so the error of
+    every dropped sample is bounded by the tolerance.
+
+    :param channel:     The channel the values are from.
+    :param times:       NumPy array of sample times, in order.
+    :param values:      NumPy array of sample values, shape (samples, joints, components).
+    :param tolerance:   The largest error allowed at any sample.
+    :return:            NumPy array of the indices of the samples to keep.
+    """
+    keys = [0]
+    anchor = 0
+
+    while anchor < len(times) - 1:
+        end = anchor + 1
+        while end + 1 < len(times):
+            between = slice(anchor + 1, end + 1)
+            ends = [anchor, end + 1]
+            approx = interpolate(channel, times[between], times[ends], values[ends])
+            if get_error(channel, values[between], approx).max() > tolerance:
+                break
+            end += 1
+
+        keys.append(end)
+        anchor = end
+
+    return np.array(keys, dtype=np.int64)
+
+
+def _find_skeleton_spec(layer, anim_path):
+    """
+    Finds the Skeleton prim spec in the layer whose animation source is the given animation.
+    """
+    found = []
+
+    def _visit(path):
+        if found or not path.IsPrimPath() or path.ContainsPrimVariantSelection():
+            return
+
+        rel_spec = layer.GetPrimAtPath(path).relationships.get(ANIMATION_SOURCE_REL)
+        if rel_spec and anim_path in [x.MakeAbsolutePath(path) for x in usd_layer_edits.get_targets(rel_spec)]:
+            found.append(layer.GetPrimAtPath(path))
+
+    layer.Traverse(Sdf.Path.absoluteRootPath, _visit)
+    return found[0] if found else None
+
+
+def get_rest_values(layer, anim_path, joints):
+    """
+    Returns the rest pose of the animated joints, from the Skeleton that uses the animation.
+
+    :param layer:       The Sdf.Layer with the Skeleton and SkelAnimation in it.
+    :param anim_path:   The Sdf.Path of the SkelAnimation.
+    :param joints:      The joints the animation animates.
+    :return:            Dict of channel to NumPy array of rest values, one per animated joint. None if the Skeleton or
+                        its rest pose isn't in the layer.
+    """
+    skel_spec = _find_skeleton_spec(layer, anim_path)
+    if not skel_spec:
+        return None
+
+    skel_joints = skel_spec.attributes.get(JOINTS_ATTR)
+    rest_spec = skel_spec.attributes.get(REST_TRANSFORMS_ATTR)
+    if not skel_joints or not rest_spec or skel_joints.default is None or rest_spec.default is None:
+        return None
+
+    jointIndex = dict((joint, i) for i, joint in enumerate(skel_joints.default))
+    if any(joint not in jointIndex for joint in joints):
+        return None
+
+    indices = [jointIndex[joint] for joint in joints]
+    translations, rotations, scales = UsdSkel.DecomposeTransforms(rest_spec.default)
+
+    return {TRANSLATIONS: np.asarray(translations, dtype=np.float64)[indices],
+            ROTATIONS: np.asarray(rotations, dtype=np.float64)[indices],
+            SCALES: np.asarray(scales, dtype=np.float64)[indices]}
+
+
+class _Curve():
+    """
+    The samples of one channel of a SkelAnimation, at one of the paths frame holds put them.
+    """
+
+    def __init__(self, layer, path, channel):
+        self.path = path
+        self.channel = channel
+
+        attrSpec = layer.GetAttributeAtPath(path)
+        self.times, values = usd_frame_hold.read_time_samples(layer, path)
+        self.sampled = len(self.times) > 0
+
+        if not self.sampled:
+            # Unsampled channels can still hold the pose in a default value
+            values = [attrSpec.default] if attrSpec.default is not None else []
+
+        self.valueType = type(values[0]) if len(values) else None
+        self.dtype = np.asarray(values[0]).dtype if len(values) else None
+        self.values = np.stack([np.asarray(x, dtype=np.float64) for x in values]) if len(values) else None
+        self.bytes = sum(usd_sample_compaction.get_value_bytes(x) for x in values)
+
+
+def _get_curves(layer, anim_path):
+    """
+    Reads every channel of a SkelAnimation, wherever frame holds have put its samples.
+    """
+    curves = []
+    for path in usd_frame_hold.get_frame_hold_paths(layer, anim_path):
+        for channel in CHANNELS:
+            attr_path = path.AppendProperty(channel)
+            if layer.GetAttributeAtPath(attr_path):
+                curve = _Curve(layer, attr_path, channel)
+                if curve.values is not None:
+                    curves.append(curve)
+
+    return curves
+
+
+def _get_static_joints(curves, rest, tolerances):
+    """
+    Finds the joints that stay within tolerance of their rest pose in every curve.
+    """
+    static = np.ones(len(rest[TRANSLATIONS]), dtype=bool)
+    for channel in CHANNELS:
+        channel_curves = [x for x in curves if x.channel == channel]
+        if not channel_curves:
+            # A missing channel can't be filled in from rest, so removing joints would change the animation
+            return np.zeros(len(static), dtype=bool)
+
+        for curve in channel_curves:
+            if curve.values.shape[1] != len(static):
+                return np.zeros(len(static), dtype=bool)
+            static &= (get_error(channel, curve.values, rest[channel][np.newaxis]) <= tolerances[channel]).all(axis=0)
+
+    return static
+
+
+def _reduce_curve(layer, curve, keepJoints, rest, tolerance):
+    """
+    Fits a curve, writes the reduced samples back, and measures the error against the exported samples.
+
+    :return:    Tuple of (samples removed, bytes after reduction, worst error).
+    """
+    values = curve.values[:, keepJoints]
+    rewrite = not keepJoints.all()
+
+    if curve.sampled and not values.shape[1]:
+        # Every joint holds its rest pose, so one sample of empty arrays is enough
+        keys = np.zeros(1, dtype=np.int64)
+    elif curve.sampled and len(curve.times) > 1:
+        keys = fit_keys(curve.channel, curve.times, values, tolerance)
+    else:
+        keys = np.arange(len(values))
+
+    keyValues = values[keys]
+
+    # Measure what's left against the exported samples
+    error = 0.0
+    if values.shape[1]:
+        times = curve.times if curve.sampled else np.zeros(1)
+        approx = interpolate(curve.channel, times, times[keys], keyValues)
+        error = get_error(curve.channel, values, approx).max()
+    if rest is not None and not keepJoints.all():
+        error = max(error, get_error(curve.channel, curve.values[:, ~keepJoints], rest[curve.channel][~keepJoints][np.newaxis]).max())
+
+    dropped = np.setdiff1d(np.arange(len(values)), keys)
+    if curve.sampled:
+        for time in curve.times[dropped].tolist():
+            layer.EraseTimeSample(curve.path, time)
+
+    if rewrite:
+        written = [curve.valueType.FromNumpy(np.ascontiguousarray(x.astype(curve.dtype))) for x in keyValues]
+        if curve.sampled:
+            for time, value in zip(curve.times[keys].tolist(), written):
+                layer.SetTimeSample(curve.path, time, value)
+        else:
+            layer.GetAttributeAtPath(curve.path).default = written[0]
+
+    keyBytes = keyValues.shape[1] * keyValues.shape[2] * curve.dtype.itemsize * len(keys)
+    return (len(dropped) if curve.sampled else 0), keyBytes, error
+
+
+def reduce_skel_animation(layer, tolerance=0.001, rotationTolerance=0.01):
+    """
+    Removes static joints from, and reduces the samples of, every SkelAnimation in the layer.
+
+    Run this after frame holds are authored, as frame holds in copy mode hold every attribute by sample index. Held
+    variants and clip samples are reduced along with the animation.
+
+    :param layer:               The Sdf.Layer to reduce.
+    :param tolerance:           The largest error allowed in translations and scales, in scene units.
+    :param rotationTolerance:   The largest error allowed in rotations, in degrees.
+    :return:                    Dict with the number of "animations" reduced, static "joints" removed, "samples"
+                                removed, sample data "bytes" before and "reducedBytes" after, and the worst "error"
+                                of each channel.
+    """
+    tolerances = {TRANSLATIONS: tolerance, ROTATIONS: rotationTolerance, SCALES: tolerance}
+    report = {"animations": 0, "joints": 0, "samples": 0, "bytes": 0, "reducedBytes": 0, "error": dict((x, 0.0) for x in CHANNELS)}
+
+    anim_paths = []
+    layer.Traverse(Sdf.Path.absoluteRootPath, lambda x: anim_paths.append(x) if x.IsPrimPath() and not x.ContainsPrimVariantSelection() and layer.GetPrimAtPath(x).typeName == SKEL_ANIMATION_TYPE else None)
+
+    with Sdf.ChangeBlock():
+        for anim_path in anim_paths:
+            joints_spec = layer.GetAttributeAtPath(anim_path.AppendProperty(JOINTS_ATTR))
+            joints = list(joints_spec.default) if joints_spec and joints_spec.default is not None else []
+
+            curves = _get_curves(layer, anim_path)
+            if not joints or not curves:
+                continue
+
+            rest = get_rest_values(layer, anim_path, joints)
+            keepJoints = ~_get_static_joints(curves, rest, tolerances) if rest is not None else np.ones(len(joints), dtype=bool)
+
+            for curve in curves:
+                samples, reducedBytes, error = _reduce_curve(layer, curve, keepJoints, rest, tolerances[curve.channel])
+
+                report["samples"] += samples
+                report["bytes"] += curve.bytes
+                report["reducedBytes"] += reducedBytes
+                report["error"][curve.channel] = max(report["error"][curve.channel], float(error))
+
+            if not keepJoints.all():
+                joints_spec.default = Vt.TokenArray([x for x, keep in zip(joints, keepJoints) if keep])
+                report["joints"] += int((~keepJoints).sum())
+
+            report["animations"] += 1
+
+    print("Reduced {0} skel animations: removed {1} static joints and {2} samples, {3:.2f} MB to {4:.2f} MB".format(
+        report["animations"], report["joints"], report["samples"], report["bytes"] / 1e6, report["reducedBytes"] / 1e6))
+    print("Worst skel animation error: translations {0:.6f}, rotations {1:.6f} degrees, scales {2:.6f}".format(
+        report["error"][TRANSLATIONS], report["error"][ROTATIONS], report["error"][SCALES]))
+
+    return report
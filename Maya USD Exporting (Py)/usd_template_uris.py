@@ -0,0 +1,119 @@
+"""
+Session index of the tank:/ URIs published layers reference.
+
+Every model reference of an export gets references to its asset's surfacing layers, built from the asset type's
+entries in the template map and the project code. Shots often reference the same asset many times, so the index
+builds each asset's URIs once and keeps them for the session. The project code is resolved once per export, and the
+index is rebuilt when the project or the template map changes.
+"""
+
+import hashlib
+import json
+
+
+URI_FORMAT = 'tank:/{0}/{1}?Step={2}&Task={3}&asset_type={4}&version=latest&Asset={5}'
+
+# Template map steps that aren't surfacing layers
+IGNORED_STEPS = ("model", "default")
+
+_index = None
+
+
+def _get_template_map_hash(template_map):
+    """
+    Hashes the contents of a template map, so changes made to it in place are noticed.
+    """
+    return hashlib.sha1(json.dumps(template_map, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class TemplateUriIndex():
+    """
+    Builds and keeps the URIs of assets for one project and template map.
+
+    :param template_map:    The template map, eg. usd_utils.SG_TEMPLATE_MAP.
+    :param project_code:    The project code URIs are built for.
+    """
+    def __init__(self, template_map, project_code):
+        self.template_map = template_map
+        self.project_code = project_code
+        self.template_map_hash = _get_template_map_hash(template_map)
+        self._asset_type_prefixes = {}
+        self._surfacing_uris = {}
+        self._step_uris = {}
+
+    def _get_asset_type_prefixes(self, asset_type):
+        """
+        Returns the URIs of an asset type's surfacing templates, up to the asset name, which is the last field.
+        """
+        prefixes = self._asset_type_prefixes.get(asset_type)
+        if prefixes is None:
+            steps = self.template_map["Asset"][asset_type]
+            prefixes = []
+            for step in steps:
+                if step in IGNORED_STEPS:
+                    continue
+                for task in steps[step]:
+                    prefixes.append(URI_FORMAT.format(self.project_code, steps[step][task]["template"], step, task, asset_type, ""))
+            prefixes = self._asset_type_prefixes[asset_type] = tuple(prefixes)
+
+        return prefixes
+
+    def get_surfacing_uris(self, asset_type, asset_name):
+        """
+        Returns the URIs of an asset's surfacing layers, one for every step and task of its asset type in the
+        template map, except model and default.
+
+        :param asset_type:  The asset's type.
+        :param asset_name:  The asset's name.
+        :return:            Tuple of URIs. Raises KeyError if the asset type isn't in the template map.
+        """
+        key = (asset_type, asset_name)
+        uris = self._surfacing_uris.get(key)
+        if uris is None:
+            uris = self._surfacing_uris[key] = tuple([x + asset_name for x in self._get_asset_type_prefixes(asset_type)])
+
+        return uris
+
+    def get_step_uri(self, template_name, step, asset_type, asset_name):
+        """
+        Returns the URI of an asset's layer published by a single task step, eg. its description or rig.
+
+        :param template_name:   The name of the layer's template.
+        :param step:            The step, and task, the layer is published from.
+        :param asset_type:      The asset's type.
+        :param asset_name:      The asset's name.
+        :return:                The URI.
+        """
+        key = (template_name, step, asset_type, asset_name)
+        uri = self._step_uris.get(key)
+        if uri is None:
+            uri = self._step_uris[key] = URI_FORMAT.format(self.project_code, template_name, step, step, asset_type, asset_name)
+
+        return uri
+
+
+def get_template_uri_index(template_map, get_project_code):
+    """
+    Returns the session's URI index, building a new one if the project or the template map has changed since it was
+    built. Call this once per export.
+
+    :param template_map:        The template map, eg. usd_utils.SG_TEMPLATE_MAP.
+    :param get_project_code:    Function returning the current project code, eg. shotgun_utils.get_project_code.
+    :return:                    The TemplateUriIndex.
+    """
+    global _index
+
+    project_code = get_project_code()
+    if _index is None or _index.project_code != project_code or _index.template_map is not template_map or \
+            _index.template_map_hash != _get_template_map_hash(template_map):
+        _index = TemplateUriIndex(template_map, project_code)
+
+    return _index
+
+
+def clear_template_uri_index():
+    """
+    Drops the session's URI index, eg. after publishing new templates.
+    """
+    global _index
+    _index = None